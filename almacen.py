@@ -0,0 +1,317 @@
+import itertools
+import threading
+from calendar import monthrange
+import numpy as np
+from models import db, Precipitacion, PrecipitacionDiaria
+from cache import secuencia_observaciones, version_datos
+from metricas import tramo
+
+
+class SerieEstacion:
+    """Historia de una estación como matriz densa (años × 12) en float32.
+
+    `valores[i, m]` es la precipitación del mes `m` (0 = Enero) del año `anho_inicio + i`, con NaN
+    cuando falta el dato. `presentes` marca las celdas que tienen fila en la BD aunque su valor sea nulo.
+    """
+
+    __slots__ = ('anho_inicio', 'valores', 'presentes')
+
+    def __init__(self, anho_inicio, valores, presentes):
+        self.anho_inicio = int(anho_inicio)
+        self.valores = valores
+        self.presentes = presentes
+
+    @property
+    def anho_fin(self):
+        """Último año cubierto por la matriz (inclusive)."""
+        return self.anho_inicio + self.valores.shape[0] - 1
+
+    @property
+    def anhos(self):
+        return np.arange(self.anho_inicio, self.anho_fin + 1)
+
+    def hasta(self, hasta_anho):
+        """Devuelve la serie restringida a los años < hasta_anho (vistas, sin copiar) o None si queda vacía."""
+        n = min(self.valores.shape[0], hasta_anho - self.anho_inicio)
+        if n <= 0:
+            return None
+        return SerieEstacion(self.anho_inicio, self.valores[:n], self.presentes[:n])
+
+    def recortada(self):
+        """Elimina los años iniciales/finales sin ninguna fila presente. Devuelve None si no queda ninguno."""
+        filas = np.flatnonzero(self.presentes.any(axis=1))
+        if filas.size == 0:
+            return None
+        ini, fin = filas[0], filas[-1] + 1
+        return SerieEstacion(self.anho_inicio + ini, self.valores[ini:fin], self.presentes[ini:fin])
+
+    def mes(self, mes_num, desde=None, hasta=None):
+        """Años y valores (float64, NaN si nulo) de las filas presentes de un mes (1-12) en [desde, hasta)."""
+        ini = 0 if desde is None else max(0, desde - self.anho_inicio)
+        fin = self.valores.shape[0] if hasta is None else max(0, min(self.valores.shape[0], hasta - self.anho_inicio))
+        if ini >= fin:
+            return np.empty(0, dtype=int), np.empty(0, dtype=float)
+        presentes = self.presentes[ini:fin, mes_num - 1]
+        anhos = np.arange(self.anho_inicio + ini, self.anho_inicio + fin)[presentes]
+        valores = self.valores[ini:fin, mes_num - 1][presentes].astype(np.float64)
+        return anhos, valores
+
+
+def valores_originales(valores):
+    """Convierte valores float32 a float64 recuperando su decimal más corto (48.8 y no 48.7999992...).
+
+    Pensado para devolver al cliente los datos observados tal como se importaron.
+    """
+    return np.asarray(valores, dtype=np.float32).astype(str).astype(np.float64)
+
+
+def construir_serie_estacion(anhos, meses, valores):
+    """Arma una SerieEstacion a partir de columnas paralelas (anho, mes 1-12, valor o None)."""
+    anhos = np.asarray(anhos, dtype=int)
+    if anhos.size == 0:
+        return None
+    meses = np.asarray(meses, dtype=int) - 1
+    vals = np.array([np.nan if v is None else v for v in valores], dtype=np.float32)
+    anho_inicio = int(anhos.min())
+    n = int(anhos.max()) - anho_inicio + 1
+    matriz = np.full((n, 12), np.nan, dtype=np.float32)
+    presentes = np.zeros((n, 12), dtype=bool)
+    # Con filas duplicadas gana la última (mismo criterio que los mapas por clave del código previo)
+    matriz[anhos - anho_inicio, meses] = vals
+    presentes[anhos - anho_inicio, meses] = True
+    return SerieEstacion(anho_inicio, matriz, presentes)
+
+
+def meses_diarios(ubicacion_norm=None, desde=None, hasta=None):
+    """Agrega PrecipitacionDiaria por estación y mes con una consulta sobre su clave (ubicacion_norm, fecha).
+
+    Devuelve tuplas `(ubicacion_norm, anho, mes 1-12, total, dias_con_dato, dias_del_mes)`, donde
+    `total` es la suma de los días con dato (None si no hay ninguno). Opcionalmente se limita a una
+    estación y a los meses AAAAMM entre `desde` y `hasta` (inclusive).
+    """
+    periodo = PrecipitacionDiaria.fecha // 100
+    consulta = (
+        db.select(PrecipitacionDiaria.ubicacion_norm, periodo,
+                  db.func.sum(PrecipitacionDiaria.valor), db.func.count(PrecipitacionDiaria.valor))
+        .group_by(PrecipitacionDiaria.ubicacion_norm, periodo)
+        .order_by(PrecipitacionDiaria.ubicacion_norm, periodo)
+    )
+    if ubicacion_norm is not None:
+        consulta = consulta.where(PrecipitacionDiaria.ubicacion_norm == ubicacion_norm)
+    if desde is not None:
+        consulta = consulta.where(PrecipitacionDiaria.fecha >= desde * 100)
+    if hasta is not None:
+        consulta = consulta.where(PrecipitacionDiaria.fecha <= hasta * 100 + 99)
+    with tramo('bd'):
+        filas = db.session.execute(consulta).all()
+    resultado = []
+    for norm, anho_mes, total, dias_con_dato in filas:
+        anho, mes_num = divmod(anho_mes, 100)
+        resultado.append((norm, anho, mes_num, total, dias_con_dato, monthrange(anho, mes_num)[1]))
+    return resultado
+
+
+# (versión de datos, si hay filas diarias): sin datos diarios no se consulta la tabla por estación
+_hay_diarias = (None, False)
+
+
+def hay_diarias():
+    """Si PrecipitacionDiaria tiene alguna fila (se consulta una vez por versión de datos)."""
+    global _hay_diarias
+    version = version_datos()
+    if _hay_diarias[0] != version:
+        with tramo('bd'):
+            hay = db.session.execute(db.select(PrecipitacionDiaria.fecha).limit(1)).first() is not None
+        _hay_diarias = (version, hay)
+    return _hay_diarias[1]
+
+
+def totales_diarios_completos(ubicacion_norm=None):
+    """{ubicacion_norm: [(anho, mes, total)]} de los meses con dato en todos sus días (ver `meses_diarios`),
+    de una estación o de todas."""
+    if not hay_diarias():
+        return {}
+    completos = {}
+    for norm, anho, mes_num, total, dias_con_dato, dias_del_mes in meses_diarios(ubicacion_norm):
+        if dias_con_dato == dias_del_mes:
+            completos.setdefault(norm, []).append((anho, mes_num, total))
+    return completos
+
+
+def _combinar_diarios(filas, completos):
+    """Suma a las filas mensuales `(anho, mes, valor)` los totales `completos` derivados de datos diarios.
+
+    `construir_serie_estacion` se queda con la última fila de cada celda: las observaciones mensuales
+    con valor van al final y tienen prioridad; un total diario solo ocupa meses sin fila o con valor nulo.
+    """
+    if not completos:
+        return filas
+    return [f for f in filas if f[-1] is None] + completos + [f for f in filas if f[-1] is not None]
+
+
+def _completar_serie(serie, completos):
+    """SerieEstacion nueva con los totales diarios `completos` agregados a `serie` (ver `_combinar_diarios`)."""
+    filas = []
+    if serie is not None:
+        indices_anho, indices_mes = np.nonzero(serie.presentes)
+        valores = serie.valores[indices_anho, indices_mes].tolist()
+        filas = [(serie.anho_inicio + i, m + 1, None if v != v else v)
+                 for i, m, v in zip(indices_anho.tolist(), indices_mes.tolist(), valores)]
+    return construir_serie_estacion(*zip(*_combinar_diarios(filas, completos)))
+
+
+def series_mensuales():
+    """{ubicacion_norm: SerieEstacion} de todas las estaciones leídas solo de la tabla mensual, en una consulta.
+
+    Sin los totales derivados de datos diarios: es lo que se exporta en una instantánea.
+    """
+    with tramo('bd'):
+        filas = (
+            db.session.query(Precipitacion.ubicacion_norm, Precipitacion.anho, Precipitacion.mes_num, Precipitacion.valor)
+            .filter(Precipitacion.ubicacion_norm.isnot(None), Precipitacion.mes_num.isnot(None))
+            .order_by(Precipitacion.ubicacion_norm, Precipitacion.id)
+            .all()
+        )
+    series = {}
+    with tramo('serie'):
+        for norm, grupo in itertools.groupby(filas, key=lambda f: f[0]):
+            _, anhos, meses, valores = zip(*grupo)
+            series[norm] = construir_serie_estacion(anhos, meses, valores)
+    return series
+
+
+class AlmacenPrecipitaciones:
+    """Caché de proceso con la serie de cada estación, cargada desde la BD bajo demanda.
+
+    Las claves son nombres normalizados (`ubicacion_norm`). Quien escribe en la tabla de
+    precipitaciones (o en la de precipitaciones diarias) debe llamar a `invalidar` con las estaciones
+    afectadas. Los meses sin observación mensual cuyos días están todos cargados se completan con el
+    total de sus datos diarios, agregados al leer la serie (también si sale de una instantánea, que
+    guarda solo las filas mensuales).
+
+    Con una instantánea (`usar_instantanea`, ver instantanea.py) las series salen de su mapeo en
+    memoria sin consultar la BD, mientras la versión de datos y la secuencia de observaciones sean las
+    de la instantánea; después de cualquier escritura se vuelve a leer de la BD hasta que se exporte otra.
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación para no guardar series leídas antes de una escritura
+        self._generacion = 0
+        self._instantanea = None
+        self._instantanea_confirmada = False
+
+    def usar_instantanea(self, instantanea):
+        """Sirve las series desde `instantanea` (o deja de hacerlo con None) una vez confirmada con
+        `confirmar_instantanea`."""
+        with self._lock:
+            self._instantanea = instantanea
+            self._instantanea_confirmada = False
+            self._generacion += 1
+            self._series.clear()
+
+    def instantanea_por_confirmar(self):
+        return self._instantanea is not None and not self._instantanea_confirmada
+
+    def confirmar_instantanea(self, identificador):
+        """Adopta la instantánea si `identificador` (el de estado_datos) es el suyo, es decir, si fue
+        exportada desde esta BD o importada en ella; si no, la descarta."""
+        with self._lock:
+            if self._instantanea is not None and self._instantanea.identificador != identificador:
+                self._instantanea = None
+            self._instantanea_confirmada = True
+
+    def _instantanea_vigente(self):
+        instantanea = self._instantanea
+        if (instantanea is not None and self._instantanea_confirmada and instantanea.version_datos == version_datos()
+                and instantanea.secuencia == secuencia_observaciones()):
+            return instantanea
+        return None
+
+    def obtener(self, ubicacion_norm):
+        """Devuelve la SerieEstacion de una estación (o None si no tiene datos)."""
+        with self._lock:
+            if ubicacion_norm in self._series:
+                return self._series[ubicacion_norm]
+            generacion = self._generacion
+        instantanea = self._instantanea_vigente()
+        if instantanea is not None:
+            serie = instantanea.serie(ubicacion_norm)
+        else:
+            with tramo('bd'):
+                filas = (
+                    db.session.query(Precipitacion.anho, Precipitacion.mes_num, Precipitacion.valor)
+                    .filter(Precipitacion.ubicacion_norm == ubicacion_norm, Precipitacion.mes_num.isnot(None))
+                    .order_by(Precipitacion.id)
+                    .all()
+                )
+            with tramo('serie'):
+                serie = construir_serie_estacion(*zip(*filas)) if filas else None
+        completos = totales_diarios_completos(ubicacion_norm).get(ubicacion_norm)
+        if completos:
+            with tramo('serie'):
+                serie = _completar_serie(serie, completos)
+        with self._lock:
+            if generacion == self._generacion:
+                self._series[ubicacion_norm] = serie
+        return serie
+
+    def cargar_todas(self):
+        """Carga en una sola consulta la serie de todas las estaciones y devuelve {ubicacion_norm: SerieEstacion}."""
+        with self._lock:
+            generacion = self._generacion
+        instantanea = self._instantanea_vigente()
+        series = instantanea.series() if instantanea is not None else series_mensuales()
+        completos = totales_diarios_completos()
+        if completos:
+            with tramo('serie'):
+                for norm, grupo in completos.items():
+                    series[norm] = _completar_serie(series.get(norm), grupo)
+        with self._lock:
+            if generacion == self._generacion:
+                self._series.update(series)
+        return series
+
+    def actualizar(self, ubicacion_norm, anho, mes_num, valor):
+        """Aplica el alta o modificación de una observación a la serie en memoria de la estación, si está
+        cargada, sin releerla de la BD.
+
+        La matriz se copia (la anterior puede estar en uso por otro hilo o ser de solo lectura, como las
+        de una instantánea) y se extiende si `anho` queda fuera de su rango.
+        """
+        with self._lock:
+            # Una lectura de la BD en curso puede ser anterior a la escritura: que no se guarde
+            self._generacion += 1
+            if ubicacion_norm not in self._series:
+                return
+            serie = self._series[ubicacion_norm]
+            if serie is None:
+                self._series[ubicacion_norm] = construir_serie_estacion([anho], [mes_num], [valor])
+                return
+            inicio = min(serie.anho_inicio, anho)
+            fin = max(serie.anho_fin, anho)
+            valores = np.full((fin - inicio + 1, 12), np.nan, dtype=np.float32)
+            presentes = np.zeros((fin - inicio + 1, 12), dtype=bool)
+            desde = serie.anho_inicio - inicio
+            valores[desde:desde + serie.valores.shape[0]] = serie.valores
+            presentes[desde:desde + serie.valores.shape[0]] = serie.presentes
+            valores[anho - inicio, mes_num - 1] = np.nan if valor is None else valor
+            presentes[anho - inicio, mes_num - 1] = True
+            self._series[ubicacion_norm] = SerieEstacion(inicio, valores, presentes)
+
+    def invalidar(self, ubicaciones_norm=None):
+        """Descarta las series de las estaciones indicadas (o todas si no se indica ninguna)."""
+        global _hay_diarias
+        # Una escritura puede agregar las primeras filas diarias sin cambiar todavía la versión de datos
+        _hay_diarias = (None, False)
+        with self._lock:
+            self._generacion += 1
+            if ubicaciones_norm is None:
+                self._series.clear()
+            else:
+                for norm in ubicaciones_norm:
+                    self._series.pop(norm, None)
+
+
+almacen = AlmacenPrecipitaciones()
@@ -1,36 +1,178 @@
+import functools
+import hashlib
+import itertools
+import json
+import math
 import os
-from flask import Flask, render_template, request, jsonify
-from models import db, Precipitacion, Estacion
-from data_processor import importar_csv, predecir_precipitacion, contrastar_prediccion, poblar_estaciones, MESES_LISTA
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///precipitaciones.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-
-with app.app_context():
-    db.create_all()
-    if not Precipitacion.query.first():
-        csv_path = os.path.join(os.path.dirname(__file__), 'precipitaciones.csv')
-        if os.path.exists(csv_path):
-            importar_csv(csv_path)
-    
-    # Asegurar que las estaciones estén pobladas
-    poblar_estaciones()
+import tempfile
+import threading
+import numpy as np
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, make_response, url_for
+from models import db, Estacion, configurar_sqlite
+from data_processor import importar_csv, importar_diarias, predecir_precipitacion, predecir_lote, validar_walk_forward, contrastar_prediccion, inicializar_datos, MESES_LISTA, IMPUTACIONES
+from data_processor import agregar_observaciones, registrar_cambio_datos, requiere_inicializacion, sincronizar_version_datos
+from data_processor import buscar_predicciones_cache, canonicalizar_mes, normalizar_nombre, obtener_climatologia, MESES_MAP
+from data_processor import analizar_espectros, estadisticas_moviles, predecir_punto, VECINAS_INTERPOLACION
+from almacen import almacen, valores_originales
+from cache import CacheLRU, secuencia_observaciones, version_datos
+from modelos import MODELO_POR_DEFECTO, MODELOS, nombres_modelos
+from config import cargar_config
+from espacial import indice_estaciones
+from formatos import MIME_JSON, formato_pedido, respuesta_columnas
+from instantanea import abrir as abrir_instantanea
+from metricas import metricas, tramo
+from trabajos import BloqueoArchivo, cola_trabajos, obtener_trabajo
+
+bp = Blueprint('precipita', __name__)
+
+
+def create_app(config=None):
+    """Crea la aplicación sin tocar la BD; la inicialización se difiere al primer pedido.
+
+    `config` permite sobrescribir valores de `cargar_config()` (p. ej. en scripts o pruebas manuales).
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(cargar_config())
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    cola_trabajos.init_app(app)
+    # Antes que preparar_pedido, para que el tiempo de inicialización/sincronización cuente en el pedido
+    metricas.init_app(app)
+    with app.app_context():
+        # Solo registra el hook; la primera conexión se abre con el primer pedido
+        for motor in db.engines.values():
+            configurar_sqlite(motor, app.config['SQLITE_BUSY_TIMEOUT_MS'], app.config['SQLITE_WAL'])
+
+    app.register_blueprint(bp)
+    app.before_request(preparar_pedido)
+    abrir_instantanea_datos(app)
+    return app
+
+
+def abrir_instantanea_datos(app):
+    """Mapea en memoria la instantánea configurada (si existe) para servir las series sin leer la BD.
+
+    Se abre antes del fork de los workers (gunicorn con `preload_app`), así que todos comparten las
+    mismas páginas. El almacén solo la usa mientras su identificador coincida con el de estado_datos
+    y la versión de datos no haya cambiado; después de cualquier escritura vuelve a leer de la BD.
+    """
+    ruta = app.config.get('INSTANTANEA') or os.path.join(app.instance_path, 'precipitaciones.snap')
+    app.config['INSTANTANEA'] = ruta
+    if not os.path.exists(ruta):
+        return
+    try:
+        almacen.usar_instantanea(abrir_instantanea(ruta))
+    except (OSError, ValueError):
+        app.logger.warning("No se pudo abrir la instantánea %s; las series se leerán de la BD", ruta, exc_info=True)
+
+
+_lock_inicializacion = threading.Lock()
+
+
+def asegurar_inicializacion(app, forzar=False):
+    """Ejecuta `inicializar_datos` una sola vez entre todos los procesos que comparten la BD.
 
-@app.route('/')
+    Un bloqueo de archivo en `instance/` serializa a los workers que arrancan a la vez; el primero
+    inicializa y los demás solo comprueban la versión de esquema registrada. Con `forzar` se
+    inicializa aunque la BD ya esté al día (comando `python -m precipita bootstrap`).
+    """
+    if app.extensions.get('precipita_inicializada') and not forzar:
+        return
+    with _lock_inicializacion:
+        if app.extensions.get('precipita_inicializada') and not forzar:
+            return
+        with app.app_context():
+            with BloqueoArchivo(os.path.join(app.instance_path, 'bootstrap.lock')):
+                if forzar or requiere_inicializacion():
+                    inicializar_datos(app.config['CSV_INICIAL'], app.config['INSTANTANEA'])
+        app.extensions['precipita_inicializada'] = True
+
+
+def preparar_pedido():
+    """Inicializa la BD si hace falta y detecta escrituras de otros procesos antes de usar las cachés locales."""
+    if request.endpoint == 'static':
+        return
+    if current_app.config['PRECIPITA_BOOTSTRAP']:
+        asegurar_inicializacion(current_app._get_current_object())
+    sincronizar_version_datos()
+
+
+# Respuestas de los endpoints analíticos de solo lectura; la versión de datos en la clave las invalida
+cache_respuestas = CacheLRU(max_items=512, ttl=600)
+metricas.registrar_cache('respuestas', cache_respuestas.estadisticas)
+
+
+def cachear_respuesta(metodos=('GET', 'POST')):
+    """Cachea la respuesta de una vista pura (función de los datos y del pedido) y la sirve con ETag.
+
+    La clave combina el endpoint, un hash del cuerpo JSON (o query string) normalizado, el formato
+    negociado por `Accept` (ver formatos.py), la versión global de datos y la secuencia de observaciones,
+    así que cualquier escritura (`registrar_cambio_datos` o `agregar_observaciones`) invalida todo.
+    Si el cliente envía `If-None-Match` con el ETag vigente se responde 304 sin cuerpo.
+    Solo se cachean respuestas 200 de los métodos indicados.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            if request.method not in metodos:
+                return vista(*args, **kwargs)
+
+            pedido = request.get_json(silent=True) if request.method == 'POST' else request.args.to_dict(flat=False)
+            normalizado = json.dumps([kwargs, pedido], sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+            clave = f"{request.endpoint}|{normalizado}|{formato_pedido()}|{version_datos()}.{secuencia_observaciones()}"
+            etag = hashlib.sha1(clave.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                respuesta = make_response('', 304)
+                respuesta.set_etag(etag)
+                respuesta.vary.add('Accept')
+                return respuesta
+
+            entrada = cache_respuestas.obtener(etag)
+            if entrada is None:
+                respuesta = make_response(vista(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+                entrada = (respuesta.get_data(), respuesta.mimetype)
+                cache_respuestas.guardar(etag, entrada)
+
+            respuesta = current_app.response_class(entrada[0], mimetype=entrada[1])
+            respuesta.set_etag(etag)
+            respuesta.vary.add('Accept')
+            # Permitir que el navegador guarde la respuesta pero que siempre revalide con el ETag
+            respuesta.headers['Cache-Control'] = 'no-cache'
+            return respuesta
+        return envoltura
+    return decorador
+
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/predecir', methods=['POST'])
+@bp.route('/api/predecir', methods=['POST'])
 def api_predecir():
     data = request.json
     mes = data.get('mes')
     anho = int(data.get('anho', 2023))
     ubicacion = data.get('ubicacion')
+    imputacion = data.get('imputacion', 'media')
+    if imputacion not in IMPUTACIONES:
+        return jsonify({'error': f'Parámetro "imputacion" inválido; opciones: {", ".join(IMPUTACIONES)}'}), 400
+    modelo = data.get('modelo', MODELO_POR_DEFECTO)
+    if modelo not in nombres_modelos():
+        return _error_modelo()
     
-    promedio, probabilidad, intensidad, emoji = predecir_precipitacion(mes, anho, ubicacion)
+    # Las predicciones precalculadas (python -m precipita precompute) usan el modelo y la imputación por defecto
+    resultado = None
+    mes_canon = canonicalizar_mes(mes)
+    if imputacion == 'media' and modelo == MODELO_POR_DEFECTO and mes_canon is not None:
+        resultado = buscar_predicciones_cache(normalizar_nombre(ubicacion), [anho]).get((MESES_MAP[mes_canon], anho))
+    if resultado is None:
+        resultado = predecir_precipitacion(mes, anho, ubicacion, imputacion=imputacion, modelo=modelo)
+    promedio, probabilidad, intensidad, emoji = resultado
     
     if promedio is None:
         return jsonify({'error': 'No hay datos para esta ubicación/mes'}), 404
@@ -43,89 +185,214 @@ def api_predecir():
         'intensidad': intensidad,
         'emoji': emoji,
         'real': round(real_valor, 2) if real_valor is not None else None,
-        'error': round(error, 2) if error is not None else None
+        'error': round(error, 2) if error is not None else None,
+        'modelo': modelo
     })
 
 
-@app.route('/api/historico', methods=['POST'])
+@bp.route('/api/predecir/punto', methods=['POST'])
+def api_predecir_punto():
+    """Predicción para un punto del mapa sin estación, interpolada (IDW) desde las estaciones más cercanas."""
+    data = request.json or {}
+    coordenadas = _coordenadas_pedido(data)
+    if coordenadas is None:
+        return jsonify({'error': 'Se requieren "lat" y "lon" numéricos'}), 400
+    imputacion = data.get('imputacion', 'media')
+    if imputacion not in IMPUTACIONES:
+        return jsonify({'error': f'Parámetro "imputacion" inválido; opciones: {", ".join(IMPUTACIONES)}'}), 400
+    modelo = data.get('modelo', MODELO_POR_DEFECTO)
+    if modelo not in nombres_modelos():
+        return _error_modelo()
+    try:
+        anho = int(data.get('anho', 2023))
+        k = int(data.get('k', VECINAS_INTERPOLACION))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Los parámetros "anho" y "k" deben ser enteros'}), 400
+
+    (promedio, probabilidad, intensidad, emoji), vecinas = predecir_punto(
+        data.get('mes'), anho, *coordenadas, k=max(k, 1), imputacion=imputacion, modelo=modelo
+    )
+    if promedio is None:
+        return jsonify({'error': 'No hay estaciones cercanas con datos para este mes'}), 404
+
+    return jsonify({
+        'estimacion': round(promedio, 2),
+        'probabilidad': round(probabilidad, 2),
+        'intensidad': intensidad,
+        'emoji': emoji,
+        'modelo': modelo,
+        'vecinas': [{
+            **v, 'distancia_km': round(v['distancia_km'], 3), 'estimacion': round(v['estimacion'], 2),
+            'peso': round(v['peso'], 4)
+        } for v in vecinas]
+    })
+
+
+def _error_modelo():
+    return jsonify({'error': f'Parámetro "modelo" inválido; opciones: {", ".join(nombres_modelos())}'}), 400
+
+
+@bp.route('/api/modelos', methods=['GET'])
+def api_modelos():
+    """Modelos disponibles para el parámetro `modelo` de /api/predecir, /api/predecir/lote y /api/validacion."""
+    return jsonify([{'nombre': MODELO_POR_DEFECTO, 'descripcion': 'Promedio robusto ponderado mezclado con la FFT de la serie.'}]
+                   + [{'nombre': nombre, 'descripcion': m.descripcion} for nombre, m in MODELOS.items()])
+
+
+@bp.route('/api/predecir/lote', methods=['POST'])
+def api_predecir_lote():
+    """Predice muchas combinaciones en una llamada.
+
+    Acepta `solicitudes` (lista de {mes, anho, ubicacion}) o, para grillas completas, las listas
+    `ubicaciones`, `meses` y `anhos`, de las que se predice el producto cartesiano.
+    """
+    data = request.json or {}
+    imputacion = data.get('imputacion', 'media')
+    if imputacion not in IMPUTACIONES:
+        return jsonify({'error': f'Parámetro "imputacion" inválido; opciones: {", ".join(IMPUTACIONES)}'}), 400
+    modelo = data.get('modelo', MODELO_POR_DEFECTO)
+    if modelo not in nombres_modelos():
+        return _error_modelo()
+
+    try:
+        if 'solicitudes' in data:
+            solicitudes = [(s.get('mes'), int(s.get('anho')), s.get('ubicacion')) for s in data['solicitudes']]
+        else:
+            solicitudes = [
+                (mes, int(anho), ubicacion)
+                for ubicacion in data.get('ubicaciones', [])
+                for anho in data.get('anhos', [])
+                for mes in data.get('meses', MESES_LISTA)
+            ]
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Solicitudes inválidas: cada una requiere "mes", "anho" numérico y "ubicacion"'}), 400
+
+    resultados = predecir_lote(solicitudes, imputacion=imputacion, modelo=modelo)
+
+    return jsonify([{
+        'mes': mes,
+        'anho': anho,
+        'ubicacion': ubicacion,
+        'estimacion': round(promedio, 2) if promedio is not None else None,
+        'probabilidad': round(probabilidad, 2),
+        'intensidad': intensidad,
+        'emoji': emoji
+    } for (mes, anho, ubicacion), (promedio, probabilidad, intensidad, emoji) in zip(solicitudes, resultados)])
+
+
+@bp.route('/api/historico', methods=['POST'])
+@cachear_respuesta()
 def api_historico():
     data = request.json
     ubicacion = data.get('ubicacion')
     anho_objetivo = int(data.get('anho', 2023))
     
-    from data_processor import normalizar_nombre, predecir_precipitacion
     norm_ubicacion = normalizar_nombre(ubicacion)
     
-    datos = Precipitacion.query.all()
-    datos_filtrados = [d for d in datos if normalizar_nombre(d.ubicacion) == norm_ubicacion]
+    serie_est = almacen.obtener(norm_ubicacion)
+    serie_est = serie_est.recortada() if serie_est is not None else None
     
-    if not datos_filtrados:
+    formato = formato_pedido()
+    if serie_est is None:
+        if formato != MIME_JSON:
+            return respuesta_columnas({'valor': [], 'valor_normalizado': [], 'es_prediccion': []},
+                                      {'anhos': [], 'meses': MESES_LISTA}, formato)
         return jsonify([])
 
-    max_anho_real = max(d.anho for d in datos_filtrados)
+    max_anho_real = serie_est.anho_fin
     
     # Mostrar 5 años terminando en el año objetivo
     anhos_a_mostrar = list(range(anho_objetivo - 4, anho_objetivo + 1))
     
-    mapa_reales = {(d.anho, d.mes): d.valor for d in datos_filtrados}
+    mapa_reales = {}
+    for anho in anhos_a_mostrar:
+        if serie_est.anho_inicio <= anho <= serie_est.anho_fin:
+            fila = valores_originales(serie_est.valores[anho - serie_est.anho_inicio])
+            mapa_reales.update({(anho, mes): float(v) for mes, v in zip(MESES_LISTA, fila) if v == v})
     
-    # Calcular umbral de outliers solo con datos reales
-    import numpy as np
-    valores_reales = [d.valor for d in datos_filtrados if d.valor is not None]
-    if valores_reales:
-        media = np.mean(valores_reales)
-        desv = np.std(valores_reales)
+    # Umbral de outliers (media + 2σ de los datos reales) a partir de la climatología materializada
+    clima = obtener_climatologia(norm_ubicacion).values()
+    n = sum(c.n for c in clima)
+    if n:
+        media = sum(c.suma for c in clima) / n
+        desv = math.sqrt(max(0.0, sum(c.suma_cuadrados for c in clima) / n - media ** 2))
         umbral = media + 2 * desv
     else:
         umbral = 9999
 
-    historico = []
+    # Predicciones sintéticas para los meses futuros sin dato: primero las precalculadas,
+    # el resto en un solo lote
+    faltantes = [
+        (mes, anho, ubicacion)
+        for anho in anhos_a_mostrar if anho > max_anho_real
+        for mes in MESES_LISTA if mapa_reales.get((anho, mes)) is None
+    ]
+    precalculadas = buscar_predicciones_cache(norm_ubicacion, {anho for _, anho, _ in faltantes}) if faltantes else {}
+    predicciones = {
+        (mes, anho): precalculadas[(MESES_MAP[mes], anho)][0]
+        for mes, anho, _ in faltantes if (MESES_MAP[mes], anho) in precalculadas
+    }
+    pendientes = [f for f in faltantes if (f[0], f[1]) not in predicciones]
+    predicciones.update({
+        (mes, anho): resultado[0]
+        for (mes, anho, _), resultado in zip(pendientes, predecir_lote(pendientes))
+    })
+
+    valores, normalizados, es_prediccion = [], [], []
     for anho in anhos_a_mostrar:
         for mes in MESES_LISTA:
             valor = mapa_reales.get((anho, mes))
-            es_prediccion = False
+            prediccion = False
             
             if valor is None:
                 if anho > max_anho_real:
-                    # Generar predicción sintética
-                    valor, _, _, _ = predecir_precipitacion(mes, anho, ubicacion)
-                    es_prediccion = True
+                    # Predicción sintética
+                    valor = predicciones[(mes, anho)]
+                    prediccion = True
                 else:
                     # Dato faltante histórico
                     valor = 0.0
             
-            valor_norm = min(valor, umbral) if valor is not None else 0.0
-            
-            historico.append({
-                'label': f"{mes[:3]} {str(anho)[2:]}",
-                'valor': valor,
-                'valor_normalizado': valor_norm,
-                'anho': anho,
-                'mes': mes,
-                'es_prediccion': es_prediccion
-            })
-    
-    return jsonify(historico)
+            valores.append(valor)
+            normalizados.append(min(valor, umbral) if valor is not None else 0.0)
+            es_prediccion.append(prediccion)
+
+    if formato != MIME_JSON:
+        # Los puntos recorren anhos × meses en ese orden
+        return respuesta_columnas({
+            'valor': np.array(valores, dtype=np.float64),
+            'valor_normalizado': np.array(normalizados),
+            'es_prediccion': np.array(es_prediccion),
+        }, {'anhos': anhos_a_mostrar, 'meses': MESES_LISTA}, formato)
+
+    return jsonify([{
+        'label': f"{mes[:3]} {str(anho)[2:]}",
+        'valor': valor,
+        'valor_normalizado': valor_norm,
+        'anho': anho,
+        'mes': mes,
+        'es_prediccion': prediccion
+    } for (anho, mes), valor, valor_norm, prediccion in zip(
+        itertools.product(anhos_a_mostrar, MESES_LISTA), valores, normalizados, es_prediccion)])
 
-@app.route('/api/estacionalidad', methods=['POST'])
+@bp.route('/api/estacionalidad', methods=['POST'])
+@cachear_respuesta()
 def api_estacionalidad():
     data = request.json
     ubicacion = data.get('ubicacion')
     
-    from data_processor import normalizar_nombre
     norm_ubicacion = normalizar_nombre(ubicacion)
     
-    datos = Precipitacion.query.all()
-    datos_filtrados = [d for d in datos if normalizar_nombre(d.ubicacion) == norm_ubicacion]
+    clima = obtener_climatologia(norm_ubicacion)
     
-    if not datos_filtrados:
+    if not clima:
         return jsonify([])
 
     resumen = []
     
-    for mes in MESES_LISTA:
-        valores = [d.valor for d in datos_filtrados if d.mes == mes and d.valor is not None]
-        promedio = sum(valores) / len(valores) if valores else 0
+    for mes_num, mes in enumerate(MESES_LISTA, start=1):
+        fila = clima.get(mes_num)
+        promedio = fila.media if fila is not None and fila.n else 0
         resumen.append({
             'mes': mes,
             'promedio': round(float(promedio), 2)
@@ -133,51 +400,68 @@ def api_estacionalidad():
     
     return jsonify(resumen)
 
-@app.route('/api/estacionariedad', methods=['POST'])
+@bp.route('/api/estacionariedad', methods=['POST'])
+@cachear_respuesta()
 def api_estacionariedad():
     data = request.json
     ubicacion = data.get('ubicacion')
     
-    from data_processor import normalizar_nombre
     norm_ubicacion = normalizar_nombre(ubicacion)
     
-    datos = Precipitacion.query.all()
-    datos_filtrados = [d for d in datos if normalizar_nombre(d.ubicacion) == norm_ubicacion]
+    serie_est = almacen.obtener(norm_ubicacion)
     
-    if not datos_filtrados:
+    formato = formato_pedido()
+    if serie_est is None:
+        if formato != MIME_JSON:
+            return respuesta_columnas({'indice': [], 'original': [], 'mean': [], 'std': []},
+                                      {'anho_inicio': None, 'meses': MESES_LISTA}, formato)
         return jsonify([])
 
-    # Ordenar cronológicamente
-    datos_filtrados.sort(key=lambda x: (x.anho, MESES_LISTA.index(x.mes)))
-    
-    valores = [d.valor for d in datos_filtrados if d.valor is not None]
-    labels = [f"{d.mes[:3]} {str(d.anho)[2:]}" for d in datos_filtrados if d.valor is not None]
-    
-    if not valores:
+    # La matriz (años × 12) aplanada por filas ya está en orden cronológico
+    planos = serie_est.valores.ravel()
+    validos = np.flatnonzero(~np.isnan(planos))
+    valores = valores_originales(planos[validos])
+    media, desvio = estadisticas_moviles(valores, ventana=12)
+
+    if formato != MIME_JSON:
+        # `indice`: meses desde enero de `anho_inicio` (el cliente arma las etiquetas con `meses`)
+        return respuesta_columnas({'indice': validos, 'original': valores, 'mean': media, 'std': desvio},
+                                  {'anho_inicio': serie_est.anho_inicio, 'meses': MESES_LISTA}, formato)
+
+    if not validos.size:
         return jsonify([])
 
-    import numpy as np
-    import pandas as pd
-    
-    series = pd.Series(valores)
-    rolling_mean = series.rolling(window=12, min_periods=1).mean()
-    rolling_std = series.rolling(window=12, min_periods=1).std()
-    
-    res = []
-    for i in range(len(valores)):
-        res.append({
-            'label': labels[i],
-            'original': float(valores[i]),
-            'mean': float(rolling_mean[i]) if not np.isnan(rolling_mean[i]) else None,
-            'std': float(rolling_std[i]) if not np.isnan(rolling_std[i]) else None
-        })
-    
-    return jsonify(res)
+    return jsonify([{
+        'label': f"{MESES_LISTA[i % 12][:3]} {str(serie_est.anho_inicio + i // 12)[2:]}",
+        'original': original,
+        'mean': m if not math.isnan(m) else None,
+        'std': s if not math.isnan(s) else None
+    } for i, original, m, s in zip(validos.tolist(), valores.tolist(), media.tolist(), desvio.tolist())])
+
+
+@bp.route('/api/espectro', methods=['GET'])
+@cachear_respuesta(metodos=('GET',))
+def api_espectro():
+    """Periodos dominantes (meses y amplitud en mm) y perfil mensual FFT por estación.
 
+    Parámetros: `ubicacion` (repetible; sin ella, todas las estaciones), `anho` (usar solo datos hasta ese
+    año), `imputacion` y `cantidad` (periodos por estación, 3 por defecto).
+    """
+    ubicaciones = request.args.getlist('ubicacion') or None
+    anho = request.args.get('anho', type=int)
+    cantidad = request.args.get('cantidad', 3, type=int)
+    imputacion = request.args.get('imputacion', 'media')
+    if imputacion not in IMPUTACIONES:
+        return jsonify({'error': f'Parámetro "imputacion" inválido; opciones: {", ".join(IMPUTACIONES)}'}), 400
+    if cantidad is None or cantidad < 1:
+        return jsonify({'error': 'Parámetros inválidos: "cantidad" debe ser un entero >= 1'}), 400
+    return jsonify(analizar_espectros(ubicaciones, hasta_anho=anho, imputacion=imputacion, cantidad=cantidad))
 
-@app.route('/api/validacion', methods=['POST'])
+
+@bp.route('/api/validacion', methods=['POST'])
+@cachear_respuesta()
 def api_validacion():
-    """Devuelve pares (real, predicho) para una ubicación y mes, limitados a los últimos 5 años contados a partir del año seleccionado."""
+    """Devuelve pares (real, predicho) y métricas de un backtest walk-forward sobre los últimos `ventana` años (5 por defecto) hasta el año seleccionado."""
     data = request.json
     ubicacion = data.get('ubicacion')
     mes = data.get('mes')
@@ -190,57 +474,38 @@ def api_validacion():
     if not ubicacion or not mes:
         return jsonify({'error': 'Parámetros "ubicacion" y "mes" son obligatorios'}), 400
 
-    from data_processor import normalizar_nombre, predecir_precipitacion
-    norm_ubicacion = normalizar_nombre(ubicacion)
-
-    # Filtrar solo datos reales para la misma ubicación dentro del rango de años especificado
-    datos = Precipitacion.query.all()
-
-    # Rango de años: últimos 5 años terminando en el año seleccionado (inclusive)
-    years = list(range(anho - 4, anho + 1))
-
-    datos_filtrados = [d for d in datos if normalizar_nombre(d.ubicacion) == norm_ubicacion and d.valor is not None and d.anho in years]
+    try:
+        ventana = int(data.get('ventana', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Parámetro "ventana" inválido'}), 400
+    if ventana < 1:
+        return jsonify({'error': 'Parámetro "ventana" debe ser al menos 1'}), 400
+    modelo = data.get('modelo', MODELO_POR_DEFECTO)
+    if modelo not in nombres_modelos():
+        return _error_modelo()
 
-    # Ordenar cronológicamente por año y mes (opcional)
-    datos_filtrados.sort(key=lambda x: (x.anho, MESES_LISTA.index(x.mes) if x.mes in MESES_LISTA else 0))
+    # 'todas' valida todas las estaciones a la vez; 'meses' (opcional) restringe los meses validados
+    ubicaciones = None if ubicacion == 'todas' else [ubicacion]
+    meses = data.get('meses')
+    if meses is not None:
+        if not isinstance(meses, list) or not meses:
+            return jsonify({'error': 'Parámetro "meses" debe ser una lista de meses'}), 400
+        canonicos = [canonicalizar_mes(m) if isinstance(m, (str, int)) else None for m in meses]
+        desconocidos = [m for m, canon in zip(meses, canonicos) if canon is None]
+        if desconocidos:
+            return jsonify({'error': 'Meses no reconocidos en "meses"', 'meses_desconocidos': desconocidos}), 400
+        meses = list(dict.fromkeys(canonicos))
 
-    pares = []
-    import math
-    for d in datos_filtrados:
-        try:
-            pred, _, _, _ = predecir_precipitacion(d.mes, d.anho, d.ubicacion)
-        except Exception:
-            pred = None
-        if pred is None:
-            continue
-        pares.append({
-            'real': float(d.valor),
-            'predicho': float(pred),
-            'mes': d.mes,
-            'anho': d.anho
-        })
+    if ubicaciones is None:
+        # Validación completa: puede tardar, se ejecuta como trabajo (ver GET /api/jobs/<id>)
+        id_trabajo = cola_trabajos.enviar(current_app._get_current_object(), 'validacion', _validar_en_segundo_plano,
+                                          anho, meses=meses, ventana=ventana, modelo=modelo)
+        return _respuesta_trabajo(id_trabajo)
 
-    # Calcular métricas simples
-    if pares:
-        reals = [p['real'] for p in pares]
-        preds = [p['predicho'] for p in pares]
-        n = len(reals)
-        mse = sum((r - p) ** 2 for r, p in zip(reals, preds)) / n
-        rmse = math.sqrt(mse)
-        mean_real = sum(reals) / n
-        ss_tot = sum((r - mean_real) ** 2 for r in reals)
-        ss_res = sum((r - p) ** 2 for r, p in zip(reals, preds))
-        r2 = 1 - (ss_res / ss_tot) if ss_tot != 0 else None
-    else:
-        rmse = None
-        r2 = None
+    return jsonify(validar_walk_forward(anho, ubicaciones=ubicaciones, meses=meses, ventana=ventana, modelo=modelo))
 
-    return jsonify({
-        'pairs': pares,
-        'rmse': rmse,
-        'r2': r2
-    })
-@app.route('/api/estaciones', methods=['GET', 'POST'])
+@bp.route('/api/estaciones', methods=['GET', 'POST'])
+@cachear_respuesta(metodos=('GET',))
 def api_estaciones():
     if request.method == 'POST':
         data = request.json
@@ -258,10 +523,21 @@ def api_estaciones():
             departamento=data['departamento']
         )
         db.session.add(estacion)
-        db.session.commit()
+        registrar_cambio_datos()
         return jsonify({'status': 'success'})
     
-    estaciones = Estacion.query.all()
+    # ?bbox=oeste,sur,este,norte (el orden de toBBoxString de Leaflet): solo las estaciones visibles
+    if 'bbox' in request.args:
+        try:
+            oeste, sur, este, norte = (float(v) for v in request.args['bbox'].split(','))
+        except ValueError:
+            return jsonify({'error': 'Parámetro "bbox" inválido; formato: oeste,sur,este,norte'}), 400
+        if sur > norte or oeste > este:
+            return jsonify({'error': 'Parámetro "bbox" inválido: sur > norte u oeste > este'}), 400
+        return jsonify([_estacion_json(e) for e in indice_estaciones.en_caja(sur, oeste, norte, este)])
+
+    with tramo('bd'):
+        estaciones = Estacion.query.all()
     return jsonify([{
         'id': e.id,
         'nombre': e.nombre,
@@ -270,38 +546,150 @@ def api_estaciones():
         'departamento': e.departamento
     } for e in estaciones])
 
-@app.route('/api/estaciones/<int:id>', methods=['PUT'])
+
+def _estacion_json(estacion):
+    """Una estación del índice espacial con los campos de GET /api/estaciones."""
+    return {clave: estacion[clave] for clave in ('id', 'nombre', 'latitud', 'longitud', 'departamento')}
+
+
+def _coordenadas_pedido(datos):
+    """(lat, lon) de los campos `lat`/`lon` (o `latitud`/`longitud`) de un dict, o None si faltan o no son números."""
+    try:
+        lat = float(datos.get('lat', datos.get('latitud')))
+        lon = float(datos.get('lon', datos.get('longitud')))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+@bp.route('/api/estaciones/cercanas', methods=['GET'])
+@cachear_respuesta(metodos=('GET',))
+def api_estaciones_cercanas():
+    """Las `k` estaciones (5 por defecto) más cercanas a `lat`/`lon`, con su distancia en km."""
+    coordenadas = _coordenadas_pedido(request.args)
+    k = request.args.get('k', 5, type=int)
+    if coordenadas is None or k is None or k < 1:
+        return jsonify({'error': 'Parámetros inválidos: se requieren "lat" y "lon" numéricos y "k" >= 1'}), 400
+    return jsonify([
+        {**_estacion_json(estacion), 'distancia_km': round(distancia, 3)}
+        for estacion, distancia in indice_estaciones.vecinas(*coordenadas, k=k)
+    ])
+
+@bp.route('/api/estaciones/<int:id>', methods=['PUT'])
 def api_update_estacion(id):
     estacion = Estacion.query.get_or_404(id)
     data = request.json
     estacion.departamento = data.get('departamento', estacion.departamento)
     estacion.latitud = data.get('latitud', estacion.latitud)
     estacion.longitud = data.get('longitud', estacion.longitud)
-    db.session.commit()
+    registrar_cambio_datos()
     return jsonify({'status': 'success'})
 
-@app.route('/api/estaciones/<int:id>', methods=['DELETE'])
+@bp.route('/api/estaciones/<int:id>', methods=['DELETE'])
 def api_delete_estacion(id):
     estacion = Estacion.query.get_or_404(id)
     db.session.delete(estacion)
-    db.session.commit()
+    registrar_cambio_datos()
     return jsonify({'status': 'success'})
 
-@app.route('/api/upload', methods=['POST'])
+@bp.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    """Estadísticas de las cachés en memoria (aciertos, fallos, tamaño) y versión actual de los datos."""
+    from data_processor import cache_fft, cache_modelos
+    return jsonify({
+        'version_datos': version_datos(),
+        'secuencia_observaciones': secuencia_observaciones(),
+        'fft': cache_fft.estadisticas(),
+        'modelos': cache_modelos.estadisticas(),
+        'respuestas': cache_respuestas.estadisticas()
+    })
+
+@bp.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Métricas del proceso en formato de texto de Prometheus (histogramas por ruta y etapa, cachés, importación)."""
+    return current_app.response_class(metricas.exponer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/upload', methods=['POST'])
 def api_upload():
+    """Guarda el CSV subido y lo importa como trabajo en segundo plano; responde 202 con el id del trabajo.
+
+    Con `resolucion=diaria` el CSV tiene datos diarios (Fecha, Precipitacion y Ubicacion, o el campo
+    `ubicacion` del formulario para un archivo de una sola estación) y se importa con `importar_diarias`.
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    
-    temp_path = 'temp_upload.csv'
-    file.save(temp_path)
-    importar_csv(temp_path)
-    os.remove(temp_path)
-    
-    return jsonify({'status': 'success'})
+    resolucion = request.form.get('resolucion', 'mensual')
+    if resolucion not in ('mensual', 'diaria'):
+        return jsonify({'error': "resolucion debe ser 'mensual' o 'diaria'"}), 400
+
+    # Un archivo propio por subida: las importaciones concurrentes no se pisan
+    directorio = os.path.join(current_app.instance_path, 'subidas')
+    os.makedirs(directorio, exist_ok=True)
+    fd, ruta = tempfile.mkstemp(suffix='.csv', dir=directorio)
+    os.close(fd)
+    file.save(ruta)
+
+    id_trabajo = cola_trabajos.enviar(current_app._get_current_object(), 'importacion', _importar_subida, ruta,
+                                     diaria=resolucion == 'diaria', ubicacion=request.form.get('ubicacion'))
+    return _respuesta_trabajo(id_trabajo)
+
+@bp.route('/api/observaciones', methods=['POST'])
+def api_observaciones():
+    """Agrega observaciones mensuales sin reimportar: un objeto `{ubicacion, mes, anho, valor}` o
+    `{"observaciones": [...]}` con varios. Responde el resumen de `agregar_observaciones`."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Se esperaba un objeto JSON'}), 400
+    observaciones = data.get('observaciones', [data]) if 'observaciones' in data or 'ubicacion' in data else None
+    if not isinstance(observaciones, list) or not observaciones or not all(isinstance(o, dict) for o in observaciones):
+        return jsonify({'error': 'Se esperaba una observación {ubicacion, mes, anho, valor} o una lista "observaciones"'}), 400
+
+    reporte = agregar_observaciones(
+        [(o.get('mes'), o.get('anho'), o.get('ubicacion'), o.get('valor')) for o in observaciones]
+    )
+    codigo = 400 if reporte['insertadas'] + reporte['actualizadas'] == 0 else 200
+    return jsonify(reporte), codigo
+
+@bp.route('/api/jobs/<id_trabajo>', methods=['GET'])
+def api_trabajo(id_trabajo):
+    """Estado de un trabajo: progreso (filas leídas/escritas, fracción), ETA estimada y resultado al terminar."""
+    trabajo = obtener_trabajo(id_trabajo)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(trabajo)
+
+
+def _respuesta_trabajo(id_trabajo):
+    return jsonify({
+        'status': 'en_cola',
+        'trabajo': id_trabajo,
+        'url': url_for('precipita.api_trabajo', id_trabajo=id_trabajo)
+    }), 202
+
+
+def _importar_subida(ruta, progreso=None, diaria=False, ubicacion=None):
+    """Trabajo de importación: las importaciones se serializan entre procesos y el archivo se borra al terminar."""
+    try:
+        if progreso:
+            progreso(fase='esperando otra importación')
+        with BloqueoArchivo(os.path.join(current_app.instance_path, 'importacion.lock')):
+            if diaria:
+                return importar_diarias(ruta, ubicacion, progreso=progreso)
+            return importar_csv(ruta, progreso=progreso)
+    finally:
+        os.remove(ruta)
+
+
+def _validar_en_segundo_plano(anho, meses=None, ventana=5, modelo=MODELO_POR_DEFECTO, progreso=None):
+    # Fuera de un pedido no corre preparar_pedido: alinear antes las cachés con escrituras de otros procesos
+    sincronizar_version_datos()
+    return validar_walk_forward(anho, meses=meses, ventana=ventana, progreso=progreso, modelo=modelo)
 
 if __name__ == '__main__':
     # Bind to 0.0.0.0 so the app is accessible from outside the container
-    app.run(debug=True, host='0.0.0.0', port=5002)
+    create_app().run(debug=True, host='0.0.0.0', port=5002)
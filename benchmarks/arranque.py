@@ -0,0 +1,103 @@
+"""Mide el arranque de la aplicación: importación de módulos, create_app y primer pedido.
+
+Uso (desde la raíz del repositorio, con la BD ya inicializada):
+
+    python benchmarks/arranque.py [--repeticiones 5] [--objetivo-ms 300]
+
+Cada repetición corre en un proceso nuevo (arranque en frío). Además mide el caso de gunicorn con
+`preload_app`: un worker creado por fork del maestro, que ya tiene la aplicación importada.
+Imprime un JSON con las medianas en milisegundos.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en un proceso nuevo; imprime los tiempos parciales como JSON
+_SCRIPT_FRIO = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import flask, flask_sqlalchemy
+t1 = time.perf_counter()
+import numpy
+t2 = time.perf_counter()
+from app import create_app
+t3 = time.perf_counter()
+app = create_app()
+t4 = time.perf_counter()
+respuesta = app.test_client().get('/api/estaciones')
+t5 = time.perf_counter()
+print(json.dumps({
+    'importar_flask_sqlalchemy': (t1 - t0) * 1000,
+    'importar_numpy': (t2 - t1) * 1000,
+    'importar_app': (t3 - t2) * 1000,
+    'create_app': (t4 - t3) * 1000,
+    'primer_pedido': (t5 - t4) * 1000,
+    'hasta_primer_pedido': (t5 - t0) * 1000,
+    'pandas_importado': 'pandas' in sys.modules,
+    'status': respuesta.status_code,
+}))
+'''
+
+# Simula preload_app: el maestro importa y crea la app; el worker (fork) atiende su primer pedido
+_SCRIPT_FORK = r'''
+import json, os, time
+from app import create_app
+app = create_app()
+lectura, escritura = os.pipe()
+t0 = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    app.test_client().get('/api/estaciones')
+    os.write(escritura, str((time.perf_counter() - t0) * 1000).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+print(json.dumps({'worker_fork_hasta_primer_pedido': float(os.read(lectura, 64))}))
+'''
+
+
+def _ejecutar(script):
+    salida = subprocess.run([sys.executable, '-c', script], cwd=RAIZ, capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def medir(repeticiones=5):
+    """Corre `repeticiones` arranques en frío (y por fork, si el sistema lo permite) y devuelve las medianas."""
+    frios = [_ejecutar(_SCRIPT_FRIO) for _ in range(repeticiones)]
+    resultado = {
+        clave: round(statistics.median(m[clave] for m in frios), 1)
+        for clave, valor in frios[0].items() if isinstance(valor, float)
+    }
+    resultado['pandas_importado'] = any(m['pandas_importado'] for m in frios)
+    resultado['status'] = frios[0]['status']
+    if hasattr(os, 'fork'):
+        forks = [_ejecutar(_SCRIPT_FORK) for _ in range(repeticiones)]
+        resultado['worker_fork_hasta_primer_pedido'] = round(
+            statistics.median(m['worker_fork_hasta_primer_pedido'] for m in forks), 1
+        )
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/arranque.py')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--objetivo-ms', type=float, default=300.0, help='Objetivo hasta el primer pedido')
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    resultado = medir(args.repeticiones)
+    resultado['objetivo_ms'] = args.objetivo_ms
+    resultado['cumple_frio'] = resultado['hasta_primer_pedido'] <= args.objetivo_ms
+    if 'worker_fork_hasta_primer_pedido' in resultado:
+        resultado['cumple_worker'] = resultado['worker_fork_hasta_primer_pedido'] <= args.objetivo_ms
+    resultado['segundos_benchmark'] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compara la componente FFT por lotes (espectro.componentes_fft) con el cálculo anterior, estación por estación.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/espectro.py [--estaciones 500] [--anhos 40] [--largos 1] [--semilla 0]
+
+Genera series mensuales imputadas sintéticas de `--estaciones` estaciones repartidas en `--largos`
+largos distintos (1: todas con la historia alineada, como una actualización nacional) y calcula su
+componente FFT con la versión anterior (`np.fft.fft` + `argsort` por serie) y con el núcleo por
+lotes. Verifica que coincidan (medias, conteos y coeficiente de variación dentro de la tolerancia) e
+imprime un JSON con los tiempos.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from espectro import componentes_fft  # noqa: E402
+
+TOLERANCIA = 1e-9
+
+
+def _componente_fft_anterior(serie):
+    """Componente FFT de una serie tal como se calculaba antes del núcleo por lotes (sin logs)."""
+    lower_s, upper_s = np.nanpercentile(serie, [1, 99])
+    serie_clipped = np.clip(serie, lower_s, upper_s)
+    fft_vals = np.fft.fft(serie_clipped)
+    fft_filtrada = np.zeros_like(fft_vals)
+    fft_filtrada[0] = fft_vals[0]
+    n_comp = max(3, int(len(serie_clipped) * 0.1))
+    indices_picos = np.argsort(np.abs(fft_vals))[-n_comp:]
+    fft_filtrada[indices_picos] = fft_vals[indices_picos]
+    serie_reconstruida = np.fft.ifft(fft_filtrada).real
+    conteos_fft = np.array([serie_reconstruida[m::12].size for m in range(12)])
+    medias_fft = np.array([np.nanmean(serie_reconstruida[m::12]) for m in range(12)])
+    mean_series = np.mean(serie_clipped)
+    std_series = np.std(serie_clipped)
+    cv_series = (std_series / mean_series) if mean_series > 0 else np.inf
+    return medias_fft, conteos_fft, cv_series
+
+
+def _series_sinteticas(n_estaciones, n_anhos, n_largos, rng):
+    estacional = 60 + 90 * np.sin(np.linspace(0, 2 * np.pi, 12, endpoint=False))
+    series = []
+    for i in range(n_estaciones):
+        anhos = n_anhos - (i % n_largos)
+        valores = rng.gamma(2.0, np.maximum(estacional, 5) / 2.0, size=(anhos, 12))
+        valores[rng.random(valores.shape) < 0.02] *= 6  # eventos extremos
+        series.append(valores.ravel())
+    return series
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/espectro.py')
+    parser.add_argument('--estaciones', type=int, default=500)
+    parser.add_argument('--anhos', type=int, default=40)
+    parser.add_argument('--largos', type=int, default=1, help='Cantidad de largos de serie distintos')
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    series = _series_sinteticas(args.estaciones, args.anhos, max(1, args.largos), np.random.default_rng(args.semilla))
+
+    inicio = time.perf_counter()
+    anteriores = [_componente_fft_anterior(serie) for serie in series]
+    t_anterior = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    por_largo = {}
+    for i, serie in enumerate(series):
+        por_largo.setdefault(serie.size, []).append(i)
+    por_lotes = [None] * len(series)
+    for indices in por_largo.values():
+        medias, conteos, cv, _ = componentes_fft(np.stack([series[i] for i in indices]))
+        for fila, i in enumerate(indices):
+            por_lotes[i] = (medias[fila], conteos, cv[fila])
+    t_lotes = time.perf_counter() - inicio
+
+    dif_medias = dif_cv = 0.0
+    conteos_distintos = 0
+    for (medias_a, conteos_a, cv_a), (medias_b, conteos_b, cv_b) in zip(anteriores, por_lotes):
+        dif_medias = max(dif_medias, float(np.max(np.abs(medias_a - medias_b) / np.maximum(1.0, np.abs(medias_a)))))
+        dif_cv = max(dif_cv, abs(cv_a - cv_b) / max(1.0, abs(cv_a)))
+        conteos_distintos += int(not np.array_equal(conteos_a, conteos_b))
+
+    print(json.dumps({
+        'estaciones': len(series),
+        'largos': len(por_largo),
+        'segundos_anterior': round(t_anterior, 4),
+        'segundos_lotes': round(t_lotes, 4),
+        'mejora': round(t_anterior / t_lotes, 1),
+        'diferencia_relativa_max_medias': dif_medias,
+        'diferencia_relativa_max_cv': dif_cv,
+        'conteos_distintos': conteos_distintos,
+        'coinciden': conteos_distintos == 0 and max(dif_medias, dif_cv) <= TOLERANCIA,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
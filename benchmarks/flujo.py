@@ -0,0 +1,111 @@
+"""Compara el resumen en flujo (`resumir_en_flujo`) con el cálculo exacto que carga todas las filas.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/flujo.py [--estaciones 50] [--filas 200000] [--factor 4] [--semilla 0]
+
+Genera CSV sintéticos (generador.py) de `--filas` y `--filas × --factor` filas y, para cada uno,
+calcula los estadísticos por estación y mes de dos maneras:
+- `exacto`: todas las filas en listas por estación y mes, luego media, desvío y percentiles con NumPy.
+- `flujo`: `resumir_en_flujo` sobre el CSV (Welford y P², estado acotado por estación y mes).
+Informa tiempo y pico de memoria (tracemalloc, en otra ejecución) de cada una, y el error del flujo:
+diferencia relativa máxima de medias y desvíos y, para los percentiles, el error de rango máximo
+(|fracción de valores ≤ estimación − probabilidad|) y el error máximo en mm relativo al rango p5–p95
+de la celda. Con memoria acotada el pico del flujo no crece con las filas.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from generador import generar_csv  # noqa: E402
+
+
+def _exacto(ruta):
+    from data_processor import MESES_MAP, leer_csv
+
+    celdas = {}
+    with open(ruta, 'rb') as f:
+        for mes, _, valor, _, norm, _ in leer_csv(f):
+            if valor is not None:
+                celdas.setdefault((norm, MESES_MAP[mes]), []).append(valor)
+    resultado = {}
+    for clave, valores in celdas.items():
+        arr = np.array(valores)
+        resultado[clave] = (np.sort(arr), arr.mean(), arr.std(ddof=1), *np.percentile(arr, [5, 25, 75, 95]))
+    return resultado
+
+
+def _medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcion()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return resultado, round(segundos, 2), round(pico / 2 ** 20, 2)
+
+
+def comparar(ruta):
+    """Resultados, tiempos, picos de memoria y errores de ambas variantes sobre el CSV `ruta`."""
+    from data_processor import PERCENTILES_FLUJO, resumir_en_flujo
+
+    exacto, t_exacto, mem_exacto = _medir(lambda: _exacto(ruta))
+    flujo, t_flujo, mem_flujo = _medir(lambda: resumir_en_flujo(ruta))
+
+    dif_media = dif_desvio = dif_percentiles = error_rango = 0.0
+    for (norm, mes_num), (ordenados, media, desvio, *percentiles) in exacto.items():
+        celda = flujo['estaciones'][norm]['meses'][mes_num]
+        dif_media = max(dif_media, abs(celda['media'] - media) / max(1.0, abs(media)))
+        dif_desvio = max(dif_desvio, abs(celda['desvio'] - desvio) / max(1.0, desvio))
+        rango = max(percentiles[-1] - percentiles[0], 1e-9)
+        estimados = (celda['p5'], celda['p25'], celda['p75'], celda['p95'])
+        dif_percentiles = max(dif_percentiles, max(abs(e - p) for e, p in zip(estimados, percentiles)) / rango)
+        rangos = np.searchsorted(ordenados, estimados, side='right') / ordenados.size
+        error_rango = max(error_rango, float(np.max(np.abs(rangos - PERCENTILES_FLUJO))))
+    return {
+        'filas': flujo['filas'],
+        'celdas': len(exacto),
+        'segundos_exacto': t_exacto,
+        'segundos_flujo': t_flujo,
+        'pico_mb_exacto': mem_exacto,
+        'pico_mb_flujo': mem_flujo,
+        'diferencia_relativa_max_media': dif_media,
+        'diferencia_relativa_max_desvio': dif_desvio,
+        'error_rango_max_percentiles': round(error_rango, 4),
+        'error_max_percentiles_mm_sobre_p5_p95': round(dif_percentiles, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/flujo.py')
+    parser.add_argument('--estaciones', type=int, default=50)
+    parser.add_argument('--filas', type=int, default=200000)
+    parser.add_argument('--factor', type=int, default=4, help='Tamaño del segundo CSV respecto del primero')
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    directorio = tempfile.mkdtemp(prefix='precipita_flujo_')
+    try:
+        resultados = []
+        for filas in (args.filas, args.filas * args.factor):
+            ruta = os.path.join(directorio, f'datos_{filas}.csv')
+            generar_csv(ruta, args.estaciones, filas, args.semilla)
+            resultados.append(comparar(ruta))
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Generador de CSV sintéticos con el formato de `precipitaciones_.csv` (Mes;Anho;Precipitacion;Ubicacion).
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/generador.py salida.csv [--estaciones 20] [--filas 8000] [--semilla 0]
+
+Cada estación recibe un nombre derivado de COORDENADAS_MAP ('Pilar', 'Pilar 2', ...) para que
+`buscar_coordenadas` le asigne coordenadas y departamento, un ciclo estacional propio y valores
+gamma con eventos extremos, nulos y algún negativo. Los años se eligen para llegar a `--filas`
+(estaciones × años × 12), terminando en 2024, así que sirve desde el tamaño del CSV de ejemplo
+hasta millones de filas. El archivo se escribe en streaming.
+"""
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from normalizacion import COORDENADAS_MAP, MESES_LISTA  # noqa: E402
+
+ANHO_FINAL = 2024
+
+
+def nombres_estaciones(n):
+    """`n` nombres de estación: primero las claves de COORDENADAS_MAP y luego las mismas con sufijo numérico."""
+    bases = list(COORDENADAS_MAP)
+    return [bases[i % len(bases)] + (f' {i // len(bases) + 1}' if i >= len(bases) else '') for i in range(n)]
+
+
+def generar_csv(ruta, estaciones=20, filas=8000, semilla=0, fraccion_nulos=0.02):
+    """Escribe el CSV sintético en `ruta` y devuelve `(filas_escritas, anho_inicio, anho_fin)`."""
+    rng = np.random.default_rng(semilla)
+    anhos = max(1, math.ceil(filas / (estaciones * 12)))
+    anho_inicio = ANHO_FINAL - anhos + 1
+    escritas = 0
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        f.write('Mes;Anho;Precipitacion;Ubicacion\n')
+        for nombre in nombres_estaciones(estaciones):
+            # Ciclo estacional de la estación: media mensual entre ~10 y ~250 mm
+            fase = rng.uniform(0, 2 * np.pi)
+            nivel = rng.uniform(40, 140)
+            estacional = np.maximum(nivel + 0.8 * nivel * np.cos(2 * np.pi * np.arange(12) / 12 + fase), 10.0)
+            valores = rng.gamma(2.0, estacional / 2.0, size=(anhos, 12))
+            valores[rng.random(valores.shape) < 0.01] *= 5  # eventos extremos
+            valores[rng.random(valores.shape) < 0.002] = -1.0
+            nulos = rng.random(valores.shape) < fraccion_nulos
+            lineas = []
+            for i in range(anhos):
+                anho = anho_inicio + i
+                for m, mes in enumerate(MESES_LISTA):
+                    valor = '' if nulos[i, m] else f'{valores[i, m]:.1f}'
+                    lineas.append(f'{mes};{anho};{valor};{nombre}\n')
+            f.writelines(lineas)
+            escritas += len(lineas)
+    return escritas, anho_inicio, ANHO_FINAL
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/generador.py')
+    parser.add_argument('salida')
+    parser.add_argument('--estaciones', type=int, default=20)
+    parser.add_argument('--filas', type=int, default=8000, help='Filas aproximadas (se redondea a años completos)')
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+    filas, inicio, fin = generar_csv(args.salida, args.estaciones, args.filas, args.semilla)
+    print(f'{filas} filas, {args.estaciones} estaciones, años {inicio}-{fin}: {args.salida}')
+
+
+if __name__ == '__main__':
+    main()
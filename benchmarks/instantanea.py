@@ -0,0 +1,174 @@
+"""Compara la carga de los datos desde la BD con la carga desde la instantánea binaria (instantanea.py).
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/instantanea.py [--estaciones 200] [--filas 500000] [--repeticiones 3]
+
+Genera un CSV sintético (generador.py) y con él una BD y una instantánea en un directorio temporal.
+Después mide, cada repetición en un proceso nuevo:
+- `inicializar_bd`: crear una BD vacía importando el CSV o importando la instantánea.
+- `cargar_series`: lo que hace un worker recién arrancado para tener todas las series en memoria
+  (`create_app`, sincronizar la versión y `almacen.cargar_todas()`), leyendo la BD o la instantánea.
+  Se informa el tiempo y la memoria residente que agrega la carga (RSS, en MB).
+Antes de exportar se cargan además datos diarios (`importar_diarias`) de una estación sin filas
+mensuales, y se verifica que cada BD creada desde la instantánea tenga exactamente las mismas filas
+mensuales y diarias que la de origen (los totales derivados de datos diarios no pasan a la tabla
+mensual). Imprime un JSON con las medianas.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from generador import generar_csv  # noqa: E402
+
+# Se ejecuta en un proceso nuevo: argv = directorio, origen ('csv' | 'instantanea'), [exportar]
+_SCRIPT_INICIALIZAR = r'''
+import hashlib, json, os, sys, time
+directorio, origen = sys.argv[1], sys.argv[2]
+from app import create_app
+from data_processor import exportar_instantanea, importar_diarias, inicializar_datos
+from models import db
+
+
+def huella():
+    """Hash de las filas de las tablas mensual y diaria, sin depender del orden de inserción."""
+    filas = db.session.execute(db.text(
+        'SELECT ubicacion_norm, anho, mes_num, mes, ubicacion, valor FROM precipitaciones '
+        'ORDER BY ubicacion_norm, anho, mes_num')).all()
+    filas += db.session.execute(db.text(
+        'SELECT ubicacion_norm, fecha, valor FROM precipitaciones_diarias ORDER BY ubicacion_norm, fecha')).all()
+    return hashlib.sha256(repr([tuple(f) for f in filas]).encode()).hexdigest()
+
+exportar = len(sys.argv) > 3
+bd = os.path.join(directorio, 'datos.db' if exportar else f'{origen}_{os.getpid()}.db')
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + bd,
+    'SQLALCHEMY_BINDS': {'trabajos': 'sqlite:///' + os.path.join(directorio, 'trabajos.db')},
+    'PRECIPITA_BOOTSTRAP': False,
+    'INSTANTANEA': os.path.join(directorio, 'ausente.snap'),
+})
+app.instance_path = directorio
+with app.app_context():
+    inicio = time.perf_counter()
+    if origen == 'csv':
+        inicializar_datos(os.path.join(directorio, 'datos.csv'))
+    else:
+        inicializar_datos(None, os.path.join(directorio, 'datos.snap'))
+    segundos = time.perf_counter() - inicio
+    if exportar:
+        importar_diarias(os.path.join(directorio, 'diarias.csv'))
+        exportar_instantanea(os.path.join(directorio, 'datos.snap'))
+    resultado = {'ms': segundos * 1000, 'huella': huella()}
+print(json.dumps(resultado))
+'''
+
+# Se ejecuta en un proceso nuevo: argv = directorio, origen ('bd' | 'instantanea')
+_SCRIPT_CARGAR = r'''
+import json, os, sys, time
+directorio, origen = sys.argv[1], sys.argv[2]
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+from app import create_app
+from almacen import almacen
+from data_processor import sincronizar_version_datos
+antes = rss_mb()
+inicio = time.perf_counter()
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directorio, 'datos.db'),
+    'SQLALCHEMY_BINDS': {'trabajos': 'sqlite:///' + os.path.join(directorio, 'trabajos.db')},
+    'PRECIPITA_BOOTSTRAP': False,
+    'INSTANTANEA': os.path.join(directorio, 'datos.snap' if origen == 'instantanea' else 'ausente.snap'),
+})
+app.instance_path = directorio
+with app.app_context():
+    sincronizar_version_datos()
+    series = almacen.cargar_todas()
+segundos = time.perf_counter() - inicio
+print(json.dumps({'ms': segundos * 1000, 'rss_mb': rss_mb() - antes, 'estaciones': len(series),
+                  'desde_instantanea': almacen._instantanea_vigente() is not None}))
+'''
+
+
+def _generar_diarias(ruta, anhos=5, semilla=0):
+    """CSV diario de `anhos` años de una estación sin datos mensuales, con algunos días nulos."""
+    rng = random.Random(semilla)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('Fecha;Precipitacion;Ubicacion\n')
+        dia = date(2000, 1, 1)
+        while dia.year < 2000 + anhos:
+            valor = '-' if rng.random() < 0.01 else round(rng.expovariate(1 / 8), 1) if rng.random() < 0.3 else 0
+            f.write(f'{dia.isoformat()};{valor};Solo Diaria\n')
+            dia += timedelta(days=1)
+
+
+def _ejecutar(script, *argumentos):
+    salida = subprocess.run([sys.executable, '-c', script, *argumentos], cwd=RAIZ,
+                            capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def _mediana(mediciones, clave):
+    return round(statistics.median(m[clave] for m in mediciones), 1)
+
+
+def medir(estaciones=200, filas=500000, repeticiones=3):
+    """Prepara los datos en un directorio temporal y devuelve las medianas de cada variante."""
+    directorio = tempfile.mkdtemp(prefix='precipita_instantanea_')
+    try:
+        generar_csv(os.path.join(directorio, 'datos.csv'), estaciones, filas)
+        _generar_diarias(os.path.join(directorio, 'diarias.csv'))
+        exportada = _ejecutar(_SCRIPT_INICIALIZAR, directorio, 'csv', 'exportar')
+        resultado = {
+            'estaciones': estaciones,
+            'filas': filas,
+            'bytes_instantanea': os.path.getsize(os.path.join(directorio, 'datos.snap')),
+            'bytes_bd': os.path.getsize(os.path.join(directorio, 'datos.db')),
+        }
+        for origen in ('csv', 'instantanea'):
+            mediciones = [_ejecutar(_SCRIPT_INICIALIZAR, directorio, origen) for _ in range(repeticiones)]
+            resultado[f'inicializar_bd_{origen}_ms'] = _mediana(mediciones, 'ms')
+        # Ida y vuelta: la BD creada desde la instantánea tiene las mismas filas que la exportada
+        resultado['instantanea_conserva_filas'] = all(m['huella'] == exportada['huella'] for m in mediciones)
+        assert resultado['instantanea_conserva_filas'], 'la BD importada de la instantánea difiere de la original'
+
+        for origen in ('bd', 'instantanea'):
+            mediciones = [_ejecutar(_SCRIPT_CARGAR, directorio, origen) for _ in range(repeticiones)]
+            assert all(m['desde_instantanea'] == (origen == 'instantanea') for m in mediciones)
+            resultado[f'cargar_series_{origen}_ms'] = _mediana(mediciones, 'ms')
+            resultado[f'cargar_series_{origen}_rss_mb'] = _mediana(mediciones, 'rss_mb')
+        return resultado
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/instantanea.py')
+    parser.add_argument('--estaciones', type=int, default=200)
+    parser.add_argument('--filas', type=int, default=500000)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    resultado = medir(args.estaciones, args.filas, args.repeticiones)
+    resultado['segundos_benchmark'] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
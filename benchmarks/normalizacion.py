@@ -0,0 +1,135 @@
+"""Micro-benchmark de normalización por fila: canonicalizar_mes, normalizar_nombre y buscar_coordenadas.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/normalizacion.py [--csv precipitaciones_.csv] [--pasadas 5] [--objetivo 10]
+
+Recorre las filas del CSV aplicando las tres funciones, como hace la importación, con la
+implementación anterior (recalculaba la normalización de los 12 meses y de todas las claves de
+COORDENADAS_MAP en cada llamada) y con `normalizacion.py`. Comprueba que los resultados coinciden
+e imprime un JSON con filas por segundo de cada una y la mejora.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import normalizacion  # noqa: E402
+from normalizacion import COORDENADAS_MAP, MESES_LISTA, MESES_MAP  # noqa: E402
+
+
+# --- Implementación anterior (referencia) ---
+
+def _normalizar_nombre_anterior(nombre):
+    if not nombre:
+        return ""
+    nombre = ''.join(c for c in unicodedata.normalize('NFD', nombre)
+                     if unicodedata.category(c) != 'Mn').lower()
+    return re.sub(r'[^a-z0-9]', '', nombre)
+
+
+def _canonicalizar_mes_anterior(mes):
+    if mes is None:
+        return None
+    mes_s = str(mes).strip()
+    if mes_s == '':
+        return None
+    try:
+        n = int(mes_s)
+        if 1 <= n <= 12:
+            return MESES_LISTA[n-1]
+    except Exception:
+        pass
+    mes_norm = ''.join(c for c in unicodedata.normalize('NFD', mes_s) if unicodedata.category(c) != 'Mn').lower()
+    for k in MESES_MAP.keys():
+        k_norm = ''.join(c for c in unicodedata.normalize('NFD', k) if unicodedata.category(c) != 'Mn').lower()
+        if mes_norm == k_norm:
+            return k
+    prefix = mes_norm[:3]
+    for k in MESES_MAP.keys():
+        k_norm = ''.join(c for c in unicodedata.normalize('NFD', k) if unicodedata.category(c) != 'Mn').lower()
+        if k_norm.startswith(prefix):
+            return k
+    return None
+
+
+def _buscar_coordenadas_anterior(nombre_buscado, depto_default='Desconocido'):
+    norm_buscado = _normalizar_nombre_anterior(nombre_buscado)
+    if not norm_buscado:
+        return None, None, depto_default
+    for key, coords in COORDENADAS_MAP.items():
+        norm_key = _normalizar_nombre_anterior(key)
+        if norm_key in norm_buscado or norm_buscado in norm_key:
+            return coords
+    return None, None, depto_default
+
+
+def _leer_filas(ruta):
+    with open(ruta, encoding='utf-8-sig') as f:
+        primera = f.readline()
+        f.seek(0)
+        delimitador = ';' if primera.count(';') >= primera.count(',') else ','
+        return [(fila.get('Mes'), fila.get('Ubicacion') or fila.get('Departamento'))
+                for fila in csv.DictReader(f, delimiter=delimitador)]
+
+
+def _recorrer(filas, canonicalizar_mes, normalizar_nombre, buscar_coordenadas):
+    return [(canonicalizar_mes(mes), normalizar_nombre(ubicacion), buscar_coordenadas(ubicacion))
+            for mes, ubicacion in filas]
+
+
+def _filas_por_segundo(filas, pasadas, funciones, antes_de_cada_pasada=None):
+    mejor = float('inf')
+    for _ in range(pasadas):
+        if antes_de_cada_pasada:
+            antes_de_cada_pasada()
+        inicio = time.perf_counter()
+        _recorrer(filas, *funciones)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return len(filas) / mejor
+
+
+def _vaciar_memorizacion():
+    # Cada pasada empieza en frío, como una importación en un proceso recién arrancado
+    normalizacion.normalizar_nombre.cache_clear()
+    normalizacion._coordenadas_de.cache_clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/normalizacion.py')
+    parser.add_argument('--csv', default=os.path.join(RAIZ, 'precipitaciones_.csv'))
+    parser.add_argument('--pasadas', type=int, default=5)
+    parser.add_argument('--objetivo', type=float, default=10.0, help='Mejora mínima esperada (veces)')
+    args = parser.parse_args(argv)
+
+    filas = _leer_filas(args.csv)
+    anterior = (_canonicalizar_mes_anterior, _normalizar_nombre_anterior, _buscar_coordenadas_anterior)
+    nueva = (normalizacion.canonicalizar_mes, normalizacion.normalizar_nombre, normalizacion.buscar_coordenadas)
+
+    _vaciar_memorizacion()
+    if _recorrer(filas, *anterior) != _recorrer(filas, *nueva):
+        print(json.dumps({'error': 'Los resultados de ambas implementaciones difieren'}))
+        sys.exit(1)
+
+    fps_anterior = _filas_por_segundo(filas, args.pasadas, anterior)
+    fps_nueva = _filas_por_segundo(filas, args.pasadas, nueva, _vaciar_memorizacion)
+    mejora = fps_nueva / fps_anterior
+    print(json.dumps({
+        'filas': len(filas),
+        'filas_por_segundo_anterior': round(fps_anterior),
+        'filas_por_segundo_nueva': round(fps_nueva),
+        'mejora': round(mejora, 1),
+        'objetivo': args.objetivo,
+        'cumple': mejora >= args.objetivo,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
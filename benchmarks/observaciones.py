@@ -0,0 +1,108 @@
+"""Compara el alta de una observación mensual con `agregar_observaciones` y con una subida de CSV.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/observaciones.py [--estaciones 100] [--filas 200000] [--repeticiones 20] [--semilla 0]
+
+Genera un CSV sintético (generador.py), lo importa en una BD temporal, llena las cachés con una
+predicción por estación y después agrega `--repeticiones` observaciones de estaciones al azar, una
+por vez, de dos maneras:
+- `csv`: un CSV de una fila importado con `importar_csv` (lo que hacía `/api/upload`), que recalcula
+  la climatología de la estación y registra un cambio global de versión.
+- `observaciones`: `agregar_observaciones`, que ajusta la climatología por diferencia y solo
+  invalida la estación afectada.
+Tras cada alta se vuelve a predecir para todas las estaciones (lo que pagan los pedidos siguientes).
+Imprime un JSON con las medianas en milisegundos.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from generador import generar_csv  # noqa: E402
+
+
+def _ms(funcion):
+    inicio = time.perf_counter()
+    funcion()
+    return (time.perf_counter() - inicio) * 1000
+
+
+def medir(estaciones=100, filas=200000, repeticiones=20, semilla=0):
+    """Prepara una BD temporal y devuelve las medianas (ms) de cada variante."""
+    from app import create_app
+    from almacen import almacen
+    from data_processor import (agregar_observaciones, importar_csv, inicializar_datos, nombres_estaciones,
+                                predecir_lote)
+    from normalizacion import MESES_LISTA
+
+    directorio = tempfile.mkdtemp(prefix='precipita_observaciones_')
+    try:
+        csv = os.path.join(directorio, 'datos.csv')
+        generar_csv(csv, estaciones, filas, semilla)
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directorio, 'precipitaciones.db'),
+            'SQLALCHEMY_BINDS': {'trabajos': 'sqlite:///' + os.path.join(directorio, 'trabajos.db')},
+            'PRECIPITA_BOOTSTRAP': False,
+            'INSTANTANEA': os.path.join(directorio, 'ausente.snap'),
+        })
+        app.instance_path = directorio
+        rng = random.Random(semilla)
+        resultado = {'estaciones': estaciones, 'filas': filas, 'repeticiones': repeticiones}
+
+        with app.app_context():
+            inicializar_datos()
+            importar_csv(csv)
+            nombres = sorted(nombres_estaciones().values())
+            anho_fin = max(s.anho_fin for s in almacen.cargar_todas().values())
+            casos = [('Enero', anho_fin + 1, nombre) for nombre in nombres]
+            predecir_lote(casos)
+
+            def _csv(mes, anho, ubicacion, valor):
+                ruta = os.path.join(directorio, 'alta.csv')
+                with open(ruta, 'w', encoding='utf-8') as f:
+                    f.write(f'Mes;Anho;Precipitacion;Ubicacion\n{mes};{anho};{valor};{ubicacion}\n')
+                importar_csv(ruta)
+
+            variantes = {
+                'csv': _csv,
+                'observaciones': lambda *observacion: agregar_observaciones([observacion]),
+            }
+            for variante, alta in variantes.items():
+                altas, predicciones = [], []
+                for _ in range(repeticiones):
+                    observacion = (rng.choice(MESES_LISTA), anho_fin + 1, rng.choice(nombres),
+                                   round(rng.uniform(0, 300), 1))
+                    altas.append(_ms(lambda: alta(*observacion)))
+                    predicciones.append(_ms(lambda: predecir_lote(casos)))
+                resultado[f'alta_{variante}_ms'] = round(statistics.median(altas), 2)
+                resultado[f'predecir_todas_tras_{variante}_ms'] = round(statistics.median(predicciones), 2)
+        return resultado
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/observaciones.py')
+    parser.add_argument('--estaciones', type=int, default=100)
+    parser.add_argument('--filas', type=int, default=200000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    resultado = medir(args.estaciones, args.filas, args.repeticiones, args.semilla)
+    resultado['segundos_benchmark'] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
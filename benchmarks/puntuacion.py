@@ -0,0 +1,144 @@
+"""Compara el núcleo vectorizado (puntuacion.puntuar) con la evaluación escalar anterior, mes a mes.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/puntuacion.py [--estaciones 200] [--anhos 40] [--semilla 0]
+
+Genera estaciones sintéticas (con huecos, nulos y negativos), sus componentes FFT y un caso por
+estación, mes y año de corte de los últimos 5 años. Verifica que ambas implementaciones coincidan
+(promedio y probabilidad dentro de la tolerancia, intensidad exacta) e imprime un JSON con los
+tiempos y la diferencia máxima.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from almacen import SerieEstacion  # noqa: E402
+from data_processor import MESES_LISTA, MESES_MAP, _componente_fft, _puntuar_casos, imputar_serie, robust_weighted_mean  # noqa: E402
+
+TOLERANCIA = 1e-9
+
+
+def _evaluar_mes_anterior(mes_canon, anho, serie_est, fft):
+    """Evaluación escalar de un mes tal como estaba antes del núcleo vectorizado (sin logs)."""
+    if serie_est is None:
+        return None, 0.0, "N/A", "❓"
+    anhos_mes, valores_mes = serie_est.mes(MESES_MAP[mes_canon], desde=anho - 5, hasta=anho)
+    if anhos_mes.size == 0:
+        anhos_mes, valores_mes = serie_est.mes(MESES_MAP[mes_canon], hasta=anho)
+    if anhos_mes.size == 0:
+        return None, 0.0, "N/A", "❓"
+
+    validos = ~np.isnan(valores_mes) & (valores_mes >= 0)
+    valores_est = valores_mes[validos].tolist()
+    max_anho = int(anhos_mes.max())
+    vals = []
+    ws = []
+    for d_anho, d_valor in zip(anhos_mes[validos], valores_mes[validos]):
+        peso = 2.0 if (max_anho - d_anho) <= 5 else 1.0
+        vals.append(float(d_valor))
+        ws.append(peso)
+    promedio_est = robust_weighted_mean(vals, ws, lower_pct=0.05, upper_pct=0.95) if vals else 0.0
+
+    if fft is None:
+        promedio = promedio_est
+    else:
+        medias_fft, conteos_fft, cv_series = fft
+        mes_idx = MESES_MAP[mes_canon] - 1
+        promedio_fft = float(medias_fft[mes_idx])
+        n_fft = conteos_fft[mes_idx]
+        w_fft = 0.6 if n_fft >= 3 else (0.3 if n_fft >= 1 else 0.0)
+        if cv_series > 1.0:
+            w_fft = max(0.0, w_fft * 0.5)
+        promedio = (promedio_fft * w_fft) + (promedio_est * (1.0 - w_fft))
+        if np.isnan(promedio) or promedio < 0:
+            promedio = float(promedio_est)
+
+    probabilidad = min(100.0, max(0.0, ((promedio * 0.05) + 3) / 30 * 100))
+    if len(valores_est) > 1:
+        desv = np.std(valores_est)
+        mean_val = np.mean(valores_est)
+        cv = (desv / mean_val) if mean_val > 0 else 0
+        if cv > 0.8:
+            probabilidad *= 0.8
+
+    for limite, intensidad, emoji in ((20, "Escasa", "☀️"), (70, "Moderada", "☁️"), (150, "Abundante", "🌦️"),
+                                      (300, "Muy Abundante", "🌧️")):
+        if promedio < limite:
+            break
+    else:
+        intensidad, emoji = "Torrencial", "⛈️"
+        probabilidad = min(100, probabilidad + 15)
+    return float(promedio), float(probabilidad), intensidad, emoji
+
+
+def _estaciones_sinteticas(n_estaciones, n_anhos, rng):
+    estaciones = []
+    for _ in range(n_estaciones):
+        anhos = int(rng.integers(max(3, n_anhos // 2), n_anhos + 1))
+        estacional = 60 + 90 * np.sin(np.linspace(0, 2 * np.pi, 12, endpoint=False))[np.newaxis, :]
+        valores = rng.gamma(2.0, np.maximum(estacional, 5) / 2.0, size=(anhos, 12))
+        valores[rng.random(valores.shape) < 0.02] *= 6  # eventos extremos
+        presentes = rng.random(valores.shape) > 0.08
+        valores[rng.random(valores.shape) < 0.05] = np.nan
+        valores[rng.random(valores.shape) < 0.005] = -1.0
+        valores[~presentes] = np.nan
+        estaciones.append(SerieEstacion(1980 + int(rng.integers(0, 10)), valores.astype(np.float32), presentes))
+    return estaciones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/puntuacion.py')
+    parser.add_argument('--estaciones', type=int, default=200)
+    parser.add_argument('--anhos', type=int, default=40)
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.semilla)
+    casos = []
+    for serie in _estaciones_sinteticas(args.estaciones, args.anhos, rng):
+        for anho in range(serie.anho_fin - 4, serie.anho_fin + 1):
+            recorte = serie.hasta(anho)
+            recorte = recorte.recortada() if recorte is not None else None
+            fft = _componente_fft(imputar_serie(recorte.valores, 'media')[0], '') if recorte is not None else None
+            casos.extend((serie, mes, anho, fft, '') for mes in MESES_LISTA)
+
+    inicio = time.perf_counter()
+    escalares = [_evaluar_mes_anterior(mes, anho, serie, fft) for serie, mes, anho, fft, _ in casos]
+    t_escalar = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vectoriales = _puntuar_casos(casos)
+    t_vectorial = time.perf_counter() - inicio
+
+    dif_promedio = dif_probabilidad = 0.0
+    distintos = 0
+    for a, b in zip(escalares, vectoriales):
+        if (a[0] is None) != (b[0] is None) or a[2:] != b[2:]:
+            distintos += 1
+            continue
+        if a[0] is not None:
+            dif_promedio = max(dif_promedio, abs(a[0] - b[0]) / max(1.0, abs(a[0])))
+            dif_probabilidad = max(dif_probabilidad, abs(a[1] - b[1]) / max(1.0, abs(a[1])))
+
+    print(json.dumps({
+        'casos': len(casos),
+        'segundos_escalar': round(t_escalar, 4),
+        'segundos_vectorial': round(t_vectorial, 4),
+        'mejora': round(t_escalar / t_vectorial, 1),
+        'diferencia_relativa_max_promedio': dif_promedio,
+        'diferencia_relativa_max_probabilidad': dif_probabilidad,
+        'clases_distintas': distintos,
+        'coinciden': distintos == 0 and max(dif_promedio, dif_probabilidad) <= TOLERANCIA,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Suite de benchmarks: importación, funciones de data_processor y cada ruta /api/* con el cliente de pruebas.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/suite.py [--estaciones 20] [--filas 8000] [--csv ruta.csv] [--repeticiones 30] [--rondas 1]
+                               [--salida resultados.json] [--base benchmarks/linea_base.json]
+                               [--tolerancia 0.5] [--guardar-base]
+
+Trabaja sobre una BD temporal (nunca sobre la del repositorio) cargada con un CSV sintético de
+`generador.py` (o con `--csv`). Para cada operación mide la latencia de `--repeticiones` llamadas
+con entradas variadas (p50, p95, media, operaciones por segundo) y el pico de memoria asignada
+(tracemalloc) en una llamada adicional, fuera de las mediciones de tiempo. Las rutas cacheadas se
+miden con la caché de respuestas vacía, es decir, el costo de calcularlas. Con `--rondas N` se
+repite todo N veces y se informa la mediana de cada medida, lo que reduce el ruido de la máquina.
+`/api/historico` y `/api/estacionariedad` se miden además en cada formato de `formatos.py`
+(cabecera `Accept`), con el tamaño de la respuesta en `bytes`.
+
+Con `--base` compara contra un resultado guardado: una operación es regresión si su p50 o su pico
+de memoria superan a los de la base en más de `--tolerancia` (fracción); en ese caso el proceso
+termina con código 1. `--guardar-base` escribe el resultado en la ruta de `--base`. Los tiempos
+dependen de la máquina: la base solo es comparable con corridas en el mismo equipo, y si se midió
+con otros parámetros no se compara.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from generador import generar_csv  # noqa: E402
+
+BASE_POR_DEFECTO = os.path.join(RAIZ, 'benchmarks', 'linea_base.json')
+
+# Diferencias absolutas por debajo de estos valores no se consideran regresión (ruido de medición)
+MINIMO_MS = 0.5
+MINIMO_KB = 64
+
+
+def _resumen(tiempos, memoria_pico, unidades=1):
+    """Estadísticas de una operación a partir de sus tiempos (segundos) y el pico de memoria (bytes)."""
+    ms = np.asarray(tiempos) * 1000
+    return {
+        'n': len(tiempos),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'media_ms': round(float(ms.mean()), 3),
+        'por_segundo': round(unidades * len(tiempos) / float(np.sum(tiempos)), 1),
+        'memoria_pico_kb': round(memoria_pico / 1024, 1),
+    }
+
+
+def _pico_memoria(funcion):
+    tracemalloc.start()
+    try:
+        funcion()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def medir(funcion, entradas, antes=None, memoria=None, calentar=False):
+    """Llama a `funcion(entrada)` por cada entrada y devuelve el resumen.
+
+    `antes(entrada)`, si se indica, se ejecuta antes de cada llamada fuera del tiempo medido
+    (p. ej. para vaciar una caché). Con `calentar` se hace antes una pasada sin medir por todas las
+    entradas (cachés llenas, importaciones diferidas hechas). La memoria se mide con una llamada más
+    bajo tracemalloc con la entrada `memoria` (por defecto se repite la última, que no sirve para
+    operaciones no repetibles).
+    """
+    if calentar:
+        for entrada in entradas:
+            if antes:
+                antes(entrada)
+            funcion(entrada)
+    tiempos = []
+    for entrada in entradas:
+        if antes:
+            antes(entrada)
+        inicio = time.perf_counter()
+        funcion(entrada)
+        tiempos.append(time.perf_counter() - inicio)
+    if memoria is None:
+        memoria = entradas[-1]
+    if antes:
+        antes(memoria)
+    return _resumen(tiempos, _pico_memoria(lambda: funcion(memoria)))
+
+
+def _pedido(cliente, metodo, url, estados=(200,), **kwargs):
+    respuesta = cliente.open(url, method=metodo, **kwargs)
+    if respuesta.status_code not in estados:
+        raise RuntimeError(f'{metodo} {url}: {respuesta.status_code} {respuesta.get_data(as_text=True)[:200]}')
+    return respuesta
+
+
+def correr(csv, repeticiones, semilla=0):
+    """Corre la suite completa sobre una BD temporal cargada con `csv` y devuelve {operación: resumen}."""
+    directorio = tempfile.mkdtemp(prefix='precipita_bench_')
+    try:
+        return _correr(csv, repeticiones, semilla, directorio)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def _correr(csv, repeticiones, semilla, directorio):
+    from app import cache_respuestas, create_app
+    from almacen import almacen
+    from data_processor import (cache_fft, cache_modelos, importar_csv, inicializar_datos, nombres_estaciones as
+                                estaciones_con_datos, obtener_serie_temporal, predecir_precipitacion)
+    from formatos import FORMATOS
+    from normalizacion import MESES_LISTA
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directorio, 'precipitaciones.db'),
+        'SQLALCHEMY_BINDS': {'trabajos': 'sqlite:///' + os.path.join(directorio, 'trabajos.db')},
+        'PRECIPITA_BOOTSTRAP': False,
+    })
+    # Subidas y bloqueos también en el directorio temporal
+    app.instance_path = directorio
+    rng = random.Random(semilla)
+    resultados = {}
+
+    with app.app_context():
+        inicializar_datos()
+        almacen.invalidar()
+        inicio = time.perf_counter()
+        resumen = importar_csv(csv)
+        segundos = time.perf_counter() - inicio
+        # Memoria: reimportar el mismo archivo (misma lectura en lotes; actualiza en vez de insertar)
+        resultados['importar_csv'] = {
+            **_resumen([segundos], _pico_memoria(lambda: importar_csv(csv))),
+            'filas': resumen['filas'],
+            'filas_por_segundo': round(resumen['filas'] / segundos, 1),
+        }
+
+        nombres = sorted(estaciones_con_datos().values())
+        anho_fin = max(s.anho_fin for s in almacen.cargar_todas().values())
+
+        def _vaciar_caches(_=None):
+            cache_respuestas.limpiar()
+            cache_fft.limpiar()
+            cache_modelos.limpiar()
+
+        estaciones = [rng.choice(nombres) for _ in range(repeticiones)]
+        resultados['obtener_serie_temporal'] = medir(lambda u: obtener_serie_temporal(u), estaciones, calentar=True)
+        resultados['obtener_serie_temporal_frio'] = medir(
+            lambda u: obtener_serie_temporal(u), estaciones, antes=lambda _: almacen.invalidar()
+        )
+
+        predicciones = [
+            (rng.choice(MESES_LISTA), rng.randint(anho_fin - 10, anho_fin + 3), rng.choice(nombres))
+            for _ in range(repeticiones)
+        ]
+        resultados['predecir_precipitacion'] = medir(lambda p: predecir_precipitacion(*p), predicciones, calentar=True)
+        resultados['predecir_precipitacion_frio'] = medir(lambda p: predecir_precipitacion(*p), predicciones,
+                                                          antes=_vaciar_caches)
+
+    cliente = app.test_client()
+
+    def ruta(nombre, cuerpos, memoria=None, calentar=True, accept=None):
+        metodo, url = nombre.split(' ', 1)
+        if accept is not None:
+            nombre = f'{nombre} [{accept}]'
+        cabeceras = {'Accept': accept} if accept is not None else {}
+        resultados[nombre] = medir(
+            lambda cuerpo: _pedido(cliente, metodo, url, json=cuerpo, headers=cabeceras), cuerpos,
+            antes=_vaciar_caches, memoria=memoria, calentar=calentar
+        )
+        if accept is not None:
+            resultados[nombre]['bytes'] = len(_pedido(cliente, metodo, url, json=cuerpos[0], headers=cabeceras).data)
+
+    def cuerpo_estacion():
+        return {'ubicacion': rng.choice(nombres), 'anho': rng.randint(anho_fin - 10, anho_fin + 3)}
+
+    ruta('GET /api/estaciones', [None] * repeticiones)
+    ruta('GET /api/modelos', [None] * repeticiones)
+    ruta('GET /api/cache/stats', [None] * repeticiones)
+    ruta('GET /api/metrics', [None] * repeticiones)
+    ruta('POST /api/predecir', [{**cuerpo_estacion(), 'mes': rng.choice(MESES_LISTA)} for _ in range(repeticiones)])
+    ruta('POST /api/predecir/lote', [
+        {'ubicaciones': rng.sample(nombres, min(3, len(nombres))), 'anhos': list(range(anho_fin - 4, anho_fin + 1))}
+        for _ in range(repeticiones)
+    ])
+    ruta('GET /api/estaciones?bbox=-58.5,-27,-55.5,-24', [None] * repeticiones)
+    ruta('GET /api/estaciones/cercanas?lat=-25.3&lon=-57.6&k=5', [None] * repeticiones)
+    ruta('POST /api/predecir/punto', [
+        {'lat': rng.uniform(-27, -20), 'lon': rng.uniform(-61, -55), 'mes': rng.choice(MESES_LISTA),
+         'anho': rng.randint(anho_fin - 10, anho_fin + 3)}
+        for _ in range(repeticiones)
+    ])
+    ruta('POST /api/historico', [cuerpo_estacion() for _ in range(repeticiones)])
+    ruta('POST /api/estacionalidad', [cuerpo_estacion() for _ in range(repeticiones)])
+    ruta('POST /api/estacionariedad', [cuerpo_estacion() for _ in range(repeticiones)])
+    ruta('GET /api/espectro', [None] * repeticiones)
+    # Formatos de las series largas (formatos.py): mismo cálculo, distinta serialización y tamaño
+    cuerpos_series = [cuerpo_estacion() for _ in range(repeticiones)]
+    for formato in FORMATOS:
+        ruta('POST /api/historico', cuerpos_series, accept=formato)
+        ruta('POST /api/estacionariedad', cuerpos_series, accept=formato)
+    ruta('POST /api/validacion', [{**cuerpo_estacion(), 'anho': anho_fin, 'mes': 'Enero'} for _ in range(repeticiones)])
+
+    # Escrituras de estaciones: alta, modificación y baja de estaciones nuevas
+    altas = [{'nombre': f'Bench {i}', 'latitud': -25.0, 'longitud': -57.0, 'departamento': 'Central'}
+             for i in range(repeticiones + 1)]
+    ruta('POST /api/estaciones', altas[:-1], memoria=altas[-1], calentar=False)
+    ids = [e['id'] for e in _pedido(cliente, 'GET', '/api/estaciones').get_json() if e['nombre'].startswith('Bench ')]
+    resultados['PUT /api/estaciones/<id>'] = medir(
+        lambda i: _pedido(cliente, 'PUT', f'/api/estaciones/{i}', json={'departamento': 'Guairá'}), ids[:-1],
+        memoria=ids[-1]
+    )
+    resultados['DELETE /api/estaciones/<id>'] = medir(
+        lambda i: _pedido(cliente, 'DELETE', f'/api/estaciones/{i}'), ids[:-1], memoria=ids[-1]
+    )
+
+    # Subida: solo el encolado (la importación corre en segundo plano); después, consulta del trabajo
+    with open(csv, 'rb') as f:
+        cabecera_y_filas = b''.join(f.readline() for _ in range(101))
+    trabajos = []
+
+    def subir(_):
+        respuesta = _pedido(cliente, 'POST', '/api/upload', estados=(202,),
+                            data={'file': (io.BytesIO(cabecera_y_filas), 'bench.csv')},
+                            content_type='multipart/form-data')
+        trabajos.append(respuesta.get_json()['url'])
+
+    resultados['POST /api/upload'] = medir(subir, [None] * min(repeticiones, 10))
+    for url in trabajos:
+        while _pedido(cliente, 'GET', url).get_json()['estado'] not in ('completado', 'error'):
+            time.sleep(0.05)
+    resultados['GET /api/jobs/<id>'] = medir(lambda url: _pedido(cliente, 'GET', url), trabajos)
+    return resultados
+
+
+def combinar_rondas(rondas):
+    """Combina los resultados de varias corridas tomando, por operación, la mediana de cada medida."""
+    combinado = {}
+    for nombre, primera in rondas[0].items():
+        combinado[nombre] = {
+            clave: (round(float(np.median([r[nombre][clave] for r in rondas])), 3) if isinstance(valor, float) else valor)
+            for clave, valor in primera.items()
+        }
+    return combinado
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones de `actual` respecto de `base` (p50 o memoria por encima de la tolerancia)."""
+    regresiones = []
+    for nombre, medida in actual['resultados'].items():
+        anterior = base['resultados'].get(nombre)
+        if anterior is None:
+            continue
+        for clave, minimo in (('p50_ms', MINIMO_MS), ('memoria_pico_kb', MINIMO_KB)):
+            if medida[clave] > anterior[clave] * (1 + tolerancia) and medida[clave] - anterior[clave] > minimo:
+                regresiones.append({
+                    'operacion': nombre,
+                    'medida': clave,
+                    'base': anterior[clave],
+                    'actual': medida[clave],
+                    'razon': round(medida[clave] / anterior[clave], 2) if anterior[clave] else None,
+                })
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/suite.py')
+    parser.add_argument('--estaciones', type=int, default=20)
+    parser.add_argument('--filas', type=int, default=8000)
+    parser.add_argument('--csv', help='Usar este CSV en lugar de generar uno sintético')
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--rondas', type=int, default=1, help='Corridas completas; se informa la mediana de cada medida')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', help='Ruta del JSON de resultados (por defecto solo se imprime)')
+    parser.add_argument('--base', default=BASE_POR_DEFECTO)
+    parser.add_argument('--tolerancia', type=float, default=0.5)
+    parser.add_argument('--guardar-base', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    parametros = {'estaciones': args.estaciones, 'filas': args.filas, 'csv': args.csv,
+                  'repeticiones': args.repeticiones, 'semilla': args.semilla}
+
+    with tempfile.TemporaryDirectory(prefix='precipita_csv_') as directorio:
+        csv = os.path.abspath(args.csv) if args.csv else os.path.join(directorio, 'sintetico.csv')
+        if not args.csv:
+            generar_csv(csv, args.estaciones, args.filas, args.semilla)
+        resultados = combinar_rondas([correr(csv, args.repeticiones, args.semilla) for _ in range(args.rondas)])
+
+    actual = {
+        'parametros': parametros,
+        'entorno': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        'rss_pico_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'resultados': resultados,
+    }
+
+    if args.guardar_base:
+        with open(args.base, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    elif os.path.exists(args.base):
+        with open(args.base, encoding='utf-8') as f:
+            base = json.load(f)
+        if base.get('parametros') != parametros:
+            print(f'Aviso: la base {args.base} se midió con otros parámetros ({base.get("parametros")}); '
+                  'no se compara', file=sys.stderr)
+        else:
+            actual['regresiones'] = comparar(actual, base, args.tolerancia)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    print(json.dumps(actual, indent=2, ensure_ascii=False))
+    if actual.get('regresiones'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+_FALTA = object()
+
+
+class CacheLRU:
+    """Caché LRU con límite de tamaño, TTL opcional (segundos) y contadores de aciertos/fallos."""
+
+    def __init__(self, max_items=256, ttl=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, default=None):
+        """Devuelve el valor guardado para `clave` (marcándolo como reciente) o `default`."""
+        with self._lock:
+            entrada = self._datos.get(clave, _FALTA)
+            if entrada is not _FALTA and self.ttl is not None and time.monotonic() - entrada[1] > self.ttl:
+                del self._datos[clave]
+                entrada = _FALTA
+            if entrada is _FALTA:
+                self.fallos += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic())
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def obtener_o_calcular(self, clave, funcion):
+        """Devuelve el valor en caché o lo calcula con `funcion()` y lo guarda."""
+        valor = self.obtener(clave, _FALTA)
+        if valor is _FALTA:
+            valor = funcion()
+            self.guardar(clave, valor)
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        """Resumen de uso: tamaño, límite y contadores de aciertos/fallos."""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'tamanho': len(self._datos),
+                'max_items': self.max_items,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / total, 4) if total else None
+            }
+
+
+# Versión global de los datos: forma parte de las claves de caché, por lo que incrementarla
+# tras cada escritura deja obsoletas todas las entradas calculadas con los datos anteriores.
+# Con varios procesos, data_processor la mantiene alineada con la versión persistida en la BD.
+_version_datos = 0
+_version_lock = threading.Lock()
+
+
+def version_datos():
+    return _version_datos
+
+
+def incrementar_version_datos():
+    """Registra una escritura en precipitaciones o estaciones y devuelve la nueva versión."""
+    global _version_datos
+    with _version_lock:
+        _version_datos += 1
+        return _version_datos
+
+
+def fijar_version_datos(version):
+    """Adopta una versión conocida (p. ej. la persistida por otro proceso)."""
+    global _version_datos
+    with _version_lock:
+        _version_datos = version
+
+
+# Secuencia de observaciones: cada alta o modificación puntual de observaciones (`agregar_observaciones`)
+# la incrementa sin tocar la versión global y registra en qué valor cambió cada estación. Las claves
+# de caché por estación usan `version_estacion`, así que una observación solo deja obsoletas las
+# entradas de las estaciones que modifica.
+_secuencia_observaciones = 0
+_versiones_estaciones = {}
+
+
+def secuencia_observaciones():
+    return _secuencia_observaciones
+
+
+def version_estacion(ubicacion_norm):
+    """Versión de los datos de una estación: la global y la secuencia de su última observación conocida."""
+    return _version_datos, _versiones_estaciones.get(ubicacion_norm, 0)
+
+
+def adoptar_observaciones(secuencia, cambios=()):
+    """Adopta `secuencia` y las versiones por estación de `cambios` ({ubicacion_norm: secuencia})."""
+    global _secuencia_observaciones
+    with _version_lock:
+        _versiones_estaciones.update(cambios)
+        _secuencia_observaciones = secuencia
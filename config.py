@@ -0,0 +1,55 @@
+"""Configuración de la aplicación a partir de variables de entorno (prefijo PRECIPITA_)."""
+import os
+
+
+def _entero(nombre, defecto):
+    return int(os.environ.get(nombre, defecto))
+
+
+def _booleano(nombre, defecto):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes', 'on')
+
+
+def cargar_config():
+    """Devuelve el diccionario de configuración de Flask según el entorno.
+
+    Variables reconocidas:
+    - PRECIPITA_DATABASE_URI: URI de SQLAlchemy (por defecto `sqlite:///precipitaciones.db`, en `instance/`).
+    - PRECIPITA_DB_POOL_SIZE / PRECIPITA_DB_MAX_OVERFLOW: tamaño del pool de conexiones por proceso.
+    - PRECIPITA_SQLITE_BUSY_TIMEOUT_MS: espera máxima ante un bloqueo de escritura en SQLite.
+    - PRECIPITA_SQLITE_WAL: abrir SQLite en modo WAL (lectores no bloqueados por escrituras).
+    - PRECIPITA_BOOTSTRAP: crear/migrar la BD e importar el CSV inicial al arrancar. En despliegues
+      multi-proceso conviene desactivarlo y ejecutar `python -m precipita bootstrap` una sola vez.
+    - PRECIPITA_CSV_INICIAL: CSV a importar si la BD está vacía.
+    - PRECIPITA_INSTANTANEA: instantánea binaria de los datos (`python -m precipita snapshot`); por
+      defecto `instance/precipitaciones.snap`. Si existe, los procesos sirven las series desde ella y
+      el bootstrap la importa en lugar del CSV.
+    - PRECIPITA_TRABAJOS_URI: BD de la cola de trabajos en segundo plano (archivo aparte de la principal).
+    - PRECIPITA_TRABAJOS_WORKERS: hilos por proceso que ejecutan trabajos (importaciones, validaciones).
+    - PRECIPITA_PERFILADO: permitir el perfilado con cProfile de pedidos marcados (`X-Perfil: 1` o `?perfil=1`).
+    """
+    uri = os.environ.get('PRECIPITA_DATABASE_URI', 'sqlite:///precipitaciones.db')
+    opciones_motor = {'pool_pre_ping': False}
+    if uri.startswith('sqlite') and ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///'):
+        opciones_motor.update({
+            'pool_size': _entero('PRECIPITA_DB_POOL_SIZE', 10),
+            'max_overflow': _entero('PRECIPITA_DB_MAX_OVERFLOW', 20),
+        })
+    return {
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_ENGINE_OPTIONS': opciones_motor,
+        'SQLALCHEMY_BINDS': {'trabajos': os.environ.get('PRECIPITA_TRABAJOS_URI', 'sqlite:///trabajos.db')},
+        'SQLITE_BUSY_TIMEOUT_MS': _entero('PRECIPITA_SQLITE_BUSY_TIMEOUT_MS', 10000),
+        'SQLITE_WAL': _booleano('PRECIPITA_SQLITE_WAL', True),
+        'PRECIPITA_BOOTSTRAP': _booleano('PRECIPITA_BOOTSTRAP', True),
+        'TRABAJOS_WORKERS': _entero('PRECIPITA_TRABAJOS_WORKERS', 2),
+        'PERFILADO': _booleano('PRECIPITA_PERFILADO', False),
+        'CSV_INICIAL': os.environ.get(
+            'PRECIPITA_CSV_INICIAL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'precipitaciones.csv')
+        ),
+        'INSTANTANEA': os.environ.get('PRECIPITA_INSTANTANEA'),
+    }
@@ -1,105 +1,35 @@
+import codecs
 import csv
+import itertools
+import math
 import os
-from models import db, Precipitacion, Estacion
-
-MESES_MAP = {
-    'Enero': 1, 'Febrero': 2, 'Marzo': 3, 'Abril': 4, 'Mayo': 5, 'Junio': 6,
-    'Julio': 7, 'Agosto': 8, 'Setiembre': 9, 'Octubre': 10, 'Noviembre': 11, 'Diciembre': 12
-}
-
-# Constante global con la lista de meses (usar un único punto de definición)
-MESES_LISTA = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Setiembre', 'Octubre', 'Noviembre', 'Diciembre']
-
-COORDENADAS_MAP = {
-    'Aeropuerto Internacional Guarani': (-25.4542, -54.8431, 'Alto Paraná'),
-    'Aeropuerto Internacional Silvio Pettirossi': (-25.2403, -57.5192, 'Central'),
-    'Caazapa': (-26.1833, -56.3667, 'Caazapá'),
-    'Capitan Meza': (-26.9167, -55.4, 'Itapúa'),
-    'Cnel. Oviedo': (-25.45, -56.45, 'Caaguazú'),
-    'Concepcion': (-23.4167, -57.4333, 'Concepción'),
-    'Encarnacio': (-27.3333, -55.8667, 'Itapúa'),
-    'General Bruguez': (-24.75, -58.8333, 'Presidente Hayes'),
-    'Mcal. Estigarribia': (-22.0167, -60.6167, 'Boquerón'),
-    'Paraguari': (-25.6167, -57.15, 'Paraguarí'),
-    'Pedro Juan Caballero': (-22.55, -55.7333, 'Amambay'),
-    'Pilar': (-26.8667, -58.3, 'Ñeembucú'),
-    'Pozo Colorado': (-23.4833, -58.8, 'Presidente Hayes'),
-    'Puerto Casado': (-22.2833, -57.9333, 'Alto Paraguay'),
-    'Quyquyho': (-25.9333, -56.9333, 'Paraguarí'),
-    'Salto del Guaira': (-24.0667, -54.3, 'Canindeyú'),
-    'San Estanislao': (-24.65, -56.4333, 'San Pedro'),
-    'San Juan Bautista': (-26.6667, -57.15, 'Misiones'),
-    'San Pedro': (-24.0833, -57.0833, 'San Pedro'),
-    'Villarrica': (-25.75, -56.4333, 'Guairá')
-}
-
-import unicodedata
-import re
-import logging
-
-logger = logging.getLogger(__name__)
+import time
+import uuid
+from datetime import date
+from sqlalchemy.exc import OperationalError
+from models import (db, Precipitacion, PrecipitacionDiaria, Estacion, PrediccionCache, Climatologia, EstadoDatos,
+                    Trabajo, VersionEstacion)
+from almacen import (almacen, hay_diarias, meses_diarios, series_mensuales, totales_diarios_completos,
+                     valores_originales)
+from cache import CacheLRU, adoptar_observaciones, fijar_version_datos, secuencia_observaciones, version_datos, version_estacion
+from metricas import estadisticas_lru, medido, metricas, tramo
+import instantanea
+from instantanea import abrir as abrir_instantanea
+# Reexportadas: el resto del código las importa desde data_processor
+from normalizacion import MESES_MAP, MESES_LISTA, normalizar_nombre, canonicalizar_mes, buscar_coordenadas
 
-def normalizar_nombre(nombre):
-    """Normaliza un nombre: quita acentos, mayúsculas y caracteres no visibles."""
-    if not nombre:
-        return ""
-    # Quitar acentos y convertir a minúsculas
-    nombre = ''.join(c for c in unicodedata.normalize('NFD', nombre)
-                     if unicodedata.category(c) != 'Mn').lower()
-    # Quitar caracteres no alfanuméricos y espacios extra
-    nombre = re.sub(r'[^a-z0-9]', '', nombre)
-    return nombre
+# Umbral práctico (mm) de evento extremo usado en la climatología y en la validación de colas
+UMBRAL_EXTREMO = 200.0
 
+# Lluvia mínima (mm) para contar un día como día de lluvia (criterio habitual de la OMM)
+UMBRAL_DIA_LLUVIA = 1.0
 
-def canonicalizar_mes(mes):
-    """Devuelve el nombre canónico del mes (como aparece en MESES_LISTA) o None si no puede resolverse.
+# Primer año aceptado en una observación puntual (el último es el siguiente al actual)
+ANHO_MINIMO = 1800
 
-    Acepta entradas numéricas ('1','01'), nombres en cualquier capitalización, abreviaturas de 3 letras,
-    y elimina acentos/diacríticos.
-    """
-    if mes is None:
-        return None
-    mes_s = str(mes).strip()
-    if mes_s == '':
-        return None
+import logging
 
-    # Si es numérico, mapear a mes
-    try:
-        n = int(mes_s)
-        if 1 <= n <= 12:
-            return MESES_LISTA[n-1]
-    except Exception:
-        pass
-
-    # Normalizar (sin acentos, minúsculas)
-    mes_norm = ''.join(c for c in unicodedata.normalize('NFD', mes_s) if unicodedata.category(c) != 'Mn').lower()
-
-    # Coincidencia exacta con los nombres de MESES_MAP
-    for k in MESES_MAP.keys():
-        k_norm = ''.join(c for c in unicodedata.normalize('NFD', k) if unicodedata.category(c) != 'Mn').lower()
-        if mes_norm == k_norm:
-            return k
-
-    # Intentar coincidencia por prefijo (3 letras)
-    prefix = mes_norm[:3]
-    for k in MESES_MAP.keys():
-        k_norm = ''.join(c for c in unicodedata.normalize('NFD', k) if unicodedata.category(c) != 'Mn').lower()
-        if k_norm.startswith(prefix):
-            return k
-
-    return None
-
-def buscar_coordenadas(nombre_buscado, depto_default='Desconocido'):
-    """Busca coordenadas en COORDENADAS_MAP usando coincidencia parcial de nombres normalizados."""
-    norm_buscado = normalizar_nombre(nombre_buscado)
-    if not norm_buscado:
-        return None, None, depto_default
-        
-    for key, coords in COORDENADAS_MAP.items():
-        norm_key = normalizar_nombre(key)
-        if norm_key in norm_buscado or norm_buscado in norm_key:
-            return coords
-    return None, None, depto_default
+logger = logging.getLogger(__name__)
 
 def poblar_estaciones():
     """Puebla la tabla de estaciones basándose en las ubicaciones únicas del CSV."""
@@ -122,23 +52,307 @@ def poblar_estaciones():
             estaciones_existentes[norm_nombre] = estacion
     db.session.commit()
 
-def importar_csv(file_path):
-    """Importa datos desde un archivo CSV a la base de datos."""
+# Se incrementa cuando cambia lo que hace inicializar_datos (tablas, columnas, índices, datos derivados);
+# los procesos que encuentran una BD con una versión menor vuelven a inicializarla.
+VERSION_ESQUEMA = 6
+
+
+def migrar_esquema():
+    """Agrega las columnas derivadas (ubicacion_norm, mes_num) y sus índices a bases existentes.
+
+    Es idempotente: solo altera la tabla si faltan columnas y solo completa las filas sin valores derivados.
+    """
+    inspector = db.inspect(db.engine)
+    columnas = {c['name'] for c in inspector.get_columns(Precipitacion.__tablename__)}
+    columnas_estado = {c['name'] for c in inspector.get_columns(EstadoDatos.__tablename__)}
+    with db.engine.begin() as conn:
+        if 'esquema' not in columnas_estado:
+            conn.exec_driver_sql('ALTER TABLE estado_datos ADD COLUMN esquema INTEGER NOT NULL DEFAULT 0')
+        if 'instantanea' not in columnas_estado:
+            conn.exec_driver_sql('ALTER TABLE estado_datos ADD COLUMN instantanea VARCHAR(32)')
+        if 'secuencia' not in columnas_estado:
+            conn.exec_driver_sql('ALTER TABLE estado_datos ADD COLUMN secuencia INTEGER NOT NULL DEFAULT 0')
+        if 'ubicacion_norm' not in columnas:
+            conn.exec_driver_sql('ALTER TABLE precipitaciones ADD COLUMN ubicacion_norm VARCHAR(100)')
+        if 'mes_num' not in columnas:
+            conn.exec_driver_sql('ALTER TABLE precipitaciones ADD COLUMN mes_num INTEGER')
+    motor_trabajos = db.engines['trabajos']
+    columnas_trabajos = {c['name'] for c in db.inspect(motor_trabajos).get_columns(Trabajo.__tablename__)}
+    with motor_trabajos.begin() as conn:
+        if 'pid' not in columnas_trabajos:
+            conn.exec_driver_sql('ALTER TABLE trabajos ADD COLUMN pid INTEGER')
+        if 'latido' not in columnas_trabajos:
+            conn.exec_driver_sql('ALTER TABLE trabajos ADD COLUMN latido FLOAT')
+
+    pendientes = db.session.query(Precipitacion.id, Precipitacion.mes, Precipitacion.ubicacion).filter(
+        db.or_(Precipitacion.ubicacion_norm.is_(None), Precipitacion.mes_num.is_(None))
+    ).all()
+    if pendientes:
+        cambios = []
+        for id_, mes, ubicacion in pendientes:
+            mes_canon = canonicalizar_mes(mes)
+            cambios.append({
+                'id': id_,
+                'ubicacion_norm': normalizar_nombre(ubicacion),
+                'mes_num': MESES_MAP[mes_canon] if mes_canon else None
+            })
+        db.session.execute(db.update(Precipitacion), cambios)
+        db.session.commit()
+        logger.info(f"Migración: {len(cambios)} registros completados con ubicacion_norm/mes_num")
+
+    indices = {i['name'] for i in db.inspect(db.engine).get_indexes(Precipitacion.__tablename__)}
+    if 'ux_precipitaciones_mes_anho_norm' not in indices:
+        # Antes de crear la clave única, conservar solo la última fila de cada (mes, anho, ubicacion_norm)
+        with db.engine.begin() as conn:
+            borradas = conn.exec_driver_sql(
+                'DELETE FROM precipitaciones WHERE id NOT IN '
+                '(SELECT MAX(id) FROM precipitaciones GROUP BY mes, anho, ubicacion_norm)'
+            ).rowcount
+        if borradas:
+            logger.info(f"Migración: {borradas} registros duplicados eliminados")
+
+    for indice in Precipitacion.__table__.indexes:
+        indice.create(db.engine, checkfirst=True)
+
+    # Bases anteriores a la tabla de climatología: materializarla a partir de los datos existentes
+    if not Climatologia.query.first() and Precipitacion.query.first():
+        actualizar_climatologia()
+
+
+def inicializar_datos(csv_inicial=None, instantanea=None):
+    """Crea y migra el esquema, carga los datos iniciales si la BD está vacía y completa las estaciones.
+
+    Los datos iniciales salen de la instantánea `instantanea` (ruta, ver instantanea.py) si existe,
+    que evita parsear el CSV, y si no de `csv_inicial`.
+    Pensado para ejecutarse una sola vez por despliegue (`python -m precipita bootstrap` o el primer
+    pedido, ver `app.asegurar_inicializacion`) y no en cada proceso del servidor. Al terminar registra
+    VERSION_ESQUEMA en estado_datos.
+    """
+    db.create_all()
+    migrar_esquema()
+    importada = None
+    if not Precipitacion.query.first():
+        if instantanea and os.path.exists(instantanea):
+            importada = importar_instantanea(abrir_instantanea(instantanea))
+        elif csv_inicial and os.path.exists(csv_inicial):
+            importar_csv(csv_inicial)
+
+    # Asegurar que las estaciones estén pobladas
+    poblar_estaciones()
+
+    estado = db.session.get(EstadoDatos, 1)
+    if estado is None:
+        estado = EstadoDatos(id=1, version=0)
+        db.session.add(estado)
+    estado.esquema = VERSION_ESQUEMA
+    if importada is not None:
+        # La BD queda con los datos de la instantánea: adoptar su versión, secuencia e identificador
+        # para que los procesos la sirvan desde el archivo
+        estado.version, estado.secuencia = importada.version_datos, importada.secuencia
+        estado.instantanea = importada.identificador
+    db.session.commit()
+    sincronizar_version_datos()
+
+
+def requiere_inicializacion():
+    """True si la BD no fue inicializada o lo fue con una versión de esquema anterior a VERSION_ESQUEMA."""
     try:
-        f = open(file_path, mode='r', encoding='utf-8-sig')
-        content = f.read()
-        f.close()
-    except UnicodeDecodeError:
-        f = open(file_path, mode='r', encoding='latin-1')
-        content = f.read()
-        f.close()
-
-    lines = content.splitlines()
-    if not lines:
-        return
+        esquema = db.session.execute(db.text('SELECT esquema FROM estado_datos WHERE id = 1')).scalar()
+    except OperationalError:
+        # Tabla o columna inexistente: BD nueva o anterior a estado_datos
+        db.session.rollback()
+        return True
+    return esquema is None or esquema < VERSION_ESQUEMA
+
+
+def _version_persistida():
+    return db.session.execute(db.select(EstadoDatos.version).where(EstadoDatos.id == 1)).scalar()
+
+
+def registrar_cambio_datos():
+    """Registra una escritura en precipitaciones o estaciones y devuelve la nueva versión de datos.
+
+    La versión vive en la tabla estado_datos para que los demás procesos del servidor detecten
+    el cambio (ver `sincronizar_version_datos`); este proceso la adopta de inmediato.
+    """
+    actualizadas = db.session.execute(
+        db.update(EstadoDatos).where(EstadoDatos.id == 1).values(version=EstadoDatos.version + 1)
+    ).rowcount
+    if not actualizadas:
+        db.session.add(EstadoDatos(id=1, version=1))
+    db.session.flush()
+    version = _version_persistida()
+    db.session.commit()
+    fijar_version_datos(version)
+    return version
+
+
+def sincronizar_version_datos():
+    """Adopta la versión persistida si otro proceso escribió datos; en ese caso descarta las series en memoria.
+
+    Si solo cambió la secuencia de observaciones (`agregar_observaciones`) se descartan únicamente las
+    series de las estaciones que cambiaron. Las cachés de predicciones y respuestas incluyen la versión
+    (global o de la estación) en la clave, así que quedan obsoletas solas.
+    """
+    fila = db.session.execute(db.select(EstadoDatos.version, EstadoDatos.secuencia).where(EstadoDatos.id == 1)).first()
+    version, secuencia = (fila[0] or 0, fila[1] or 0) if fila is not None else (0, 0)
+    if version != version_datos():
+        almacen.invalidar()
+        fijar_version_datos(version)
+        adoptar_observaciones(secuencia)
+    elif secuencia != secuencia_observaciones():
+        cambios = dict(db.session.execute(
+            db.select(VersionEstacion.ubicacion_norm, VersionEstacion.secuencia)
+            .where(VersionEstacion.secuencia > secuencia_observaciones())
+        ).all())
+        almacen.invalidar(cambios)
+        adoptar_observaciones(secuencia, cambios)
+    if almacen.instantanea_por_confirmar():
+        almacen.confirmar_instantanea(
+            db.session.execute(db.select(EstadoDatos.instantanea).where(EstadoDatos.id == 1)).scalar()
+        )
+    return version
+
+
+def exportar_instantanea(ruta):
+    """Escribe en `ruta` una instantánea binaria (instantanea.py) de todas las series y estaciones.
+
+    El cubo sale solo de la tabla mensual (`almacen.series_mensuales`, sin los totales derivados de
+    datos diarios) y las precipitaciones diarias se guardan aparte, fila por fila.
+
+    Registra su identificador en estado_datos: los procesos que la abran (`app.create_app`) la usan
+    mientras no cambien la versión de datos ni la secuencia de observaciones. Devuelve un resumen con
+    estaciones, bytes y segundos.
+    """
+    inicio = time.perf_counter()
+    version = sincronizar_version_datos()
+    series = series_mensuales()
+    diarias = {}
+    filas_diarias = db.session.execute(
+        db.select(PrecipitacionDiaria.ubicacion_norm, PrecipitacionDiaria.fecha, PrecipitacionDiaria.valor)
+        .order_by(PrecipitacionDiaria.ubicacion_norm, PrecipitacionDiaria.fecha)
+    ).all()
+    for norm, grupo in itertools.groupby(filas_diarias, key=lambda f: f[0]):
+        _, fechas, valores = zip(*grupo)
+        diarias[norm] = (fechas, valores)
+    # Nombre con el que se guardan las filas de cada estación (el de su fila más reciente)
+    ultimas = (db.select(db.func.max(Precipitacion.id))
+               .where(Precipitacion.ubicacion_norm.isnot(None)).group_by(Precipitacion.ubicacion_norm))
+    ubicaciones = dict(db.session.execute(
+        db.select(Precipitacion.ubicacion_norm, Precipitacion.ubicacion).where(Precipitacion.id.in_(ultimas))
+    ).all())
+    estaciones = [{
+        'nombre': e.nombre,
+        'latitud': e.latitud,
+        'longitud': e.longitud,
+        'departamento': e.departamento,
+    } for e in Estacion.query.order_by(Estacion.id)]
+    identificador = uuid.uuid4().hex
+    tamanho = instantanea.exportar(ruta, series, ubicaciones, estaciones, version, secuencia_observaciones(),
+                                   identificador, diarias)
+    db.session.execute(db.update(EstadoDatos).where(EstadoDatos.id == 1).values(instantanea=identificador))
+    db.session.commit()
+    resumen = {'estaciones': len(series), 'bytes': tamanho, 'segundos': round(time.perf_counter() - inicio, 3)}
+    logger.info(f"Instantánea exportada en {ruta}: {resumen}")
+    return resumen
+
+
+def importar_instantanea(datos):
+    """Carga en la BD las estaciones y precipitaciones de una instantánea abierta (`instantanea.abrir`).
+
+    Recorre las celdas presentes del cubo y las escribe con el mismo upsert por lotes que
+    `importar_csv`, sin parsear texto; las precipitaciones diarias vuelven a PrecipitacionDiaria. No registra un cambio de versión: `inicializar_datos` adopta
+    la de la instantánea. Devuelve la instantánea.
+    """
+    inicio = time.perf_counter()
+    existentes = {normalizar_nombre(e.nombre) for e in Estacion.query.all()}
+    for estacion in datos.estaciones:
+        if normalizar_nombre(estacion['nombre']) not in existentes:
+            db.session.add(Estacion(**estacion))
+    db.session.flush()
+
+    filas = 0
+    lote = []
+    series = datos.series()
+    for norm, serie in series.items():
+        ubicacion = datos.ubicaciones[norm]
+        indices_anho, indices_mes = np.nonzero(serie.presentes)
+        valores = valores_originales(serie.valores[indices_anho, indices_mes]).tolist()
+        for i, m, valor in zip(indices_anho.tolist(), indices_mes.tolist(), valores):
+            lote.append((MESES_LISTA[m], serie.anho_inicio + i, None if valor != valor else valor, ubicacion, norm, m + 1))
+        if len(lote) >= TAMANHO_LOTE:
+            _upsert_precipitaciones(lote)
+            filas += len(lote)
+            lote = []
+    if lote:
+        _upsert_precipitaciones(lote)
+        filas += len(lote)
+    con_diarias = set()
+    for norm, fechas, valores in datos.diarias():
+        con_diarias.add(norm)
+        valores = valores_originales(valores).tolist()
+        for desde in range(0, len(fechas), TAMANHO_LOTE):
+            lote = [(norm, fecha, None if valor != valor else valor)
+                    for fecha, valor in zip(fechas[desde:desde + TAMANHO_LOTE].tolist(),
+                                            valores[desde:desde + TAMANHO_LOTE])]
+            with tramo('bd_escritura'):
+                db.session.connection().exec_driver_sql(_SQL_UPSERT_DIARIA, lote)
+            filas += len(lote)
+    invalidar_predicciones_cache(set(series) | con_diarias)
+    db.session.commit()
+    almacen.invalidar(set(series) | con_diarias)
+    actualizar_climatologia(set(series) | con_diarias)
+    logger.info(f"Instantánea {datos.ruta} importada: {filas} filas en {time.perf_counter() - inicio:.2f} s")
+    return datos
+
+# Filas por lote en las inserciones masivas de importar_csv
+TAMANHO_LOTE = 5000
+
+
+def _lineas_texto(fuente):
+    """Itera las líneas de un archivo binario como texto, sin leerlo entero.
+
+    Cada línea se decodifica como UTF-8 (quitando el BOM inicial) y, si falla, como Latin-1.
+    """
+    for i, linea in enumerate(fuente):
+        if i == 0 and linea.startswith(codecs.BOM_UTF8):
+            linea = linea[len(codecs.BOM_UTF8):]
+        try:
+            yield linea.decode('utf-8')
+        except UnicodeDecodeError:
+            yield linea.decode('latin-1')
+
+
+_SQL_UPSERT_PRECIPITACION = (
+    'INSERT INTO precipitaciones (mes, anho, valor, ubicacion, ubicacion_norm, mes_num) '
+    'VALUES (?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (mes, anho, ubicacion_norm) DO UPDATE SET valor = excluded.valor'
+)
+
+
+def _upsert_precipitaciones(lote):
+    """Inserta o actualiza (por mes, anho, ubicacion_norm) un lote de tuplas con un único executemany."""
+    with tramo('bd_escritura'):
+        db.session.connection().exec_driver_sql(_SQL_UPSERT_PRECIPITACION, lote)
+
+
+def _fraccion_leida(fuente):
+    """Fracción del archivo ya leída (0-1) o None si el origen no permite saberlo (p. ej. un stream de red)."""
+    try:
+        tamanho = os.fstat(fuente.fileno()).st_size
+        return min(1.0, fuente.tell() / tamanho) if tamanho else None
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _lector_csv(origen):
+    """Filas (dicts por columna) de un CSV binario, detectando el delimitador con la primera línea."""
+    lineas = _lineas_texto(origen)
+    first_line = next(lineas, None)
+    if first_line is None:
+        return iter(())
 
     # Detectar delimitador (punto y coma, coma o punto)
-    first_line = lines[0]
     delimiters = [';', ',']
     delimiter = ',' # Default
     max_count = -1
@@ -149,20 +363,29 @@ def importar_csv(file_path):
             max_count = count
             delimiter = d
             
-    reader = csv.DictReader(lines, delimiter=delimiter)
-    
-    # Cache de estaciones y registros existentes (mapeando a objetos para actualización)
-    estaciones_existentes = {normalizar_nombre(e.nombre): e for e in Estacion.query.all()}
-    registros_existentes = {(p.mes, p.anho, normalizar_nombre(p.ubicacion)): p for p in Precipitacion.query.all()}
-    
-    for row in reader:
+    return csv.DictReader(itertools.chain([first_line], lineas), delimiter=delimiter)
+
+
+def leer_csv(origen, reporte=None):
+    """Recorre un CSV de precipitaciones fila por fila, sin leerlo entero.
+
+    `origen` es un archivo binario abierto. Detecta el delimitador con la primera línea y produce
+    tuplas `(mes, anho, valor, ubicacion, ubicacion_norm, departamento)` con el mes canónico y
+    `valor` None para '-'. Las filas inválidas se saltean; si se pasa `reporte` se cuentan en sus
+    claves `filas` y `rechazadas`.
+    """
+    if reporte is None:
+        reporte = {'filas': 0, 'rechazadas': 0}
+    for row in _lector_csv(origen):
+        reporte['filas'] += 1
         try:
-            row = {k.strip(): v for k, v in row.items()}
+            row = {k.strip(): v for k, v in row.items() if k is not None}
             valor_str = row.get('Precipitacion', '0').replace(',', '.')
             valor = float(valor_str) if valor_str != '-' else None
             
             ubicacion_nombre = row.get('Ubicacion') or row.get('Departamento')
             if not ubicacion_nombre:
+                reporte['rechazadas'] += 1
                 continue
             
             ubicacion_nombre = ubicacion_nombre.strip()
@@ -173,41 +396,337 @@ def importar_csv(file_path):
             if mes is None:
                 # Ignorar filas con mes no reconocido
                 logger.warning(f"Fila con mes desconocido ignorada: {mes_raw} -> fila: {row}")
+                reporte['rechazadas'] += 1
                 continue
-            
-            # Si el registro ya existe, actualizar el valor
-            key = (mes, anho, norm_nombre)
-            if key in registros_existentes:
-                registros_existentes[key].valor = valor
+            departamento = (row.get('Departamento') or 'Desconocido').strip()
+        except (ValueError, KeyError, AttributeError) as e:
+            reporte['rechazadas'] += 1
+            logger.warning(f"Fila ignorada por error: {row} - {e}")
+            continue
+
+        yield mes, anho, valor, ubicacion_nombre, norm_nombre, departamento
+
+
+def importar_csv(origen, progreso=None):
+    """Importa datos desde un archivo CSV a la base de datos.
+
+    `origen` puede ser una ruta o un archivo binario abierto (por ejemplo el stream de una subida).
+    El archivo se procesa en streaming y se escribe en lotes de TAMANHO_LOTE filas con upsert,
+    por lo que la memoria no depende del tamaño del archivo. Devuelve un resumen con las filas
+    leídas, insertadas, actualizadas y rechazadas, la duración y las filas por segundo.
+
+    `progreso`, si se indica, se llama tras cada lote con `filas_leidas`, `filas_escritas`,
+    `fraccion` (porción del archivo leída, si se conoce) y `fase`.
+    """
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, mode='rb') as fuente:
+            return importar_csv(fuente, progreso)
+
+    inicio = time.perf_counter()
+    reporte = {'filas': 0, 'insertadas': 0, 'actualizadas': 0, 'rechazadas': 0}
+
+    # Cache de estaciones existentes; los registros se resuelven en SQL con ON CONFLICT
+    estaciones_existentes = {normalizar_nombre(e.nombre): e for e in Estacion.query.all()}
+    registros_previos = db.session.query(db.func.count(Precipitacion.id)).scalar()
+    # Estaciones con filas nuevas o modificadas (para invalidar el almacén en memoria)
+    ubicaciones_afectadas = set()
+    lote = []
+    aceptadas = 0
+    
+    for mes, anho, valor, ubicacion_nombre, norm_nombre, departamento in leer_csv(origen, reporte):
+        # Si la estación no existe, crearla
+        if norm_nombre not in estaciones_existentes:
+            lat, lng, depto = buscar_coordenadas(ubicacion_nombre, departamento)
+            nueva_estacion = Estacion(
+                nombre=ubicacion_nombre,
+                latitud=lat,
+                longitud=lng,
+                departamento=depto
+            )
+            db.session.add(nueva_estacion)
+            db.session.flush()
+            estaciones_existentes[norm_nombre] = nueva_estacion
+
+        lote.append((mes, anho, valor, ubicacion_nombre, norm_nombre, MESES_MAP[mes]))
+        ubicaciones_afectadas.add(norm_nombre)
+
+        if len(lote) >= TAMANHO_LOTE:
+            _upsert_precipitaciones(lote)
+            aceptadas += len(lote)
+            lote = []
+            if progreso:
+                progreso(filas_leidas=reporte['filas'], filas_escritas=aceptadas,
+                         fraccion=_fraccion_leida(origen), fase='importando')
+
+    if lote:
+        _upsert_precipitaciones(lote)
+        aceptadas += len(lote)
+    if progreso:
+        progreso(filas_leidas=reporte['filas'], filas_escritas=aceptadas, fraccion=1.0, fase='actualizando resúmenes')
+    registros_finales = db.session.query(db.func.count(Precipitacion.id)).scalar()
+    invalidar_predicciones_cache(ubicaciones_afectadas)
+    db.session.commit()
+    almacen.invalidar(ubicaciones_afectadas)
+    if ubicaciones_afectadas:
+        actualizar_climatologia(ubicaciones_afectadas)
+    registrar_cambio_datos()
+
+    duracion = time.perf_counter() - inicio
+    reporte['insertadas'] = registros_finales - registros_previos
+    reporte['actualizadas'] = aceptadas - reporte['insertadas']
+    reporte['segundos'] = round(duracion, 3)
+    reporte['filas_por_segundo'] = round(reporte['filas'] / duracion, 1) if duracion > 0 else None
+    metricas.registrar_importacion(reporte['filas'], duracion)
+    logger.info(f"Importación CSV: {reporte}")
+    return reporte
+
+
+_SQL_UPSERT_DIARIA = (
+    'INSERT INTO precipitaciones_diarias (ubicacion_norm, fecha, valor) VALUES (?, ?, ?) '
+    'ON CONFLICT (ubicacion_norm, fecha) DO UPDATE SET valor = excluded.valor'
+)
+
+
+def _fecha_entera(texto):
+    """Convierte 'AAAA-MM-DD', 'DD/MM/AAAA' o 'AAAAMMDD' en el entero AAAAMMDD (ValueError si no es una fecha)."""
+    texto = texto.strip()
+    if '-' in texto:
+        anho, mes, dia = texto.split('-')
+    elif '/' in texto:
+        dia, mes, anho = texto.split('/')
+    elif len(texto) == 8:
+        anho, mes, dia = texto[:4], texto[4:6], texto[6:]
+    else:
+        raise ValueError(f'fecha no reconocida: {texto}')
+    # date() valida el día (rechaza, por ejemplo, un 30 de febrero)
+    fecha = date(int(anho), int(mes), int(dia))
+    return fecha.year * 10000 + fecha.month * 100 + fecha.day
+
+
+def leer_csv_diario(origen, ubicacion=None, reporte=None):
+    """Recorre un CSV de datos diarios (columnas Fecha, Precipitacion y opcionalmente Ubicacion) sin leerlo entero.
+
+    Pensado para los archivos por estación: sin columna Ubicacion, todas las filas son de `ubicacion`.
+    Produce tuplas `(ubicacion_norm, ubicacion, fecha AAAAMMDD, valor)`, con `valor` None si el día
+    está vacío o es '-'. Las filas inválidas se saltean y se cuentan en `reporte` como en `leer_csv`.
+    """
+    if reporte is None:
+        reporte = {'filas': 0, 'rechazadas': 0}
+    for row in _lector_csv(origen):
+        reporte['filas'] += 1
+        try:
+            row = {k.strip(): v for k, v in row.items() if k is not None}
+            nombre = (row.get('Ubicacion') or ubicacion or '').strip()
+            if not nombre:
+                reporte['rechazadas'] += 1
                 continue
+            fecha = _fecha_entera(row['Fecha'])
+            valor_str = (row.get('Precipitacion') or '').strip().replace(',', '.')
+            valor = float(valor_str) if valor_str not in ('', '-') else None
+        except (ValueError, KeyError, AttributeError) as e:
+            reporte['rechazadas'] += 1
+            logger.warning(f"Fila diaria ignorada: {row} - {e}")
+            continue
+        yield normalizar_nombre(nombre), nombre, fecha, valor
+
+
+def importar_diarias(origen, ubicacion=None, progreso=None):
+    """Importa precipitaciones diarias (ver `leer_csv_diario`) en PrecipitacionDiaria.
+
+    Como `importar_csv`: lee en streaming, escribe en lotes de TAMANHO_LOTE filas con upsert por
+    (estación, fecha), crea las estaciones nuevas y al terminar invalida las cachés de las estaciones
+    cargadas. La tabla mensual no se toca: el almacén agrega al leer cada serie los meses con todos sus
+    días cargados (`almacen.meses_diarios`) y solo los usa donde no hay observación mensual. Devuelve un
+    resumen con las filas leídas, escritas y rechazadas, los meses con datos diarios del rango cargado,
+    los incompletos (`meses_incompletos`: ubicación, año, mes, días con dato y días del mes; su total
+    no se usa), las estaciones, la duración y las filas por segundo.
+    """
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, mode='rb') as fuente:
+            return importar_diarias(fuente, ubicacion, progreso)
 
-            # Si la estación no existe, crearla
-            if norm_nombre not in estaciones_existentes:
-                lat, lng, depto = buscar_coordenadas(ubicacion_nombre, row.get('Departamento', 'Desconocido').strip())
-                nueva_estacion = Estacion(
-                    nombre=ubicacion_nombre,
-                    latitud=lat,
-                    longitud=lng,
-                    departamento=depto
-                )
-                db.session.add(nueva_estacion)
+    inicio = time.perf_counter()
+    reporte = {'filas': 0, 'rechazadas': 0}
+    estaciones_existentes = {normalizar_nombre(e.nombre) for e in Estacion.query.all()}
+    # Estación -> [nombre, primera fecha, última fecha] de las filas cargadas
+    rangos = {}
+    lote = []
+    escritas = 0
+
+    for norm, nombre, fecha, valor in leer_csv_diario(origen, ubicacion, reporte):
+        if norm not in estaciones_existentes:
+            lat, lng, depto = buscar_coordenadas(nombre)
+            db.session.add(Estacion(nombre=nombre, latitud=lat, longitud=lng, departamento=depto))
+            db.session.flush()
+            estaciones_existentes.add(norm)
+        rango = rangos.get(norm)
+        if rango is None:
+            rangos[norm] = [nombre, fecha, fecha]
+        else:
+            rango[1], rango[2] = min(rango[1], fecha), max(rango[2], fecha)
+        lote.append((norm, fecha, valor))
+
+        if len(lote) >= TAMANHO_LOTE:
+            with tramo('bd_escritura'):
+                db.session.connection().exec_driver_sql(_SQL_UPSERT_DIARIA, lote)
+            escritas += len(lote)
+            lote = []
+            if progreso:
+                progreso(filas_leidas=reporte['filas'], filas_escritas=escritas,
+                         fraccion=_fraccion_leida(origen), fase='importando')
+
+    if lote:
+        with tramo('bd_escritura'):
+            db.session.connection().exec_driver_sql(_SQL_UPSERT_DIARIA, lote)
+        escritas += len(lote)
+    if progreso:
+        progreso(filas_leidas=reporte['filas'], filas_escritas=escritas, fraccion=1.0, fase='actualizando resúmenes')
+    meses = []
+    for norm, (nombre, desde, hasta) in rangos.items():
+        meses.extend((nombre, *mes) for mes in meses_diarios(norm, desde // 100, hasta // 100))
+    afectadas = set(rangos)
+    invalidar_predicciones_cache(afectadas)
+    db.session.commit()
+    almacen.invalidar(afectadas)
+    if afectadas:
+        actualizar_climatologia(afectadas)
+    registrar_cambio_datos()
+
+    duracion = time.perf_counter() - inicio
+    reporte['escritas'] = escritas
+    reporte['meses'] = len(meses)
+    reporte['meses_incompletos'] = [
+        {'ubicacion': nombre, 'anho': anho, 'mes': MESES_LISTA[mes_num - 1], 'dias_con_dato': dias_con_dato,
+         'dias_del_mes': dias_del_mes}
+        for nombre, _, anho, mes_num, _, dias_con_dato, dias_del_mes in meses if dias_con_dato < dias_del_mes
+    ]
+    reporte['estaciones'] = len(afectadas)
+    reporte['segundos'] = round(duracion, 3)
+    reporte['filas_por_segundo'] = round(reporte['filas'] / duracion, 1) if duracion > 0 else None
+    metricas.registrar_importacion(reporte['filas'], duracion)
+    logger.info(f"Importación diaria: {reporte}")
+    return reporte
+
+
+def agregar_observaciones(observaciones):
+    """Inserta o actualiza observaciones puntuales `(mes, anho, ubicacion, valor)` sin reimportar nada.
+
+    Pensado para el alta mensual de datos: cada observación cuesta unas pocas consultas por clave,
+    independientes del tamaño de la BD. Además de la fila de precipitaciones se actualizan en forma
+    incremental la climatología del mes (`_actualizar_climatologia_mes`) y la serie en memoria de la
+    estación (extendiéndola si el año es nuevo), y se borran solo las predicciones precalculadas de la
+    estación para los años posteriores al de la observación. `valor` None es un dato nulo.
+
+    No cambia la versión global: incrementa la secuencia de observaciones y registra en
+    versiones_estaciones la de cada estación afectada, de modo que los demás procesos descartan solo
+    esas estaciones (ver `sincronizar_version_datos`). Una estación que no existía se crea y, como
+    cambia el índice espacial, sí registra un cambio global.
+    Devuelve un resumen con `insertadas`, `actualizadas`, `rechazadas`, `errores` (índice de la
+    observación y motivo), `estaciones` y `secuencia`.
+    """
+    reporte = {'insertadas': 0, 'actualizadas': 0, 'rechazadas': 0, 'errores': []}
+    validas = []
+    for i, observacion in enumerate(observaciones):
+        try:
+            mes, anho, ubicacion, valor = observacion
+            mes_canon = canonicalizar_mes(mes)
+            if mes_canon is None:
+                raise ValueError(f'mes no reconocido: {mes}')
+            if not isinstance(ubicacion, str) or not ubicacion.strip():
+                raise ValueError('falta la ubicación')
+            # bool es un int y un float con decimales se truncaría: ninguno es un año
+            if isinstance(anho, bool) or (isinstance(anho, float) and not anho.is_integer()):
+                raise ValueError(f'año inválido: {anho}')
+            anho = int(anho)
+            anho_maximo = date.today().year + 1
+            if not ANHO_MINIMO <= anho <= anho_maximo:
+                raise ValueError(f'año fuera de rango ({ANHO_MINIMO}-{anho_maximo}): {anho}')
+            if valor is not None:
+                if isinstance(valor, bool):
+                    raise ValueError(f'valor inválido: {valor}')
+                valor = float(valor)
+                if not np.isfinite(valor) or valor < 0:
+                    raise ValueError(f'valor inválido: {valor}')
+        except (TypeError, ValueError) as e:
+            reporte['rechazadas'] += 1
+            reporte['errores'].append({'indice': i, 'error': str(e)})
+            continue
+        validas.append((mes_canon, anho, ubicacion.strip(), valor))
+    if not validas:
+        return {**reporte, 'estaciones': 0, 'secuencia': secuencia_observaciones()}
+
+    # La secuencia primero: la escritura toma el bloqueo de la BD antes de leer los valores anteriores
+    if not db.session.execute(
+        db.update(EstadoDatos).where(EstadoDatos.id == 1).values(secuencia=EstadoDatos.secuencia + 1)
+    ).rowcount:
+        db.session.add(EstadoDatos(id=1, version=0, secuencia=1))
+        db.session.flush()
+    secuencia = db.session.execute(db.select(EstadoDatos.secuencia).where(EstadoDatos.id == 1)).scalar()
+
+    # Estación -> primer año modificado (las predicciones de años anteriores no usan el dato)
+    afectadas = {}
+    # Estaciones con meses completados desde datos diarios: su climatología y su serie se recalculan
+    # enteras, porque una observación mensual puede reemplazar un total derivado
+    con_diarias = set()
+    aplicadas = []
+    estaciones = None
+    nuevas = False
+    for mes, anho, ubicacion, valor in validas:
+        norm, mes_num = normalizar_nombre(ubicacion), MESES_MAP[mes]
+        if norm not in afectadas and db.session.execute(
+            db.select(Precipitacion.id).where(Precipitacion.ubicacion_norm == norm).limit(1)
+        ).first() is None:
+            # Estación sin datos: crearla si tampoco está en la tabla de estaciones (caso raro)
+            if estaciones is None:
+                estaciones = {normalizar_nombre(e.nombre) for e in Estacion.query.all()}
+            if norm not in estaciones:
+                lat, lng, depto = buscar_coordenadas(ubicacion)
+                db.session.add(Estacion(nombre=ubicacion, latitud=lat, longitud=lng, departamento=depto))
                 db.session.flush()
-                estaciones_existentes[norm_nombre] = nueva_estacion
+                estaciones.add(norm)
+                nuevas = True
 
-            precip = Precipitacion(
-                mes=mes,
-                anho=anho,
-                valor=valor,
-                ubicacion=ubicacion_nombre
-            )
-            db.session.add(precip)
-            # Actualizar cache de registros para esta sesión
-            registros_existentes[key] = precip
-        except (ValueError, KeyError) as e:
-            print(f"Error procesando fila: {row} - {e}")
+        anterior = db.session.execute(db.select(Precipitacion.valor).where(
+            Precipitacion.mes == mes, Precipitacion.anho == anho, Precipitacion.ubicacion_norm == norm
+        )).first()
+        _upsert_precipitaciones([(mes, anho, valor, ubicacion, norm, mes_num)])
+        reporte['actualizadas' if anterior is not None else 'insertadas'] += 1
+        if norm not in afectadas and totales_diarios_completos(norm):
+            con_diarias.add(norm)
+        if norm not in con_diarias:
+            _actualizar_climatologia_mes(norm, mes_num, anterior[0] if anterior is not None else None, valor)
+        afectadas[norm] = min(anho, afectadas.get(norm, anho))
+        aplicadas.append((norm, anho, mes_num, valor))
+
+    for norm, anho in afectadas.items():
+        db.session.merge(VersionEstacion(ubicacion_norm=norm, secuencia=secuencia))
+        invalidar_predicciones_cache([norm], desde_anho=anho + 1)
     db.session.commit()
+    if nuevas:
+        registrar_cambio_datos()
+
+    if secuencia == secuencia_observaciones() + 1:
+        for norm, anho, mes_num, valor in aplicadas:
+            if norm not in con_diarias:
+                almacen.actualizar(norm, anho, mes_num, valor)
+        if con_diarias:
+            almacen.invalidar(con_diarias)
+        adoptar_observaciones(secuencia, dict.fromkeys(afectadas, secuencia))
+    else:
+        # Otro proceso registró observaciones entre medio: traer también las suyas
+        sincronizar_version_datos()
+    if con_diarias:
+        actualizar_climatologia(con_diarias)
+    logger.info(f"Observaciones registradas (secuencia {secuencia}): {reporte['insertadas']} nuevas, "
+                f"{reporte['actualizadas']} actualizadas, {reporte['rechazadas']} rechazadas")
+    return {**reporte, 'estaciones': len(afectadas), 'secuencia': secuencia}
 
 import numpy as np
+from puntuacion import EMOJIS, INTENSIDADES, SIN_DATOS, UMBRALES_INTENSIDAD, a_tuplas, frecuencia_lluvia, puntuar
+from modelos import MODELO_POR_DEFECTO, ajustar_serie, predecir_ajuste
+from espacial import indice_estaciones, interpolar_idw
+from espectro import MESES_MINIMOS, componentes_fft, periodos_dominantes
+from flujo import CuantilesP2, VentanaMovil, Welford
 
 
 def iqr_bounds(values, k=1.5):
@@ -250,197 +769,936 @@ def robust_weighted_mean(values, weights=None, lower_pct=0.05, upper_pct=0.95):
     return float(np.sum(arr * w) / np.sum(w))
 
 
-def obtener_serie_temporal(ubicacion, hasta_anho=None):
-    """Obtiene la serie temporal continua de precipitaciones para una ubicación."""
-    norm_ubicacion = normalizar_nombre(ubicacion)
-    datos = Precipitacion.query.all()
-    datos_filtrados = [d for d in datos if normalizar_nombre(d.ubicacion) == norm_ubicacion]
-    
-    if hasta_anho:
-        datos_filtrados = [d for d in datos_filtrados if d.anho < hasta_anho]
-        
-    if not datos_filtrados:
+def estadisticas_moviles(values, ventana=12):
+    """Media y desvío estándar (muestral) móviles de los últimos `ventana` valores, O(n) con sumas acumuladas.
+
+    Equivale a `pd.Series(values).rolling(ventana, min_periods=1).mean()` / `.std()`: las primeras
+    ventanas son parciales y el desvío es NaN donde la ventana tiene un solo valor.
+    """
+    arr = np.asarray(values, dtype=np.float64)
+    if arr.size == 0:
+        return np.empty(0), np.empty(0)
+    # Centrar antes de acumular evita perder precisión al restar sumas de cuadrados grandes
+    centro = arr.mean()
+    centrados = arr - centro
+    sumas = np.concatenate(([0.0], np.cumsum(centrados)))
+    cuadrados = np.concatenate(([0.0], np.cumsum(centrados * centrados)))
+    fin = np.arange(1, arr.size + 1)
+    inicio = np.maximum(fin - ventana, 0)
+    n = (fin - inicio).astype(np.float64)
+    suma = sumas[fin] - sumas[inicio]
+    media = suma / n + centro
+    with np.errstate(divide='ignore', invalid='ignore'):
+        varianza = (cuadrados[fin] - cuadrados[inicio] - suma * suma / n) / (n - 1)
+    desvio = np.where(n > 1, np.sqrt(np.maximum(varianza, 0.0)), np.nan)
+    return media, desvio
+
+
+# Estrategias de relleno de huecos aceptadas por obtener_serie_temporal
+IMPUTACIONES = ('media', 'mediana', 'vecinas', 'interpolacion')
+
+
+def _medias_mensuales(valores):
+    """Media de cada columna (mes) de una matriz (años × 12), con 0.0 en los meses sin datos."""
+    conteos = np.count_nonzero(~np.isnan(valores), axis=0)
+    sumas = np.nansum(valores, axis=0)
+    return np.divide(sumas, conteos, out=np.zeros(12), where=conteos > 0)
+
+
+def _estaciones_vecinas(norm_ubicacion, k=3):
+    """Nombres normalizados de las k estaciones con coordenadas más cercanas a la indicada."""
+    origen = indice_estaciones.coordenadas(norm_ubicacion)
+    if origen is None:
         return []
+    return [estacion['norm'] for estacion, _ in indice_estaciones.vecinas(*origen, k=k, excluir=norm_ubicacion)]
 
-    # Encontrar rango de años
-    anhos = [d.anho for d in datos_filtrados]
-    min_anho, max_anho = min(anhos), max(anhos)
-    
-    # Crear un mapa para búsqueda rápida (usar mes canónico)
-    mapa_datos = {(d.anho, canonicalizar_mes(d.mes) or d.mes): d.valor for d in datos_filtrados}
+
+def _climatologia_vecinas(norm_ubicacion, hasta_anho=None):
+    """Promedio de las medias mensuales de las estaciones vecinas (NaN en meses sin datos vecinos)."""
+    medias = []
+    for vecina in _estaciones_vecinas(norm_ubicacion):
+        serie_vecina = almacen.obtener(vecina)
+        if serie_vecina is not None and hasta_anho:
+            serie_vecina = serie_vecina.hasta(hasta_anho)
+        if serie_vecina is None:
+            continue
+        valores = serie_vecina.valores.astype(np.float64)
+        conteos = np.count_nonzero(~np.isnan(valores), axis=0)
+        medias.append(np.where(conteos > 0, _medias_mensuales(valores), np.nan))
+    if not medias:
+        return np.full(12, np.nan)
+    medias = np.array(medias)
+    conteos = np.count_nonzero(~np.isnan(medias), axis=0)
+    return np.divide(np.nansum(medias, axis=0), conteos, out=np.full(12, np.nan), where=conteos > 0)
+
+
+def imputar_serie(valores, imputacion='media', relleno_vecinas=None):
+    """Rellena los NaN de una matriz (años × 12) y la aplana en una serie mensual continua.
+
+    Devuelve `(serie, mascara)`, ambos 1-D, donde `mascara` es True en los valores observados.
+    Con 'vecinas' se usa `relleno_vecinas` (12 medias mensuales) y, donde falte, la media propia.
+    """
+    if imputacion not in IMPUTACIONES:
+        raise ValueError(f"Estrategia de imputación desconocida: {imputacion}")
+    valores = np.asarray(valores, dtype=np.float64)
+    mascara = ~np.isnan(valores)
+
+    if imputacion == 'interpolacion':
+        serie = valores.ravel()
+        observados = np.flatnonzero(mascara.ravel())
+        if observados.size == 0:
+            return np.zeros_like(serie), mascara.ravel()
+        serie = np.interp(np.arange(serie.size), observados, serie[observados])
+        return serie, mascara.ravel()
+
+    if imputacion == 'mediana':
+        conteos = np.count_nonzero(mascara, axis=0)
+        relleno = np.zeros(12)
+        if np.any(conteos > 0):
+            relleno[conteos > 0] = np.nanmedian(valores[:, conteos > 0], axis=0)
+    else:
+        relleno = _medias_mensuales(valores)
+        if imputacion == 'vecinas' and relleno_vecinas is not None:
+            relleno = np.where(np.isnan(relleno_vecinas), relleno, relleno_vecinas)
+
+    serie = np.where(mascara, valores, relleno[np.newaxis, :])
+    return serie.ravel(), mascara.ravel()
+
+
+def _serie_imputada(norm_ubicacion, hasta_anho=None, imputacion='media'):
+    """Igual que obtener_serie_temporal pero recibe el nombre ya normalizado."""
+    serie_est = almacen.obtener(norm_ubicacion)
     
-    serie = []
-    for anho in range(min_anho, max_anho + 1):
-        for mes in MESES_LISTA:
-            valor = mapa_datos.get((anho, mes))
-            # Si el valor es None, usamos el promedio del mes para no sesgar la FFT con ceros
-            if valor is None:
-                valores_mes = [d.valor for d in datos_filtrados if (canonicalizar_mes(d.mes) or d.mes) == mes and d.valor is not None]
-                valor = sum(valores_mes) / len(valores_mes) if valores_mes else 0.0
-            serie.append(float(valor))
-            
-    return serie
+    if serie_est is not None and hasta_anho:
+        serie_est = serie_est.hasta(hasta_anho)
+    if serie_est is not None:
+        serie_est = serie_est.recortada()
+        
+    if serie_est is None:
+        return np.empty(0), np.empty(0, dtype=bool)
+
+    relleno_vecinas = _climatologia_vecinas(norm_ubicacion, hasta_anho) if imputacion == 'vecinas' else None
+    with tramo('imputacion'):
+        return imputar_serie(serie_est.valores, imputacion, relleno_vecinas)
 
-def predecir_precipitacion(mes, anho, ubicacion):
+
+def obtener_serie_temporal(ubicacion, hasta_anho=None, imputacion='media'):
+    """Obtiene la serie temporal continua de precipitaciones para una ubicación.
+
+    Devuelve `(serie, mascara)` como arrays de NumPy: la serie mensual desde el primer al último año
+    con datos, con los huecos rellenados según `imputacion` (ver IMPUTACIONES), y la máscara de
+    valores observados. Si no hay datos ambos arrays están vacíos.
     """
-    Predice la probabilidad de lluvia utilizando promedios ponderados y FFT.
+    return _serie_imputada(normalizar_nombre(ubicacion), hasta_anho, imputacion)
+
+
+# Resultados de _componente_fft por (estación, año de corte, imputación, versión: ver _version_fft)
+cache_fft = CacheLRU(max_items=1024)
+metricas.registrar_cache('fft', cache_fft.estadisticas)
+# Valor por defecto de cache_fft.obtener para distinguir un fallo de una FFT guardada como None
+_SIN_CALCULAR = object()
+# Memo de nombres normalizados (normalizacion.normalizar_nombre, con functools.lru_cache)
+metricas.registrar_cache('normalizar_nombre', estadisticas_lru(normalizar_nombre))
+
+
+def _version_fft(norm_ubicacion, imputacion):
+    """Versión de los datos de los que depende la FFT de una estación: los suyos o, con la imputación
+    'vecinas' (que lee otras estaciones), los de todas."""
+    if imputacion == 'vecinas':
+        return version_datos(), secuencia_observaciones()
+    return version_estacion(norm_ubicacion)
+
+
+@medido('fft')
+def componentes_fft_lote(series, ubicaciones):
+    """Componente FFT de varias series imputadas (1-D, una por estación) en una pasada por largo.
+
+    Las series de igual largo se apilan y pasan juntas por el núcleo de espectro.py. Devuelve, en el
+    orden recibido, `(medias_fft, conteos_fft, cv_series)` con 12 medias/conteos por mes, o None para
+    las series de menos de MESES_MINIMOS meses.
     """
-    norm_ubicacion = normalizar_nombre(ubicacion)
-    serie = obtener_serie_temporal(ubicacion, hasta_anho=anho)
+    resultados = [None] * len(series)
+    por_largo = {}
+    for i, serie in enumerate(series):
+        if serie.size >= MESES_MINIMOS:
+            por_largo.setdefault(serie.size, []).append(i)
+    for indices in por_largo.values():
+        medias, conteos, cv, recortadas = componentes_fft(np.stack([series[i] for i in indices]))
+        for fila, i in enumerate(indices):
+            if recortadas[fila]:
+                logger.info(f"Serie recortada para FFT ({ubicaciones[i]}) a sus percentiles 1-99")
+            resultados[i] = (medias[fila], conteos, cv[fila])
+    return resultados
+
+
+def _componente_fft(serie, ubicacion):
+    """Reconstruye la serie con las componentes FFT dominantes y resume el resultado por mes.
+
+    Solo depende de la estación y del año de corte, no del mes pedido. Devuelve
+    `(medias_fft, conteos_fft, cv_series)` con 12 medias/conteos por mes, o None si la serie
+    tiene menos de 24 meses.
+    """
+    return componentes_fft_lote([serie], [ubicacion])[0]
+
+
+def analizar_espectros(ubicaciones=None, hasta_anho=None, imputacion='media', cantidad=3):
+    """Periodos dominantes y perfil mensual FFT de varias estaciones (todas si `ubicaciones` es None).
+
+    Las series imputadas se transforman juntas (una `rfft` por largo de serie). Devuelve una lista
+    de dicts con `ubicacion`, `meses` (largo de la serie), `periodos` (los `cantidad` de mayor
+    amplitud, con `meses` y `amplitud` en mm) y `perfil` (las 12 medias de la serie reconstruida
+    que usa la predicción); las estaciones con menos de MESES_MINIMOS meses quedan con listas vacías.
+    """
+    nombres = nombres_estaciones()
+    if ubicaciones is None:
+        normas = sorted(nombres)
+    else:
+        normas = list(dict.fromkeys(normalizar_nombre(u) for u in ubicaciones))
+    series = [_serie_imputada(norm, hasta_anho=hasta_anho, imputacion=imputacion)[0] for norm in normas]
+    etiquetas = [nombres.get(norm, norm) for norm in normas]
+    fft = componentes_fft_lote(series, etiquetas)
+
+    resultado = [{'ubicacion': etiqueta, 'meses': int(serie.size), 'periodos': [], 'perfil': []}
+                 for etiqueta, serie in zip(etiquetas, series)]
+    por_largo = {}
+    for i, serie in enumerate(series):
+        if serie.size >= MESES_MINIMOS:
+            por_largo.setdefault(serie.size, []).append(i)
+    with tramo('fft'):
+        for indices in por_largo.values():
+            periodos, amplitudes = periodos_dominantes(np.stack([series[i] for i in indices]), cantidad)
+            for fila, i in enumerate(indices):
+                resultado[i]['periodos'] = [{'meses': float(p), 'amplitud': float(a)}
+                                            for p, a in zip(periodos[fila].tolist(), amplitudes[fila].tolist())]
+                resultado[i]['perfil'] = fft[i][0].tolist()
+    return resultado
+
+
+# Días de lluvia por año y mes de las estaciones con datos diarios, por (estación, versión de la estación)
+cache_dias_lluvia = CacheLRU(max_items=1024)
+metricas.registrar_cache('dias_lluvia', cache_dias_lluvia.estadisticas)
+
+
+def dias_lluvia(ubicacion_norm):
+    """Días de lluvia (≥ UMBRAL_DIA_LLUVIA) y días con dato de cada año y mes de una estación, según sus datos diarios.
+
+    Se agregan al vuelo desde PrecipitacionDiaria y se guardan en caché hasta que cambien los datos
+    de la estación. Devuelve `(anho_inicio, lluviosos, dias)` con matrices (años × 12), o None si la
+    estación no tiene datos diarios.
+    """
+    if not hay_diarias():
+        return None
+    return cache_dias_lluvia.obtener_o_calcular(
+        (ubicacion_norm, version_estacion(ubicacion_norm)),
+        lambda: _calcular_dias_lluvia(ubicacion_norm)
+    )
+
+
+@medido('bd')
+def _calcular_dias_lluvia(ubicacion_norm):
+    periodo = PrecipitacionDiaria.fecha // 100
+    filas = db.session.execute(
+        db.select(periodo,
+                  db.func.sum(db.case((PrecipitacionDiaria.valor >= UMBRAL_DIA_LLUVIA, 1), else_=0)),
+                  db.func.count(PrecipitacionDiaria.valor))
+        .where(PrecipitacionDiaria.ubicacion_norm == ubicacion_norm)
+        .group_by(periodo)
+    ).all()
+    if not filas:
+        return None
+    periodos, cuentas_lluvia, cuentas_dias = (np.array(columna) for columna in zip(*filas))
+    anhos, meses = np.divmod(periodos, 100)
+    anho_inicio = int(anhos.min())
+    forma = (int(anhos.max()) - anho_inicio + 1, 12)
+    lluviosos = np.zeros(forma, dtype=np.int32)
+    dias = np.zeros(forma, dtype=np.int32)
+    lluviosos[anhos - anho_inicio, meses - 1] = cuentas_lluvia
+    dias[anhos - anho_inicio, meses - 1] = cuentas_dias
+    return anho_inicio, lluviosos, dias
+
+
+def _frecuencias_lluvia(casos, dias):
+    """Fracción de días de lluvia (puntuacion.frecuencia_lluvia) de cada caso `(serie_est, mes_canon, anho, ...)`.
+
+    `dias` es la lista paralela de resultados de `dias_lluvia` (None sin datos diarios). Devuelve un
+    array con NaN en los casos sin datos diarios, o None si ninguno tiene.
+    """
+    con_dias = [i for i, d in enumerate(dias) if d is not None]
+    if not con_dias:
+        return None
+    inicio = min(dias[i][0] for i in con_dias)
+    fin = max(dias[i][0] + dias[i][1].shape[0] - 1 for i in con_dias)
+    lluviosos = np.zeros((len(con_dias), fin - inicio + 1), dtype=np.int32)
+    totales = np.zeros_like(lluviosos)
+    anhos_objetivo = np.empty(len(con_dias), dtype=int)
+    for fila, i in enumerate(con_dias):
+        anho_inicio, lluviosos_est, dias_est = dias[i]
+        columna = MESES_MAP[casos[i][1]] - 1
+        desde = anho_inicio - inicio
+        hasta = desde + lluviosos_est.shape[0]
+        lluviosos[fila, desde:hasta] = lluviosos_est[:, columna]
+        totales[fila, desde:hasta] = dias_est[:, columna]
+        anhos_objetivo[fila] = casos[i][2]
+    frecuencia = np.full(len(casos), np.nan)
+    frecuencia[con_dias] = frecuencia_lluvia(lluviosos, totales, np.arange(inicio, fin + 1), anhos_objetivo)
+    return frecuencia
+
+
+@medido('puntuacion')
+def _puntuar_casos(casos, dias=None):
+    """Evalúa casos `(serie_est, mes_canon, anho, fft, ubicacion)` con el núcleo vectorizado (puntuacion.puntuar).
+
+    Arma una matriz (casos × años) con la columna del mes pedido de cada estación y devuelve, en el
+    mismo orden, tuplas `(promedio, probabilidad, intensidad, emoji)`. Con `dias` (lista paralela de
+    `dias_lluvia`), la probabilidad de los casos con datos diarios es su frecuencia de días de lluvia.
+    """
+    resultados = [SIN_DATOS] * len(casos)
+    con_serie = [i for i, caso in enumerate(casos) if caso[0] is not None]
+    if not con_serie:
+        return resultados
+    frecuencia = _frecuencias_lluvia(casos, dias) if dias else None
+
+    inicio = min(casos[i][0].anho_inicio for i in con_serie)
+    fin = max(casos[i][0].anho_fin for i in con_serie)
+    n = len(con_serie)
+    valores = np.full((n, fin - inicio + 1), np.nan, dtype=np.float32)
+    presentes = np.zeros((n, fin - inicio + 1), dtype=bool)
+    anhos_objetivo = np.empty(n, dtype=int)
+    con_fft = np.zeros(n, dtype=bool)
+    fft_media = np.full(n, np.nan)
+    fft_conteo = np.zeros(n, dtype=int)
+    fft_cv = np.zeros(n)
+    etiquetas = []
+    for fila, i in enumerate(con_serie):
+        serie_est, mes_canon, anho, fft, ubicacion = casos[i]
+        columna = MESES_MAP[mes_canon] - 1
+        desde = serie_est.anho_inicio - inicio
+        hasta = desde + serie_est.valores.shape[0]
+        valores[fila, desde:hasta] = serie_est.valores[:, columna]
+        presentes[fila, desde:hasta] = serie_est.presentes[:, columna]
+        anhos_objetivo[fila] = anho
+        if fft is not None:
+            medias_fft, conteos_fft, cv_series = fft
+            con_fft[fila] = True
+            fft_media[fila] = medias_fft[columna]
+            fft_conteo[fila] = conteos_fft[columna]
+            fft_cv[fila] = cv_series
+        etiquetas.append(f"{ubicacion} {mes_canon}")
+
+    puntuados = a_tuplas(*puntuar(
+        valores, presentes, np.arange(inicio, fin + 1), anhos_objetivo,
+        con_fft, fft_media, fft_conteo, fft_cv, etiquetas=etiquetas,
+        frecuencia=frecuencia[con_serie] if frecuencia is not None else None
+    ))
+    for i, resultado in zip(con_serie, puntuados):
+        resultados[i] = resultado
+    return resultados
+
+
+# Ajustes de los modelos alternativos (modelos.py) por (modelo, estación, año de corte, versión de la estación)
+cache_modelos = CacheLRU(max_items=1024)
+metricas.registrar_cache('modelos', cache_modelos.estadisticas)
+
+
+@medido('puntuacion')
+def _puntuar_casos_modelo(casos, modelo, dias=None):
+    """Como `_puntuar_casos` pero con un modelo registrado en `modelos.MODELOS`.
+
+    El ajuste se calcula una vez por estación y año de corte efectivo: para años posteriores al
+    último con datos se reutiliza el mismo ajuste, así que pronosticar varios años futuros ajusta
+    cada estación una sola vez.
+    """
+    resultados = [SIN_DATOS] * len(casos)
+    frecuencia = _frecuencias_lluvia(casos, dias) if dias else None
+    grupos = {}
+    for i, (serie_est, _, anho, _, ubicacion) in enumerate(casos):
+        if serie_est is not None:
+            corte = min(anho, serie_est.anho_fin + 1)
+            grupos.setdefault((normalizar_nombre(ubicacion), corte, anho), []).append(i)
+
+    for (norm, corte, anho), indices in grupos.items():
+        serie_est = casos[indices[0]][0]
+        ajuste = cache_modelos.obtener_o_calcular(
+            (modelo, norm, corte, version_estacion(norm)),
+            lambda: ajustar_serie(modelo, serie_est.hasta(corte))
+        )
+        meses_num = [MESES_MAP[casos[i][1]] for i in indices]
+        frecuencias = frecuencia[indices] if frecuencia is not None else None
+        for i, resultado in zip(indices, a_tuplas(*predecir_ajuste(modelo, ajuste, anho, meses_num, frecuencias))):
+            resultados[i] = resultado
+    return resultados
+
+
+def predecir_precipitacion(mes, anho, ubicacion, imputacion='media', modelo=MODELO_POR_DEFECTO):
+    """
+    Predice la probabilidad de lluvia utilizando promedios ponderados y FFT (u otro modelo registrado).
+    """
+    return predecir_lote([(mes, anho, ubicacion)], imputacion=imputacion, modelo=modelo)[0]
+
+
+def predecir_lote(solicitudes, imputacion='media', modelo=MODELO_POR_DEFECTO):
+    """
+    Predice muchas combinaciones `(mes, anho, ubicacion)` en una sola llamada.
+
+    Agrupa las solicitudes por estación y año de corte: la serie, la FFT y su reconstrucción se
+    calculan una vez por grupo y se evalúan todos los meses pedidos sobre ese trabajo compartido.
+    Devuelve una lista de tuplas `(promedio, probabilidad, intensidad, emoji)` en el mismo orden
+    que las solicitudes, idénticas a las de `predecir_precipitacion`.
+    Con otro `modelo` (ver `modelos.nombres_modelos()`) no se calcula la FFT y se usa su ajuste
+    en caché; `imputacion` solo afecta al modelo por defecto.
+    """
+    grupos = {}
+    with tramo('normalizacion'):
+        for i, (mes, anho, ubicacion) in enumerate(solicitudes):
+            grupos.setdefault((normalizar_nombre(ubicacion), int(anho)), []).append(i)
+
+    resultados = [None] * len(solicitudes)
+    # Casos a puntuar juntos al final: (índice de la solicitud, grupo, mes_canon)
+    casos = []
+    series = {}
+    for grupo, indices in grupos.items():
+        series[grupo] = almacen.obtener(grupo[0])
+        for i in indices:
+            mes = solicitudes[i][0]
+            # Canonicalizar mes de entrada
+            mes_canon = canonicalizar_mes(mes)
+            if mes_canon is None:
+                logger.warning(f"Mes de entrada no reconocido en predecir_precipitacion: {mes}")
+                resultados[i] = SIN_DATOS
+                continue
+            casos.append((i, grupo, mes_canon))
+
+    # FFT de los grupos con algún mes válido: las que no están en caché se calculan juntas
+    ffts = {}
+    if modelo == MODELO_POR_DEFECTO:
+        claves = {}
+        faltantes = []
+        for grupo in dict.fromkeys(grupo for _, grupo, _ in casos):
+            claves[grupo] = (*grupo, imputacion, _version_fft(grupo[0], imputacion))
+            ffts[grupo] = cache_fft.obtener(claves[grupo], _SIN_CALCULAR)
+            if ffts[grupo] is _SIN_CALCULAR:
+                faltantes.append(grupo)
+        if faltantes:
+            calculadas = componentes_fft_lote(
+                [_serie_imputada(norm, hasta_anho=anho, imputacion=imputacion)[0] for norm, anho in faltantes],
+                [solicitudes[grupos[grupo][0]][2] for grupo in faltantes]
+            )
+            for grupo, fft in zip(faltantes, calculadas):
+                cache_fft.guardar(claves[grupo], fft)
+                ffts[grupo] = fft
+
+    # Días de lluvia de las estaciones con datos diarios (None para las demás)
+    dias = {norm: dias_lluvia(norm) for norm in dict.fromkeys(grupo[0] for _, grupo, _ in casos)}
+    puntuados = _puntuar([
+        (series[grupo], mes_canon, grupo[1], ffts.get(grupo), solicitudes[grupos[grupo][0]][2])
+        for _, grupo, mes_canon in casos
+    ], modelo, [dias[grupo[0]] for _, grupo, _ in casos])
+    for (i, _, _), resultado in zip(casos, puntuados):
+        resultados[i] = resultado
+    return resultados
 
-    # Canonicalizar mes de entrada
+
+def _puntuar(casos, modelo, dias=None):
+    if modelo == MODELO_POR_DEFECTO:
+        return _puntuar_casos(casos, dias)
+    return _puntuar_casos_modelo(casos, modelo, dias)
+
+# Estaciones vecinas que intervienen en la predicción de un punto sin estación
+VECINAS_INTERPOLACION = 4
+
+
+def predecir_punto(mes, anho, latitud, longitud, k=VECINAS_INTERPOLACION, imputacion='media', modelo=MODELO_POR_DEFECTO):
+    """Predicción para un punto sin estación: interpola por distancia inversa (IDW) las predicciones de las
+    `k` estaciones más cercanas (índice espacial), descartando las que no tienen datos.
+
+    Las predicciones de las vecinas salen de las precalculadas cuando existen (modelo e imputación por
+    defecto) y las demás se calculan en un solo `predecir_lote`. Se interpolan el promedio y la
+    probabilidad; la intensidad se clasifica sobre el promedio interpolado. Devuelve
+    `(resultado, vecinas)`: `resultado` como `predecir_precipitacion` y `vecinas` una lista de dicts
+    con `nombre`, `distancia_km`, `estimacion` y `peso` de las estaciones usadas.
+    """
     mes_canon = canonicalizar_mes(mes)
     if mes_canon is None:
-        logger.warning(f"Mes de entrada no reconocido en predecir_precipitacion: {mes}")
-        return None, 0.0, "N/A", "❓"
+        return SIN_DATOS, []
+    anho = int(anho)
+    vecinas = indice_estaciones.vecinas(latitud, longitud, k=k)
 
-    # Obtener datos históricos para el mes, limitados a los 5 años anteriores al año solicitado (usar mes canónico)
-    datos_all = Precipitacion.query.all()
-    datos_mes = [d for d in datos_all if normalizar_nombre(d.ubicacion) == norm_ubicacion and (canonicalizar_mes(d.mes) == mes_canon) and (anho - 5 <= d.anho < anho)]
+    resultados = {}
+    if imputacion == 'media' and modelo == MODELO_POR_DEFECTO:
+        for estacion, _ in vecinas:
+            precalculada = buscar_predicciones_cache(estacion['norm'], [anho]).get((MESES_MAP[mes_canon], anho))
+            if precalculada is not None:
+                resultados[estacion['norm']] = precalculada
+    pendientes = [estacion for estacion, _ in vecinas if estacion['norm'] not in resultados]
+    if pendientes:
+        calculadas = predecir_lote([(mes_canon, anho, e['nombre']) for e in pendientes], imputacion=imputacion,
+                                   modelo=modelo)
+        resultados.update({e['norm']: r for e, r in zip(pendientes, calculadas)})
 
-    # Si no hay datos en los últimos 5 años, ampliar la búsqueda a todo lo anterior
-    if not datos_mes:
-        datos_mes = [d for d in datos_all if normalizar_nombre(d.ubicacion) == norm_ubicacion and (canonicalizar_mes(d.mes) == mes_canon) and d.anho < anho]
+    con_datos = [(estacion, distancia, resultados[estacion['norm']]) for estacion, distancia in vecinas
+                 if resultados[estacion['norm']][0] is not None]
+    if not con_datos:
+        return SIN_DATOS, []
+    promedio, pesos = interpolar_idw([d for _, d, _ in con_datos], [r[0] for _, _, r in con_datos])
+    probabilidad = float(pesos @ np.array([r[1] for _, _, r in con_datos]))
+    clase = int(np.digitize(promedio, UMBRALES_INTENSIDAD))
+    return (promedio, probabilidad, INTENSIDADES[clase], EMOJIS[clase]), [{
+        'nombre': estacion['nombre'],
+        'distancia_km': distancia,
+        'estimacion': resultado[0],
+        'peso': float(peso),
+    } for (estacion, distancia, resultado), peso in zip(con_datos, pesos)]
 
-    if not datos_mes:
-        return None, 0.0, "N/A", "❓"
 
-    valores_est = [d.valor for d in datos_mes if d.valor is not None and d.valor >= 0]
-    
-    # Promedio Ponderado (más peso a los últimos 5 años) — usar media robusta (winsorized)
-    max_anho = max(d.anho for d in datos_mes)
-    vals = []
-    ws = []
-    for d in datos_mes:
-        if d.valor is not None and d.valor >= 0:
-            peso = 2.0 if (max_anho - d.anho) <= 5 else 1.0
-            vals.append(d.valor)
-            ws.append(peso)
-
-    if vals:
-        try:
-            promedio_est = robust_weighted_mean(vals, ws, lower_pct=0.05, upper_pct=0.95)
-            # Log si hubo winsorización significativa
-            vals_arr = np.array(vals, dtype=float)
-            clipped = winsorize(vals_arr, 0.05, 0.95)
-            if np.any(vals_arr != clipped):
-                lower, upper = np.nanpercentile(vals_arr, [5,95])
-                logger.info(f"Winsorizado valores_est para {ubicacion} {mes_canon} a rangos [{lower:.2f}, {upper:.2f}]")
-        except Exception as e:
-            logger.exception("Error calculando promedio_est robusto: %s", e)
-            promedio_est = float(np.mean(vals))
-    else:
-        promedio_est = 0.0
+def predecir_desde_serie(serie_est, anho, meses, ubicacion='', dias=None):
+    """
+    Predice varios meses de un año a partir de una SerieEstacion ya cargada, sin acceder a la BD.
+
+    Equivale a `predecir_lote` con la imputación por media; pensado para procesos de trabajo que
+    reciben la matriz de la estación en lugar de una sesión de BD. `dias` es el resultado de
+    `dias_lluvia` de la estación, si tiene datos diarios.
+    """
+    fft = None
+    recorte = serie_est.hasta(anho) if serie_est is not None else None
+    if recorte is not None:
+        recorte = recorte.recortada()
+    if recorte is not None:
+        fft = _componente_fft(imputar_serie(recorte.valores, 'media')[0], ubicacion)
+
+    meses_canon = [canonicalizar_mes(mes) for mes in meses]
+    casos = [(serie_est, m, anho, fft, ubicacion) for m in meses_canon if m is not None]
+    puntuados = iter(_puntuar_casos(casos, [dias] * len(casos) if dias is not None else None))
+    return [SIN_DATOS if m is None else next(puntuados) for m in meses_canon]
+
+
+def guardar_predicciones_cache(ubicacion_norm, anho, resultados):
+    """Guarda (reemplazando) las predicciones de los 12 meses de un año de una estación en PrediccionCache."""
+    db.session.connection().exec_driver_sql(
+        'INSERT INTO predicciones_cache (ubicacion_norm, mes_num, anho, promedio, probabilidad, intensidad, emoji) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (ubicacion_norm, mes_num, anho) DO UPDATE SET promedio = excluded.promedio, '
+        'probabilidad = excluded.probabilidad, intensidad = excluded.intensidad, emoji = excluded.emoji, '
+        'creado = CURRENT_TIMESTAMP',
+        [(ubicacion_norm, mes_num, anho, *resultado) for mes_num, resultado in enumerate(resultados, start=1)]
+    )
+
+
+@medido('bd')
+def buscar_predicciones_cache(ubicacion_norm, anhos):
+    """Predicciones precalculadas de una estación para los años dados: {(mes_num, anho): tupla}."""
+    filas = PrediccionCache.query.filter(
+        PrediccionCache.ubicacion_norm == ubicacion_norm,
+        PrediccionCache.anho.in_(list(anhos))
+    ).all()
+    return {(f.mes_num, f.anho): (f.promedio, f.probabilidad, f.intensidad, f.emoji) for f in filas}
+
 
-    if not serie or len(serie) < 24:
-        promedio = promedio_est
+def invalidar_predicciones_cache(ubicaciones_norm=None, desde_anho=None):
+    """Borra las predicciones precalculadas de las estaciones indicadas (o todas), opcionalmente solo las
+    de los años >= `desde_anho`."""
+    consulta = PrediccionCache.query
+    if ubicaciones_norm is not None:
+        consulta = consulta.filter(PrediccionCache.ubicacion_norm.in_(list(ubicaciones_norm)))
+    if desde_anho is not None:
+        consulta = consulta.filter(PrediccionCache.anho >= desde_anho)
+    consulta.delete(synchronize_session=False)
+
+
+def actualizar_climatologia(ubicaciones_norm=None):
+    """Recalcula la tabla Climatologia de las estaciones indicadas (o de todas).
+
+    Conteos, sumas, sumas de cuadrados y eventos extremos se agregan en SQL sobre los valores
+    originales; los percentiles (p5/p95/p99) se calculan sobre la matriz del almacén. Las estaciones
+    con meses completados desde datos diarios se resumen enteras desde su serie del almacén, que
+    incluye esos totales, para que la climatología coincida con lo que usa la predicción.
+    """
+    consulta = db.session.query(
+        Precipitacion.ubicacion_norm,
+        Precipitacion.mes_num,
+        db.func.count(Precipitacion.valor),
+        db.func.sum(Precipitacion.valor),
+        db.func.sum(Precipitacion.valor * Precipitacion.valor),
+        db.func.sum(db.case((Precipitacion.valor > UMBRAL_EXTREMO, 1), else_=0))
+    ).filter(Precipitacion.ubicacion_norm.isnot(None), Precipitacion.mes_num.isnot(None))
+    borrado = Climatologia.query
+    if ubicaciones_norm is not None:
+        ubicaciones_norm = list(ubicaciones_norm)
+        consulta = consulta.filter(Precipitacion.ubicacion_norm.in_(ubicaciones_norm))
+        borrado = borrado.filter(Climatologia.ubicacion_norm.in_(ubicaciones_norm))
+        series = {norm: almacen.obtener(norm) for norm in ubicaciones_norm}
     else:
-        # --- Lógica FFT ---
-        # Aplicar clipping robusto a la serie para proteger la FFT de picos extremos
-        serie_arr = np.array(serie, dtype=float)
-        if serie_arr.size == 0:
-            promedio = promedio_est
-        else:
-            lower_s, upper_s = np.nanpercentile(serie_arr, [1, 99])
-            serie_clipped = np.clip(serie_arr, lower_s, upper_s)
-            if np.any(serie_arr != serie_clipped):
-                logger.info(f"Serie recortada para FFT ({ubicacion}): bounds [{lower_s:.2f}, {upper_s:.2f}]")
-
-            fft_vals = np.fft.fft(serie_clipped)
-            fft_filtrada = np.zeros_like(fft_vals)
-            fft_filtrada[0] = fft_vals[0] # DC
-
-            # Mantener top 10% de componentes o al menos 3
-            n_comp = max(3, int(len(serie_clipped) * 0.1))
-            magnitudes = np.abs(fft_vals)
-            indices_picos = np.argsort(magnitudes)[-n_comp:]
-            for idx in indices_picos:
-                fft_filtrada[idx] = fft_vals[idx]
-
-            serie_reconstruida = np.fft.ifft(fft_filtrada).real
-
-            try:
-                mes_idx = MESES_LISTA.index(mes_canon)
-            except ValueError:
-                logger.warning(f"Mes canónico no encontrado en MESES_LISTA: {mes_canon}")
-                mes_idx = 0
-
-            # Valores reconstruidos para ese mes (todas las observaciones a ese mes en la serie)
-            valores_mes_fft = [serie_reconstruida[i] for i in range(len(serie_reconstruida)) if i % 12 == mes_idx]
-            promedio_fft = float(np.nanmean(valores_mes_fft)) if valores_mes_fft else float(np.nanmean(serie_reconstruida))
-
-            # Ajustar peso del FFT según cuántos valores mensuales reconstruidos haya (más datos -> más confianza)
-            n_fft = len(valores_mes_fft)
-            if n_fft >= 3:
-                w_fft = 0.6
-            elif n_fft >= 1:
-                w_fft = 0.3
-            else:
-                w_fft = 0.0
-
-            # Reducir peso FFT si la serie es extremadamente variable (evitar overfitting al ruido)
-            mean_series = np.mean(serie_clipped) if serie_clipped.size else 0.0
-            std_series = np.std(serie_clipped) if serie_clipped.size else 0.0
-            cv_series = (std_series / mean_series) if mean_series > 0 else np.inf
-            if cv_series > 1.0:
-                w_fft = max(0.0, w_fft * 0.5)
-
-            w_est = 1.0 - w_fft
-
-            promedio = (promedio_fft * w_fft) + (promedio_est * w_est)
-
-        # Asegurar resultado válido
-        if np.isnan(promedio) or promedio < 0:
-            promedio = float(promedio_est)
-            logger.debug(f"Predicción ajustada al promedio_est por NaN/negativo para {ubicacion} {mes_canon}")
-
-    # Probabilidad de lluvia (Heurística de probabilidad diaria basada en volumen mensual)
-    # En Paraguay, un mes de 150mm suele tener ~8-10 días de lluvia.
-    # Probabilidad diaria estimada = (Días de lluvia / 30)
-    dias_estimados = (promedio * 0.05) + 3 # Heurística: 100mm -> 8 días, 200mm -> 13 días
-    probabilidad = (dias_estimados / 30) * 100
-    probabilidad = min(100.0, max(0.0, probabilidad))
-
-    # Ajuste por variabilidad (si el mes es muy inestable, bajar probabilidad)
-    if len(valores_est) > 1:
-        desv = np.std(valores_est)
-        mean_val = np.mean(valores_est) if len(valores_est) else 0
-        cv = (desv / mean_val) if mean_val > 0 else 0
-        if cv > 0.8: # Alta variabilidad
-            probabilidad *= 0.8
-
-    # Clasificación por intensidad (ajustada)
-    if promedio < 20:
-        intensidad = "Escasa"
-        emoji = "☀️"
-    elif promedio < 70:
-        intensidad = "Moderada"
-        emoji = "☁️"
-    elif promedio < 150:
-        intensidad = "Abundante"
-        emoji = "🌦️"
-    elif promedio < 300:
-        intensidad = "Muy Abundante"
-        emoji = "🌧️"
+        series = almacen.cargar_todas()
+    borrado.delete(synchronize_session=False)
+    if ubicaciones_norm is None:
+        con_diarias = set(totales_diarios_completos())
     else:
-        intensidad = "Torrencial"
-        emoji = "⛈️"
-        probabilidad = min(100, probabilidad + 15)
+        con_diarias = {norm for norm in ubicaciones_norm if totales_diarios_completos(norm)}
+
+    filas = []
+    for norm, mes_num, n, suma, suma_cuadrados, n_extremos in consulta.group_by(Precipitacion.ubicacion_norm, Precipitacion.mes_num):
+        if norm in con_diarias:
+            continue
+        p5 = p95 = p99 = None
+        serie_est = series.get(norm)
+        if serie_est is not None and n:
+            columna = serie_est.valores[:, mes_num - 1]
+            p5, p95, p99 = (float(p) for p in np.percentile(valores_originales(columna[~np.isnan(columna)]), [5, 95, 99]))
+        filas.append(Climatologia(
+            ubicacion_norm=norm, mes_num=mes_num, n=n, suma=suma or 0.0, suma_cuadrados=suma_cuadrados or 0.0,
+            p5=p5, p95=p95, p99=p99, n_extremos=n_extremos or 0
+        ))
+    for norm in con_diarias:
+        serie_est = series.get(norm)
+        for mes_num in range(1, 13):
+            presentes = serie_est.presentes[:, mes_num - 1]
+            if not presentes.any():
+                continue
+            columna = serie_est.valores[presentes, mes_num - 1]
+            valores = valores_originales(columna[~np.isnan(columna)])
+            p5 = p95 = p99 = None
+            if valores.size:
+                p5, p95, p99 = (float(p) for p in np.percentile(valores, [5, 95, 99]))
+            filas.append(Climatologia(
+                ubicacion_norm=norm, mes_num=mes_num, n=int(valores.size), suma=float(valores.sum()),
+                suma_cuadrados=float(valores @ valores), p5=p5, p95=p95, p99=p99,
+                n_extremos=int((valores > UMBRAL_EXTREMO).sum())
+            ))
+    db.session.add_all(filas)
+    db.session.commit()
+
+
+def _actualizar_climatologia_mes(norm, mes_num, anterior, valor):
+    """Aplica a la fila de Climatologia de (estación, mes) el cambio de una observación de `anterior` a
+    `valor` (None si era nula o no existía, o si pasa a ser nula).
+
+    Conteo, suma, suma de cuadrados y eventos extremos se ajustan por diferencia; los percentiles se
+    recalculan con los valores de ese mes (una consulta por índice, tantos valores como años). Si la
+    estación todavía no tiene climatología no se toca: `obtener_climatologia` la calcula entera.
+    """
+    fila = Climatologia.query.filter_by(ubicacion_norm=norm, mes_num=mes_num).first()
+    if fila is None:
+        if Climatologia.query.filter_by(ubicacion_norm=norm).first() is None:
+            return
+        fila = Climatologia(ubicacion_norm=norm, mes_num=mes_num, n=0, suma=0.0, suma_cuadrados=0.0, n_extremos=0)
+        db.session.add(fila)
+    for v, signo in ((anterior, -1), (valor, 1)):
+        if v is not None:
+            fila.n += signo
+            fila.suma += signo * v
+            fila.suma_cuadrados += signo * v * v
+            fila.n_extremos += signo * int(v > UMBRAL_EXTREMO)
+    columna = db.session.execute(db.select(Precipitacion.valor).where(
+        Precipitacion.ubicacion_norm == norm, Precipitacion.mes_num == mes_num, Precipitacion.valor.isnot(None)
+    )).scalars().all()
+    fila.p5 = fila.p95 = fila.p99 = None
+    if columna:
+        # Mismo cálculo que actualizar_climatologia (sobre los valores guardados en float32)
+        fila.p5, fila.p95, fila.p99 = (float(p) for p in np.percentile(valores_originales(columna), [5, 95, 99]))
+
+
+@medido('bd')
+def obtener_climatologia(ubicacion_norm):
+    """Filas de Climatologia de una estación indexadas por mes (1-12); las calcula si aún no existen."""
+    filas = Climatologia.query.filter_by(ubicacion_norm=ubicacion_norm).all()
+    if not filas and almacen.obtener(ubicacion_norm) is not None:
+        actualizar_climatologia([ubicacion_norm])
+        filas = Climatologia.query.filter_by(ubicacion_norm=ubicacion_norm).all()
+    return {f.mes_num: f for f in filas}
+
+
+def leer_precipitaciones(ubicaciones_norm=None, tamanho_lote=TAMANHO_LOTE):
+    """Recorre las precipitaciones no nulas de la BD en lotes de `tamanho_lote` filas, sin cargarlas todas.
+
+    Cada lote es una lista de filas `(ubicacion_norm, ubicacion, anho, mes_num, valor)` ordenadas por
+    estación y en orden cronológico (usa el índice `(ubicacion_norm, anho, mes_num)`).
+    """
+    consulta = (
+        db.select(Precipitacion.ubicacion_norm, Precipitacion.ubicacion, Precipitacion.anho,
+                  Precipitacion.mes_num, Precipitacion.valor)
+        .where(Precipitacion.ubicacion_norm.isnot(None), Precipitacion.mes_num.isnot(None),
+               Precipitacion.valor.isnot(None))
+        .order_by(Precipitacion.ubicacion_norm, Precipitacion.anho, Precipitacion.mes_num)
+    )
+    if ubicaciones_norm is not None:
+        consulta = consulta.where(Precipitacion.ubicacion_norm.in_(list(ubicaciones_norm)))
+    resultado = db.session.execute(consulta.execution_options(yield_per=tamanho_lote))
+    for lote in resultado.partitions():
+        yield lote
 
-    return float(promedio), float(probabilidad), intensidad, emoji
 
+def _lotes_csv(origen, reporte, tamanho_lote=TAMANHO_LOTE):
+    """Filas válidas y no nulas de un CSV (ver `leer_csv`) en lotes con la forma de `leer_precipitaciones`."""
+    lote = []
+    for mes, anho, valor, ubicacion, norm, _ in leer_csv(origen, reporte):
+        if valor is not None:
+            lote.append((norm, ubicacion, anho, MESES_MAP[mes], valor))
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = []
+    if lote:
+        yield lote
+
+
+# Percentiles que estima resumir_en_flujo: los de la winsorización (5-95) y los cuartiles del IQR
+PERCENTILES_FLUJO = (0.05, 0.25, 0.75, 0.95)
+
+
+def resumir_en_flujo(origen=None, ventana=12, k=1.5):
+    """Estadísticos por estación y mes de todo un archivo, en una pasada y con memoria acotada.
+
+    `origen` es un CSV (ruta o archivo binario, en el formato de `importar_csv`) o None para leer la
+    BD. Las filas se leen en lotes (`leer_precipitaciones` / `leer_csv`) y se acumulan con los
+    estimadores de flujo.py, así que la memoria depende de la cantidad de estaciones y no de la de
+    filas. Por estación y mes (1-12): `n`, `media` y `desvio` (Welford, exactos), `minimo`,
+    `maximo`, `n_extremos` (> UMBRAL_EXTREMO), los percentiles `p5`/`p25`/`p75`/`p95` (P²: exactos
+    hasta `flujo.VALORES_EXACTOS` valores, aproximados después) y los límites IQR (`iqr_inferior`,
+    `iqr_superior`, con factor `k`) que usan `winsorize` e `iqr_bounds`.
+
+    Leyendo la BD, que entrega cada estación en orden cronológico, también se resume la media y el
+    desvío móviles de `ventana` meses (como `/api/estacionariedad`): `movil` con el mínimo y máximo
+    de la media móvil y el máximo del desvío. Un CSV no garantiza ese orden y deja `movil` en None;
+    a diferencia de la importación, en un CSV las filas repetidas se cuentan todas.
+
+    Devuelve `{'filas', 'rechazadas', 'estaciones': {norm: {'ubicacion', 'meses', 'movil'}}}`.
+    """
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, mode='rb') as fuente:
+            return resumir_en_flujo(fuente, ventana, k)
+
+    reporte = {'filas': 0, 'rechazadas': 0}
+    lotes = leer_precipitaciones() if origen is None else _lotes_csv(origen, reporte)
+    estaciones = {}
+    for lote in lotes:
+        if origen is None:
+            reporte['filas'] += len(lote)
+        for norm, ubicacion, _, mes_num, valor in lote:
+            estacion = estaciones.get(norm)
+            if estacion is None:
+                estacion = estaciones[norm] = {
+                    'ubicacion': ubicacion,
+                    'meses': {},
+                    'movil': VentanaMovil(ventana) if origen is None else None,
+                    'medias_moviles': [math.inf, -math.inf, -math.inf],
+                }
+            celda = estacion['meses'].get(mes_num)
+            if celda is None:
+                celda = estacion['meses'][mes_num] = [Welford(), CuantilesP2(PERCENTILES_FLUJO), valor, valor, 0]
+            celda[0].agregar(valor)
+            celda[1].agregar(valor)
+            celda[2] = min(celda[2], valor)
+            celda[3] = max(celda[3], valor)
+            celda[4] += valor > UMBRAL_EXTREMO
+            if estacion['movil'] is not None:
+                media, desvio = estacion['movil'].agregar(valor)
+                extremos = estacion['medias_moviles']
+                extremos[0] = min(extremos[0], media)
+                extremos[1] = max(extremos[1], media)
+                if not math.isnan(desvio):
+                    extremos[2] = max(extremos[2], desvio)
+
+    resumen = {}
+    for norm, estacion in estaciones.items():
+        meses = {}
+        for mes_num, (welford, cuantiles, minimo, maximo, n_extremos) in sorted(estacion['meses'].items()):
+            p5, p25, p75, p95 = cuantiles.valores()
+            meses[mes_num] = {
+                'n': welford.n,
+                'media': welford.media,
+                'desvio': None if math.isnan(welford.desvio) else welford.desvio,
+                'minimo': minimo,
+                'maximo': maximo,
+                'p5': p5,
+                'p25': p25,
+                'p75': p75,
+                'p95': p95,
+                'iqr_inferior': p25 - k * (p75 - p25),
+                'iqr_superior': p75 + k * (p75 - p25),
+                'n_extremos': n_extremos,
+            }
+        movil = None
+        if estacion['movil'] is not None:
+            media_min, media_max, desvio_max = estacion['medias_moviles']
+            movil = {
+                'ventana': ventana,
+                'media_min': media_min,
+                'media_max': media_max,
+                'desvio_max': desvio_max if desvio_max > -math.inf else None,
+            }
+        resumen[norm] = {'ubicacion': estacion['ubicacion'], 'meses': meses, 'movil': movil}
+    return {**reporte, 'estaciones': resumen}
+
+
+def _metricas_error(reales, predichos):
+    """Métricas de error (n, rmse, mae, sesgo, r2) para arrays paralelos de valores reales y predichos."""
+    n = int(reales.size)
+    if n == 0:
+        return {'n': 0, 'rmse': None, 'mae': None, 'sesgo': None, 'r2': None}
+    residuos = predichos - reales
+    ss_res = float(np.sum(residuos ** 2))
+    ss_tot = float(np.sum((reales - reales.mean()) ** 2))
+    return {
+        'n': n,
+        'rmse': float(np.sqrt(ss_res / n)),
+        'mae': float(np.mean(np.abs(residuos))),
+        'sesgo': float(np.mean(residuos)),
+        'r2': 1 - (ss_res / ss_tot) if ss_tot != 0 else None
+    }
+
+
+@medido('bd')
+def nombres_estaciones():
+    """Mapa nombre normalizado -> nombre original de todas las ubicaciones con datos."""
+    filas = (
+        db.session.query(Precipitacion.ubicacion_norm, db.func.min(Precipitacion.ubicacion))
+        .group_by(Precipitacion.ubicacion_norm)
+        .all()
+    )
+    return {norm: nombre for norm, nombre in filas if norm}
+
+
+def validar_walk_forward(anho_fin, ubicaciones=None, meses=None, ventana=5, imputacion='media', umbral_cola=UMBRAL_EXTREMO,
+                         progreso=None, modelo=MODELO_POR_DEFECTO):
+    """
+    Backtest walk-forward: para cada año de corte entre `anho_fin - ventana + 1` y `anho_fin`
+    predice cada mes observado usando solo los datos de años anteriores y lo compara con el real.
+
+    Los años de corte se recorren en orden por estación: con imputación por media las medias
+    mensuales de la serie se acumulan año a año en vez de recalcularse, y la FFT de cada
+    (estación, año) se calcula una vez y se comparte con `predecir_lote` vía `cache_fft`.
+    `ubicaciones` y `meses` en None significan todas las estaciones y todos los meses.
+
+    Devuelve un dict con los pares (real, predicho), las métricas globales y las tablas de error
+    por estación, por decil del valor real y para la cola (real > umbral_cola).
+    `progreso`, si se indica, se llama tras cada estación con `estaciones`, `total_estaciones` y `fraccion`.
+    `modelo` permite validar un modelo alternativo de `modelos.py` para compararlo con el por defecto.
+    """
+    nombres = nombres_estaciones()
+    if ubicaciones is None:
+        normas = sorted(nombres)
+    else:
+        normas = []
+        for u in ubicaciones:
+            norm = normalizar_nombre(u)
+            nombres.setdefault(norm, u)
+            if norm not in normas:
+                normas.append(norm)
+    meses_canon = MESES_LISTA if meses is None else [m for m in (canonicalizar_mes(m) for m in meses) if m]
+    meses_idx = [MESES_MAP[m] - 1 for m in meses_canon]
+    anhos_corte = range(anho_fin - ventana + 1, anho_fin + 1)
+    casos = []
+    reales_casos = []
+    for i, norm in enumerate(normas):
+        if progreso and i:
+            progreso(estaciones=i, total_estaciones=len(normas), fraccion=i / len(normas))
+        ubicacion = nombres.get(norm, norm)
+        # Antes de leer la serie: una escritura posterior cambia la clave en lugar de dejar datos viejos
+        version = _version_fft(norm, imputacion)
+        serie_est = almacen.obtener(norm)
+        completa = serie_est.recortada() if serie_est is not None else None
+        if completa is None:
+            continue
+        valores = completa.valores.astype(np.float64)
+        filas_presentes = np.flatnonzero(completa.presentes.any(axis=1))
+        sumas = np.zeros(12)
+        conteos = np.zeros(12)
+        acumuladas = 0
+
+        for anho in anhos_corte:
+            fila = anho - completa.anho_inicio
+            if fila < 0 or fila >= valores.shape[0]:
+                continue
+            # Meses con dato real en el año de corte (los que se validan)
+            objetivos = [(m, r) for m, r in zip(meses_canon, valores[fila, meses_idx]) if not np.isnan(r)]
+
+            # Acumular las filas nuevas en las sumas/conteos mensuales (estado incremental)
+            bloque = valores[acumuladas:fila]
+            sumas += np.nansum(bloque, axis=0)
+            conteos += np.count_nonzero(~np.isnan(bloque), axis=0)
+            acumuladas = fila
+            if not objetivos:
+                continue
+
+            def _fft_incremental(fila=fila):
+                anteriores = filas_presentes[filas_presentes < fila]
+                if anteriores.size == 0:
+                    return None
+                fin = anteriores[-1] + 1
+                if imputacion == 'media':
+                    medias = np.divide(sumas, conteos, out=np.zeros(12), where=conteos > 0)
+                    serie = np.where(np.isnan(valores[:fin]), medias[np.newaxis, :], valores[:fin]).ravel()
+                else:
+                    serie, _ = _serie_imputada(norm, hasta_anho=anho, imputacion=imputacion)
+                return _componente_fft(serie, ubicacion)
+
+            fft = None
+            if modelo == MODELO_POR_DEFECTO:
+                fft = cache_fft.obtener_o_calcular((norm, anho, imputacion, version), _fft_incremental)
+            for mes_canon, real in objetivos:
+                casos.append((serie_est, mes_canon, anho, fft, ubicacion))
+                reales_casos.append(real)
+
+    # Todas las predicciones de la validación se puntúan juntas
+    pares = []
+    reales = []
+    for (_, mes_canon, anho, _, ubicacion), real, (pred, *_) in zip(casos, reales_casos, _puntuar(casos, modelo)):
+        if pred is None:
+            continue
+        reales.append(real)
+        pares.append({
+            'predicho': float(pred),
+            'mes': mes_canon,
+            'anho': anho,
+            'ubicacion': ubicacion
+        })
+
+    # Los reales vienen de la matriz float32: recuperar el valor importado antes de compararlo
+    reales = valores_originales(reales) if reales else np.empty(0)
+    for p, real in zip(pares, reales):
+        p['real'] = float(real)
+    predichos = np.array([p['predicho'] for p in pares], dtype=float)
+
+    resultado = _metricas_error(reales, predichos)
+
+    por_estacion = []
+    ubicaciones_pares = np.array([p['ubicacion'] for p in pares])
+    for ubicacion in dict.fromkeys(ubicaciones_pares.tolist()):
+        sel = ubicaciones_pares == ubicacion
+        por_estacion.append({'ubicacion': ubicacion, **_metricas_error(reales[sel], predichos[sel])})
+
+    por_decil = []
+    if reales.size:
+        bordes = np.percentile(reales, np.linspace(0, 100, 11))
+        deciles = np.minimum(np.searchsorted(bordes[1:-1], reales, side='right'), 9)
+        for d in range(10):
+            sel = deciles == d
+            por_decil.append({
+                'decil': d + 1,
+                'desde': float(bordes[d]),
+                'hasta': float(bordes[d + 1]),
+                **_metricas_error(reales[sel], predichos[sel])
+            })
+
+    cola = reales > umbral_cola
+    resultado.update({
+        'pairs': pares,
+        'por_estacion': por_estacion,
+        'por_decil': por_decil,
+        'cola': {'umbral': umbral_cola, **_metricas_error(reales[cola], predichos[cola])}
+    })
+    return resultado
+
+@medido('bd')
 def contrastar_prediccion(mes, anho, ubicacion, prediccion_valor):
     """Contrasta una predicción con el valor real si existe en la BD."""
     norm_ubicacion = normalizar_nombre(ubicacion)
     real = Precipitacion.query.filter(
+        Precipitacion.ubicacion_norm == norm_ubicacion,
         Precipitacion.mes.ilike(mes),
         Precipitacion.anho == anho
-    ).all()
-    
-    real = [r for r in real if normalizar_nombre(r.ubicacion) == norm_ubicacion]
+    ).order_by(Precipitacion.id).first()
     
-    if real and real[0].valor is not None:
-        valor_real = real[0].valor
+    if real and real.valor is not None:
+        valor_real = real.valor
         error = abs(valor_real - prediccion_valor)
         return valor_real, error
     return None, None
@@ -0,0 +1,184 @@
+"""Índice espacial de las estaciones: consultas por rectángulo, k vecinas más cercanas e interpolación IDW.
+
+Las coordenadas de la tabla `estaciones` se reparten en una grilla uniforme de celdas de
+TAMANHO_CELDA grados. Una consulta por rectángulo solo mira las celdas que lo cubren y la búsqueda
+de vecinas recorre anillos de celdas alrededor del punto hasta que ninguna celda sin visitar puede
+tener algo más cerca que la k-ésima encontrada, así que ambas cuestan microsegundos aunque haya
+miles de estaciones.
+
+El índice se reconstruye (una consulta) la primera vez que se usa después de un cambio en la
+versión de datos; las altas, modificaciones y bajas de estaciones la incrementan con
+`registrar_cambio_datos`, también desde otros procesos. Las distancias son en km con la
+aproximación equirrectangular (suficiente a la escala de un país).
+"""
+import math
+
+import numpy as np
+
+from cache import version_datos
+from metricas import tramo
+from models import Estacion
+from normalizacion import normalizar_nombre
+
+# Lado de cada celda de la grilla, en grados
+TAMANHO_CELDA = 0.5
+
+# Kilómetros por grado de latitud
+KM_POR_GRADO = 111.32
+
+# Exponente de la ponderación por distancia inversa (pesos 1 / d^POTENCIA_IDW)
+POTENCIA_IDW = 2
+
+# Distancia (km) por debajo de la cual un punto se considera sobre la estación
+DISTANCIA_MINIMA_KM = 0.01
+
+
+def distancias_km(latitudes, longitudes, lat, lon):
+    """Distancias (km) desde (lat, lon) a cada punto, con la escala de longitud de la latitud de origen."""
+    return KM_POR_GRADO * np.hypot(latitudes - lat, (longitudes - lon) * math.cos(math.radians(lat)))
+
+
+def interpolar_idw(distancias, valores, potencia=POTENCIA_IDW):
+    """Promedio de `valores` ponderado por distancia inversa; si un punto está a menos de
+    DISTANCIA_MINIMA_KM se devuelve su valor. Devuelve `(valor, pesos normalizados)`."""
+    distancias = np.asarray(distancias, dtype=np.float64)
+    valores = np.asarray(valores, dtype=np.float64)
+    cercanos = distancias < DISTANCIA_MINIMA_KM
+    if cercanos.any():
+        pesos = cercanos.astype(np.float64)
+    else:
+        pesos = 1.0 / distancias ** potencia
+    pesos /= pesos.sum()
+    return float(pesos @ valores), pesos
+
+
+class _Grilla:
+    """Instantánea inmutable del índice: arreglos por estación y celda -> índices de estaciones."""
+
+    def __init__(self, estaciones, tamanho_celda):
+        self.tamanho_celda = tamanho_celda
+        self.estaciones = [e for e in estaciones if e['latitud'] is not None and e['longitud'] is not None]
+        self.latitudes = np.array([e['latitud'] for e in self.estaciones], dtype=np.float64)
+        self.longitudes = np.array([e['longitud'] for e in self.estaciones], dtype=np.float64)
+        self.por_norm = {e['norm']: i for i, e in enumerate(self.estaciones)}
+        filas = np.floor(self.latitudes / tamanho_celda).astype(int)
+        columnas = np.floor(self.longitudes / tamanho_celda).astype(int)
+        celdas = {}
+        for i, celda in enumerate(zip(filas.tolist(), columnas.tolist())):
+            celdas.setdefault(celda, []).append(i)
+        self.celdas = {celda: np.array(indices) for celda, indices in celdas.items()}
+        if celdas:
+            self.filas = (int(filas.min()), int(filas.max()))
+            self.columnas = (int(columnas.min()), int(columnas.max()))
+
+    def _celda(self, lat, lon):
+        return math.floor(lat / self.tamanho_celda), math.floor(lon / self.tamanho_celda)
+
+    def _anillo(self, fila, columna, r):
+        """Celdas a distancia (de Chebyshev) exactamente `r` de la celda dada, recortadas a la grilla."""
+        columnas = range(max(columna - r, self.columnas[0]), min(columna + r, self.columnas[1]) + 1)
+        for f in range(max(fila - r, self.filas[0]), min(fila + r, self.filas[1]) + 1):
+            if abs(f - fila) == r:
+                yield from ((f, c) for c in columnas)
+            else:
+                yield from ((f, c) for c in {columna - r, columna + r} if c in columnas)
+
+    def en_caja(self, sur, oeste, norte, este):
+        if not self.celdas:
+            return []
+        fila_min, columna_min = self._celda(sur, oeste)
+        fila_max, columna_max = self._celda(norte, este)
+        fila_min, fila_max = max(fila_min, self.filas[0]), min(fila_max, self.filas[1])
+        columna_min, columna_max = max(columna_min, self.columnas[0]), min(columna_max, self.columnas[1])
+        candidatos = [
+            self.celdas[(f, c)]
+            for f in range(fila_min, fila_max + 1) for c in range(columna_min, columna_max + 1)
+            if (f, c) in self.celdas
+        ]
+        if not candidatos:
+            return []
+        candidatos = np.sort(np.concatenate(candidatos))
+        lat, lon = self.latitudes[candidatos], self.longitudes[candidatos]
+        dentro = (lat >= sur) & (lat <= norte) & (lon >= oeste) & (lon <= este)
+        return [self.estaciones[i] for i in candidatos[dentro].tolist()]
+
+    def vecinas(self, lat, lon, k, excluir=None):
+        excluido = self.por_norm.get(excluir) if excluir is not None else None
+        disponibles = len(self.estaciones) - (excluido is not None)
+        k = min(k, disponibles)
+        if k <= 0:
+            return []
+        fila, columna = self._celda(lat, lon)
+        # Lo que queda fuera de los anillos 0..r está al menos a r celdas en latitud o en longitud
+        escala = KM_POR_GRADO * self.tamanho_celda * min(1.0, math.cos(math.radians(lat)))
+        alcance = max(abs(fila - self.filas[0]), abs(fila - self.filas[1]),
+                      abs(columna - self.columnas[0]), abs(columna - self.columnas[1]))
+        candidatos = []
+        cantidad = 0
+        for r in range(alcance + 1):
+            for celda in self._anillo(fila, columna, r):
+                indices = self.celdas.get(celda)
+                if indices is not None:
+                    candidatos.append(indices)
+                    cantidad += len(indices)
+            if cantidad - (excluido is not None) >= k:
+                indices = np.concatenate(candidatos)
+                if excluido is not None:
+                    indices = indices[indices != excluido]
+                distancias = distancias_km(self.latitudes[indices], self.longitudes[indices], lat, lon)
+                if np.partition(distancias, k - 1)[k - 1] <= r * escala:
+                    break
+        indices = np.concatenate(candidatos)
+        if excluido is not None:
+            indices = indices[indices != excluido]
+        distancias = distancias_km(self.latitudes[indices], self.longitudes[indices], lat, lon)
+        # Orden estable por distancia y, a igual distancia, por posición en la tabla
+        orden = np.lexsort((indices, distancias))[:k]
+        return [(self.estaciones[i], float(d)) for i, d in zip(indices[orden].tolist(), distancias[orden].tolist())]
+
+
+class IndiceEspacial:
+    """Índice de las estaciones con coordenadas, reconstruido cuando cambia la versión de datos."""
+
+    def __init__(self, tamanho_celda=TAMANHO_CELDA):
+        self.tamanho_celda = tamanho_celda
+        # (versión de datos, _Grilla) en un solo atributo para leerlos juntos sin lock
+        self._estado = (None, None)
+
+    def _actual(self):
+        version = version_datos()
+        version_grilla, grilla = self._estado
+        if grilla is not None and version_grilla == version:
+            return grilla
+        with tramo('bd'):
+            filas = Estacion.query.order_by(Estacion.id).all()
+        grilla = _Grilla([{
+            'id': e.id,
+            'nombre': e.nombre,
+            'norm': normalizar_nombre(e.nombre),
+            'latitud': e.latitud,
+            'longitud': e.longitud,
+            'departamento': e.departamento,
+        } for e in filas], self.tamanho_celda)
+        self._estado = (version, grilla)
+        return grilla
+
+    def en_caja(self, sur, oeste, norte, este):
+        """Estaciones dentro del rectángulo (bordes incluidos), en el orden de la tabla."""
+        with tramo('espacial'):
+            return self._actual().en_caja(sur, oeste, norte, este)
+
+    def vecinas(self, lat, lon, k=5, excluir=None):
+        """Las `k` estaciones más cercanas a (lat, lon) como `(estacion, distancia_km)`, de la más cercana
+        a la más lejana. `excluir` es un nombre normalizado que no se devuelve (la propia estación)."""
+        with tramo('espacial'):
+            return self._actual().vecinas(lat, lon, k, excluir)
+
+    def coordenadas(self, norm):
+        """(lat, lon) de una estación por nombre normalizado, o None si no está o no tiene coordenadas."""
+        grilla = self._actual()
+        i = grilla.por_norm.get(norm)
+        return None if i is None else (float(grilla.latitudes[i]), float(grilla.longitudes[i]))
+
+
+indice_estaciones = IndiceEspacial()
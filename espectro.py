@@ -0,0 +1,97 @@
+"""Núcleo espectral vectorizado: la componente FFT de muchas series mensuales con unas pocas operaciones de NumPy.
+
+Las series (ya imputadas, sin NaN) de igual largo se apilan en una matriz (series × meses) y se
+transforman juntas con `np.fft.rfft` a lo largo del tiempo. Por fila se recorta a los percentiles
+1–99, se conservan la componente continua y el 10 % de las componentes de mayor magnitud (al menos
+3), elegidas con `argpartition`, y la serie reconstruida se resume por mes.
+
+Equivale a filtrar el espectro completo de `np.fft.fft` como se hacía por estación: en una serie real
+las componentes k y N−k tienen la misma magnitud y aportan lo mismo a la parte real de la
+reconstrucción, así que al elegir las de mayor magnitud cada frecuencia de la media transformada
+cuenta dos veces (salvo la continua y la de Nyquist) y luego se pondera por cuántas de sus dos
+mitades quedaron elegidas.
+"""
+import numpy as np
+
+# Largo mínimo (meses) de una serie para calcular su componente FFT
+MESES_MINIMOS = 24
+
+# Fracción de las componentes del espectro completo que se conservan, y mínimo absoluto
+FRACCION_COMPONENTES = 0.1
+COMPONENTES_MINIMAS = 3
+
+
+def recortar(series):
+    """Recorta cada fila a sus percentiles 1 y 99. Devuelve `(recortadas, cambiadas)`, con `cambiadas`
+    True en las filas a las que el recorte modificó algún valor."""
+    inferior, superior = np.percentile(series, [1, 99], axis=1)
+    recortadas = np.clip(series, inferior[:, np.newaxis], superior[:, np.newaxis])
+    return recortadas, np.any(recortadas != series, axis=1)
+
+
+def reconstruir(espectro, n):
+    """Reconstruye series de largo `n` con la continua y las componentes dominantes de `espectro` (rfft por fila)."""
+    filas, frecuencias = espectro.shape
+    n_comp = max(COMPONENTES_MINIMAS, int(n * FRACCION_COMPONENTES))
+    # Magnitud de cada posición del espectro completo (la k y la N−k comparten frecuencia)
+    posiciones = np.arange(n)
+    magnitudes = np.abs(espectro)[:, np.minimum(posiciones, n - posiciones)]
+    elegidas = np.zeros((filas, n), dtype=bool)
+    np.put_along_axis(elegidas, np.argpartition(magnitudes, n - n_comp, axis=1)[:, n - n_comp:], True, axis=1)
+
+    # irfft duplica las frecuencias intermedias: cada mitad elegida aporta la mitad del coeficiente
+    pesos = elegidas[:, :frecuencias].astype(np.float64)
+    pesos[:, 1:n - frecuencias + 1] += elegidas[:, frecuencias:][:, ::-1]
+    pesos[:, 1:n - frecuencias + 1] /= 2
+    pesos[:, 0] = 1.0
+    return np.fft.irfft(espectro * pesos, n=n, axis=1)
+
+
+def componentes_fft(series):
+    """Componente FFT de cada fila de `series` (matriz series × meses sin NaN, desde enero).
+
+    Devuelve `(medias, conteos, cv, recortadas)`: la media por mes de cada serie reconstruida
+    (series × 12), cuántos valores forman cada media, el coeficiente de variación de cada serie
+    recortada (inf si su media no es positiva) y qué filas modificó el recorte.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    filas, n = series.shape
+    recortadas, cambiadas = recortar(series)
+    reconstruidas = reconstruir(np.fft.rfft(recortadas, axis=1), n)
+
+    # Completar con NaN hasta años enteros para resumir cada mes con una sola reducción
+    anhos = -(-n // 12)
+    por_mes = np.full((filas, anhos * 12), np.nan)
+    por_mes[:, :n] = reconstruidas
+    por_mes = por_mes.reshape(filas, anhos, 12)
+    conteos = np.count_nonzero(~np.isnan(por_mes[0]), axis=0)
+    medias = np.nanmean(por_mes, axis=1)
+
+    media = recortadas.mean(axis=1)
+    desvio = recortadas.std(axis=1)
+    cv = np.divide(desvio, media, out=np.full(filas, np.inf), where=media > 0)
+    return medias, conteos, cv, cambiadas
+
+
+def periodos_dominantes(series, cantidad=3):
+    """Las `cantidad` frecuencias de mayor amplitud (sin la continua) de cada fila de `series`, recortada
+    como en `componentes_fft`.
+
+    Devuelve `(periodos, amplitudes)`, matrices (series × cantidad) de mayor a menor amplitud: el
+    período en meses y la amplitud (mm) de la sinusoide correspondiente.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    n = series.shape[1]
+    espectro = np.fft.rfft(recortar(series)[0], axis=1)[:, 1:]
+    frecuencias = np.arange(1, espectro.shape[1] + 1)
+    # La de Nyquist (n par) no tiene pareja en el espectro completo
+    amplitudes = np.abs(espectro) * np.where(2 * frecuencias == n, 1.0, 2.0) / n
+    cantidad = min(cantidad, amplitudes.shape[1])
+    if cantidad <= 0:
+        vacio = np.empty((series.shape[0], 0))
+        return vacio, vacio
+    mayores = np.argpartition(amplitudes, -cantidad, axis=1)[:, -cantidad:]
+    mayores = np.take_along_axis(
+        mayores, np.argsort(-np.take_along_axis(amplitudes, mayores, axis=1), axis=1, kind='stable'), axis=1
+    )
+    return n / frecuencias[mayores], np.take_along_axis(amplitudes, mayores, axis=1)
@@ -0,0 +1,181 @@
+"""Estadísticos en una sola pasada y con memoria acotada, para recorrer archivos más grandes que la RAM.
+
+Cada acumulador recibe los valores de a uno (o por lotes) y guarda un estado de tamaño fijo:
+
+- `Welford`: conteo, media y varianza (algoritmo de Welford; los lotes se combinan con la fórmula de
+  Chan et al., así que se pueden unir acumuladores parciales).
+- `CuantilesP2`: cuantiles aproximados con el algoritmo P² extendido a varios cuantiles (Jain y
+  Chlamtac 1985; Raatikainen 1987): 2k + 3 marcadores para k cuantiles, ajustados con interpolación
+  parabólica. Hasta `VALORES_EXACTOS` valores se guardan tal cual y el resultado es exacto
+  (`np.percentile`); los marcadores parten de los cuantiles exactos de esos primeros valores.
+- `VentanaMovil`: media y desvío de los últimos `ventana` valores, como `estadisticas_moviles` de
+  data_processor pero un valor por vez.
+"""
+import math
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+import numpy as np
+
+# Valores que CuantilesP2 guarda antes de pasar a los marcadores (una celda estación × mes de una
+# serie mensual no suele superarlos, así que sus percentiles son exactos)
+VALORES_EXACTOS = 256
+
+
+class Welford:
+    """Conteo, media y varianza muestral en línea."""
+
+    __slots__ = ('n', 'media', '_m2')
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self._m2 = 0.0
+
+    def agregar(self, x):
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self._m2 += delta * (x - self.media)
+
+    def agregar_lote(self, valores):
+        """Agrega un array de valores con NumPy (media y suma de cuadrados del lote, luego se combinan)."""
+        valores = np.asarray(valores, dtype=np.float64)
+        if valores.size:
+            media = float(valores.mean())
+            self._combinar(valores.size, media, float(np.sum((valores - media) ** 2)))
+
+    def combinar(self, otro):
+        """Suma al acumulador los valores de `otro` (por ejemplo, el de otro lote o proceso)."""
+        if otro.n:
+            self._combinar(otro.n, otro.media, otro._m2)
+
+    def _combinar(self, n, media, m2):
+        total = self.n + n
+        delta = media - self.media
+        self._m2 += m2 + delta * delta * self.n * n / total
+        self.media += delta * n / total
+        self.n = total
+
+    @property
+    def varianza(self):
+        """Varianza muestral (NaN con menos de dos valores)."""
+        return self._m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def desvio(self):
+        return math.sqrt(self.varianza) if self.n > 1 else math.nan
+
+
+class CuantilesP2:
+    """Estimación en línea de varios cuantiles (probabilidades en (0, 1)) con el algoritmo P² extendido."""
+
+    __slots__ = ('probabilidades', '_deseadas', '_incrementos', '_alturas', '_posiciones', '_inicio', 'n')
+
+    def __init__(self, probabilidades):
+        self.probabilidades = sorted(probabilidades)
+        if not self.probabilidades or self.probabilidades[0] <= 0 or self.probabilidades[-1] >= 1:
+            raise ValueError('Las probabilidades deben estar en (0, 1)')
+        # Marcadores: extremos, cada cuantil y los puntos medios entre ellos
+        puntos = [0.0] + self.probabilidades + [1.0]
+        self._incrementos = [0.0]
+        for anterior, siguiente in zip(puntos, puntos[1:]):
+            self._incrementos += [(anterior + siguiente) / 2, siguiente]
+        self._deseadas = None
+        self._alturas = None
+        self._posiciones = None
+        self._inicio = array('d')
+        self.n = 0
+
+    def agregar(self, x):
+        self.n += 1
+        if self._alturas is None:
+            self._inicio.append(x)
+            if len(self._inicio) == VALORES_EXACTOS:
+                self._iniciar_marcadores()
+            return
+
+        q, pos = self._alturas, self._posiciones
+        m = len(q)
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[-1]:
+            q[-1] = x
+            k = m - 2
+        else:
+            k = bisect_right(q, x) - 1
+        for i in range(k + 1, m):
+            pos[i] += 1
+        for i in range(m):
+            self._deseadas[i] += self._incrementos[i]
+
+        for i in range(1, m - 1):
+            d = self._deseadas[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                altura = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1])
+                )
+                if not q[i - 1] < altura < q[i + 1]:
+                    # La parábola se sale del intervalo: interpolación lineal hacia el vecino
+                    altura = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = altura
+                pos[i] += d
+
+    def _iniciar_marcadores(self):
+        ultima = len(self._inicio) - 1
+        self._deseadas = [ultima * p for p in self._incrementos]
+        self._alturas = [float(v) for v in np.percentile(self._inicio, [p * 100 for p in self._incrementos])]
+        self._posiciones = [round(d) for d in self._deseadas]
+        self._inicio = None
+
+    def agregar_lote(self, valores):
+        for x in np.asarray(valores, dtype=np.float64).tolist():
+            self.agregar(x)
+
+    def valores(self):
+        """Cuantiles estimados en el orden de `probabilidades` (NaN si todavía no hay valores)."""
+        if self._alturas is None:
+            if not self._inicio:
+                return [math.nan] * len(self.probabilidades)
+            return [float(v) for v in np.percentile(self._inicio, [p * 100 for p in self.probabilidades])]
+        # Los cuantiles son los marcadores 2, 4, ... (entre cada par queda un punto medio)
+        return [self._alturas[2 * (i + 1)] for i in range(len(self.probabilidades))]
+
+
+class VentanaMovil:
+    """Media y desvío muestral de los últimos `ventana` valores, actualizados en O(1) por valor."""
+
+    __slots__ = ('ventana', '_valores', '_estadistico', '_quitados')
+
+    def __init__(self, ventana=12):
+        self.ventana = ventana
+        self._valores = deque()
+        self._estadistico = Welford()
+        self._quitados = 0
+
+    def agregar(self, x):
+        """Agrega `x` y devuelve `(media, desvio)` de la ventana (desvío NaN con un solo valor)."""
+        est = self._estadistico
+        if len(self._valores) == self.ventana:
+            viejo = self._valores.popleft()
+            self._quitados += 1
+            if self._quitados == self.ventana:
+                # Recalcular desde la ventana cada `ventana` pasos: el error de redondeo no se acumula
+                self._quitados = 0
+                est = self._estadistico = Welford()
+                est.agregar_lote(self._valores)
+            elif est.n == 1:
+                est.n, est.media, est._m2 = 0, 0.0, 0.0
+            else:
+                # Welford inverso: quitar el valor más viejo
+                media = (est.n * est.media - viejo) / (est.n - 1)
+                est._m2 = max(est._m2 - (viejo - est.media) * (viejo - media), 0.0)
+                est.media = media
+                est.n -= 1
+        self._valores.append(x)
+        est.agregar(x)
+        return est.media, est.desvio
@@ -0,0 +1,60 @@
+"""Formatos de respuesta de las series largas (`/api/estacionariedad`, `/api/historico`), elegidos por `Accept`.
+
+- `application/json` (por defecto, también con `*/*` o sin `Accept`): lista de objetos, uno por punto.
+- `application/vnd.precipita.columnas+json`: un objeto con los metadatos de la serie y un arreglo
+  paralelo por columna (`null` donde no hay dato; floats redondeados a 3 decimales).
+- `application/vnd.precipita.columnas`: binario. Un uint32 little-endian con el largo L de una cabecera
+  JSON UTF-8 (rellenada con espacios hasta un múltiplo de 4), la cabecera (`n`, `columnas` y los mismos
+  metadatos) y luego cada columna de `columnas`, en orden, como `n` float32 little-endian (NaN donde
+  no hay dato, 0/1 en las columnas booleanas). En el navegador cada columna es un
+  `new Float32Array(buffer, 4 + L + i * n * 4, n)`, sin copiar ni parsear números.
+"""
+import json
+import struct
+
+import numpy as np
+from flask import current_app, jsonify, request
+
+from metricas import tramo
+
+MIME_JSON = 'application/json'
+MIME_COLUMNAS_JSON = 'application/vnd.precipita.columnas+json'
+MIME_COLUMNAS_BINARIO = 'application/vnd.precipita.columnas'
+FORMATOS = (MIME_JSON, MIME_COLUMNAS_JSON, MIME_COLUMNAS_BINARIO)
+
+
+def formato_pedido():
+    """Formato negociado con la cabecera `Accept` del pedido en curso (uno de FORMATOS)."""
+    return request.accept_mimetypes.best_match(FORMATOS, default=MIME_JSON)
+
+
+def _lista(columna, decimales):
+    columna = np.asarray(columna)
+    if columna.dtype.kind != 'f':
+        return columna.tolist()
+    columna = np.round(columna, decimales)
+    nulos = np.isnan(columna)
+    if nulos.any():
+        return np.where(nulos, None, columna).tolist()
+    return columna.tolist()
+
+
+def respuesta_columnas(columnas, metadatos, formato, decimales=3):
+    """Respuesta columnar (JSON o binaria según `formato`) de `columnas`, un dict nombre -> arreglo 1-D.
+
+    Todas las columnas tienen el mismo largo; `metadatos` (serializable a JSON) acompaña a las columnas
+    para que el cliente reconstruya etiquetas y posiciones.
+    """
+    if formato == MIME_COLUMNAS_BINARIO:
+        with tramo('serializacion'):
+            n = len(next(iter(columnas.values()))) if columnas else 0
+            cabecera = json.dumps({'n': n, 'columnas': list(columnas), **metadatos},
+                                  separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            cabecera += b' ' * (-len(cabecera) % 4)
+            cuerpo = b''.join([struct.pack('<I', len(cabecera)), cabecera]
+                              + [np.asarray(c, dtype='<f4').tobytes() for c in columnas.values()])
+        return current_app.response_class(cuerpo, mimetype=MIME_COLUMNAS_BINARIO)
+
+    respuesta = jsonify({**metadatos, **{nombre: _lista(c, decimales) for nombre, c in columnas.items()}})
+    respuesta.mimetype = MIME_COLUMNAS_JSON
+    return respuesta
@@ -0,0 +1,15 @@
+"""Configuración de gunicorn; los valores se pueden ajustar con variables de entorno."""
+import multiprocessing
+import os
+
+bind = os.environ.get('PRECIPITA_BIND', '0.0.0.0:5002')
+workers = int(os.environ.get('PRECIPITA_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Hilos por worker: las lecturas en SQLite (WAL) y numpy liberan el GIL buena parte del tiempo
+worker_class = 'gthread'
+threads = int(os.environ.get('PRECIPITA_THREADS', 4))
+# Las importaciones grandes por /api/upload pueden tardar más que el timeout por defecto (30 s)
+timeout = int(os.environ.get('PRECIPITA_TIMEOUT', 300))
+# Importar la aplicación una vez en el maestro: reinicios de workers sin volver a cargar Flask/NumPy.
+# create_app no abre conexiones, así que los workers no comparten sockets de SQLite tras el fork.
+preload_app = True
+accesslog = '-'
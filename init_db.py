@@ -1,6 +1,8 @@
 import os
-from app import app, db
-from data_processor import importar_csv, poblar_estaciones
+from app import create_app
+from data_processor import inicializar_datos
+
+app = create_app()
 
 def init_database():
     """Borra la base de datos actual y la recrea desde cero."""
@@ -11,20 +13,25 @@ def init_database():
     if os.path.exists(db_path):
         print(f"Eliminando base de datos existente en: {db_path}")
         os.remove(db_path)
+    # Archivos auxiliares del modo WAL
+    for sufijo in ('-wal', '-shm'):
+        if os.path.exists(db_path + sufijo):
+            os.remove(db_path + sufijo)
     
     with app.app_context():
-        print("Creando tablas...")
-        db.create_all()
-        
-        csv_path = os.path.join(os.path.dirname(__file__), 'precipitaciones.csv')
-        if os.path.exists(csv_path):
-            print(f"Importando datos desde {csv_path}...")
-            importar_csv(csv_path)
-            print("Poblando estaciones...")
-            poblar_estaciones()
+        csv_path = app.config['CSV_INICIAL']
+        instantanea = app.config['INSTANTANEA']
+        if os.path.exists(instantanea):
+            print(f"Creando tablas e importando datos desde la instantánea {instantanea}...")
+            inicializar_datos(csv_path, instantanea)
+            print("¡Importación completada!")
+        elif os.path.exists(csv_path):
+            print(f"Creando tablas e importando datos desde {csv_path}...")
+            inicializar_datos(csv_path)
             print("¡Importación completada!")
         else:
             print("Advertencia: No se encontró el archivo precipitaciones.csv")
+            inicializar_datos()
             
     print("--- Proceso finalizado con éxito ---")
 
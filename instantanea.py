@@ -0,0 +1,155 @@
+"""Instantánea binaria del conjunto de datos, abierta con `np.memmap` y compartida por todos los procesos.
+
+Formato del archivo (little-endian):
+
+- 8 bytes: MAGIA.
+- uint32: largo L de la cabecera JSON (UTF-8, rellenada con espacios para que los datos empiecen
+  en un múltiplo de ALINEACION). La cabecera lleva `identificador` (el que se guarda en estado_datos
+  de la BD de origen), `version_datos` y `secuencia` (versión global y secuencia de observaciones
+  de los datos exportados), `anho_inicio` y `anhos` (años del cubo), la tabla `estaciones` (nombre,
+  latitud, longitud, departamento) y `series`: por cada fila del cubo, `norm`, `ubicacion` (nombre
+  con el que se guardan sus filas) y el rango `[desde, hasta)` de años de su SerieEstacion, relativo
+  a `anho_inicio`; y `diarias`: por estación con datos diarios, `norm` y la cantidad de `filas`.
+- El cubo de valores: float32 (series × anhos × 12), NaN donde falta el dato.
+- El cubo de presencia: uint8 con la misma forma, 1 donde la BD tiene fila (aunque el valor sea nulo).
+- Las precipitaciones diarias, en el orden de `diarias`: las fechas (int32 AAAAMMDD) de todas las
+  filas y después sus valores (float32, NaN si el día es nulo).
+
+El cubo guarda solo las filas de la tabla mensual; los totales derivados de datos diarios se vuelven
+a agregar al leer cada serie (ver almacen.py).
+
+Al abrirla no se parsea nada: las series son vistas de solo lectura sobre el mapeo del archivo, y
+los workers de gunicorn comparten las mismas páginas de la caché del sistema operativo.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from almacen import SerieEstacion
+
+MAGIA = b'PRECSNP1'
+ALINEACION = 64
+
+
+class Instantanea:
+    """Instantánea abierta: cabecera más los cubos de valores y presencia mapeados en memoria."""
+
+    def __init__(self, ruta, cabecera, valores, presentes, fechas_diarias=None, valores_diarios=None):
+        self.ruta = ruta
+        self.identificador = cabecera['identificador']
+        self.version_datos = cabecera['version_datos']
+        # Las instantáneas anteriores a la secuencia de observaciones equivalen a secuencia 0
+        self.secuencia = cabecera.get('secuencia', 0)
+        self.anho_inicio = cabecera['anho_inicio']
+        self.estaciones = cabecera['estaciones']
+        self.ubicaciones = {s['norm']: s['ubicacion'] for s in cabecera['series']}
+        self._filas = {s['norm']: (i, s['desde'], s['hasta']) for i, s in enumerate(cabecera['series'])}
+        self.valores = valores
+        self.presentes = presentes
+        # Las instantáneas anteriores a los datos diarios no tienen la sección
+        self._diarias = []
+        desde = 0
+        for estacion in cabecera.get('diarias', []):
+            hasta = desde + estacion['filas']
+            self._diarias.append((estacion['norm'], fechas_diarias[desde:hasta], valores_diarios[desde:hasta]))
+            desde = hasta
+
+    def serie(self, norm):
+        """SerieEstacion de una estación (vistas sobre el mapeo, sin copiar) o None si no tiene datos."""
+        fila = self._filas.get(norm)
+        if fila is None:
+            return None
+        i, desde, hasta = fila
+        return SerieEstacion(self.anho_inicio + desde, self.valores[i, desde:hasta], self.presentes[i, desde:hasta])
+
+    def series(self):
+        """{ubicacion_norm: SerieEstacion} de todas las estaciones con datos."""
+        return {norm: self.serie(norm) for norm in self._filas}
+
+    def diarias(self):
+        """Lista de `(ubicacion_norm, fechas AAAAMMDD, valores)` con las precipitaciones diarias de cada estación."""
+        return self._diarias
+
+
+def exportar(ruta, series, ubicaciones, estaciones, version_datos, secuencia, identificador, diarias=None):
+    """Escribe la instantánea en `ruta` (en un temporal que luego la reemplaza de forma atómica).
+
+    `series` es {ubicacion_norm: SerieEstacion} con las filas mensuales, `ubicaciones`
+    {ubicacion_norm: nombre de sus filas}, `estaciones` una lista de dicts con nombre, latitud,
+    longitud y departamento y `diarias` {ubicacion_norm: (fechas, valores)} con las precipitaciones
+    diarias (valores None o NaN si el día es nulo). Devuelve el tamaño del archivo en bytes.
+    """
+    diarias = diarias or {}
+    series = {norm: s for norm, s in sorted(series.items()) if s is not None}
+    anho_inicio = min((s.anho_inicio for s in series.values()), default=0)
+    anho_fin = max((s.anho_fin for s in series.values()), default=anho_inicio - 1)
+    anhos = anho_fin - anho_inicio + 1
+    cabecera = {
+        'identificador': identificador,
+        'version_datos': version_datos,
+        'secuencia': secuencia,
+        'anho_inicio': anho_inicio,
+        'anhos': anhos,
+        'estaciones': estaciones,
+        'series': [{
+            'norm': norm,
+            'ubicacion': ubicaciones.get(norm, norm),
+            'desde': s.anho_inicio - anho_inicio,
+            'hasta': s.anho_fin + 1 - anho_inicio,
+        } for norm, s in series.items()],
+        'diarias': [{'norm': norm, 'filas': len(fechas)} for norm, (fechas, _) in diarias.items()],
+    }
+    texto = json.dumps(cabecera, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    texto += b' ' * (-(len(MAGIA) + 4 + len(texto)) % ALINEACION)
+
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(MAGIA + struct.pack('<I', len(texto)) + texto)
+        # Un bloque (anhos × 12) por estación: la memoria no depende de la cantidad de estaciones
+        for s in series.values():
+            bloque = np.full((anhos, 12), np.nan, dtype='<f4')
+            bloque[s.anho_inicio - anho_inicio:s.anho_fin + 1 - anho_inicio] = s.valores
+            f.write(bloque.tobytes())
+        for s in series.values():
+            bloque = np.zeros((anhos, 12), dtype=np.uint8)
+            bloque[s.anho_inicio - anho_inicio:s.anho_fin + 1 - anho_inicio] = s.presentes
+            f.write(bloque.tobytes())
+        for fechas, _ in diarias.values():
+            f.write(np.asarray(fechas, dtype='<i4').tobytes())
+        for _, valores in diarias.values():
+            f.write(np.array([np.nan if v is None else v for v in valores], dtype='<f4').tobytes())
+    os.replace(temporal, ruta)
+    return os.path.getsize(ruta)
+
+
+def abrir(ruta):
+    """Abre una instantánea de `exportar`. Lanza ValueError si el archivo no tiene el formato esperado."""
+    with open(ruta, 'rb') as f:
+        inicio = f.read(len(MAGIA) + 4)
+        if len(inicio) < len(MAGIA) + 4 or inicio[:len(MAGIA)] != MAGIA:
+            raise ValueError(f'{ruta} no es una instantánea de precipitaciones')
+        largo = struct.unpack('<I', inicio[len(MAGIA):])[0]
+        cabecera = json.loads(f.read(largo))
+    forma = (len(cabecera['series']), cabecera['anhos'], 12)
+    filas_diarias = sum(estacion['filas'] for estacion in cabecera.get('diarias', []))
+    desplazamiento = len(MAGIA) + 4 + largo
+    tamanho_valores = int(np.prod(forma)) * 4
+    if os.path.getsize(ruta) != desplazamiento + tamanho_valores + tamanho_valores // 4 + filas_diarias * 8:
+        raise ValueError(f'{ruta}: tamaño inconsistente con la cabecera (¿archivo truncado?)')
+    # np.asarray: vistas ndarray comunes (no np.memmap) que mantienen vivo el mapeo
+    if forma[0] and forma[1]:
+        valores = np.asarray(np.memmap(ruta, dtype='<f4', mode='r', offset=desplazamiento, shape=forma))
+        presentes = np.asarray(np.memmap(ruta, dtype=np.bool_, mode='r', offset=desplazamiento + tamanho_valores,
+                                         shape=forma))
+    else:
+        valores, presentes = np.empty(forma, dtype=np.float32), np.zeros(forma, dtype=bool)
+    fechas_diarias = valores_diarios = None
+    if filas_diarias:
+        inicio_diarias = desplazamiento + tamanho_valores + tamanho_valores // 4
+        fechas_diarias = np.asarray(np.memmap(ruta, dtype='<i4', mode='r', offset=inicio_diarias,
+                                              shape=(filas_diarias,)))
+        valores_diarios = np.asarray(np.memmap(ruta, dtype='<f4', mode='r', offset=inicio_diarias + filas_diarias * 4,
+                                               shape=(filas_diarias,)))
+    return Instantanea(ruta, cabecera, valores, presentes, fechas_diarias, valores_diarios)
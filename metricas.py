@@ -0,0 +1,260 @@
+"""Instrumentación de pedidos y etapas internas: tramos medidos, histogramas Prometheus y perfilado opcional.
+
+- `tramo(nombre)` (context manager) y `@medido(nombre)` (decorador) miden una etapa: consulta a la
+  BD, armado de la serie, FFT, puntuación, serialización... Cada medición alimenta el histograma
+  `precipita_etapa_segundos` y, dentro de un pedido, la cabecera `Server-Timing` de la respuesta.
+- `metricas.init_app(app)`: registra los hooks que miden cada pedido por ruta y agregan `Server-Timing`.
+  Con `PERFILADO` activo en la configuración, un pedido con la cabecera `X-Perfil: 1` o el parámetro
+  `?perfil=1` se ejecuta bajo cProfile y el volcado queda en `instance/perfiles/` (cabecera `X-Perfil`).
+- `metricas.exponer()`: texto en formato de exposición de Prometheus para `/api/metrics`.
+
+Los valores son por proceso: con varios workers cada uno expone los suyos.
+"""
+import bisect
+import contextvars
+import cProfile
+import functools
+import os
+import threading
+import time
+
+from flask import current_app, g, request
+from flask.json.provider import DefaultJSONProvider
+
+# Límites (segundos) de los buckets de los histogramas
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tramos del pedido en curso: {nombre: [segundos, veces]} (None fuera de un pedido)
+_tramos_pedido = contextvars.ContextVar('tramos_pedido', default=None)
+
+
+class Histograma:
+    """Histograma acumulado por combinación de etiquetas, con los buckets de BUCKETS."""
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valores_etiquetas, segundos):
+        indice = bisect.bisect_left(BUCKETS, segundos)
+        with self._lock:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += segundos
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self._lock:
+            series = [(clave, list(conteos), suma, n) for clave, (conteos, suma, n) in sorted(self._series.items())]
+        for clave, conteos, suma, n in series:
+            etiquetas = _etiquetas(zip(self.etiquetas, clave))
+            acumulado = 0
+            for limite, conteo in zip(BUCKETS, conteos):
+                acumulado += conteo
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="+Inf"}} {n}')
+            lineas.append(f'{self.nombre}_sum{{{etiquetas}}} {suma:.6f}')
+            lineas.append(f'{self.nombre}_count{{{etiquetas}}} {n}')
+        return lineas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    return ','.join(f'{k}="{_escapar(v)}"' for k, v in pares)
+
+
+class _Tramo:
+    __slots__ = ('nombre', '_inicio')
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        segundos = time.perf_counter() - self._inicio
+        metricas.etapas.observar((self.nombre,), segundos)
+        tramos = _tramos_pedido.get()
+        if tramos is not None:
+            acumulado = tramos.get(self.nombre)
+            if acumulado is None:
+                tramos[self.nombre] = [segundos, 1]
+            else:
+                acumulado[0] += segundos
+                acumulado[1] += 1
+
+
+def tramo(nombre):
+    """Mide el bloque `with` como la etapa `nombre` (ver el docstring del módulo)."""
+    return _Tramo(nombre)
+
+
+def medido(nombre):
+    """Decorador: mide cada llamada a la función como la etapa `nombre`."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with _Tramo(nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def estadisticas_lru(funcion):
+    """Adapta `cache_info()` de una función con functools.lru_cache al formato de `registrar_cache`."""
+    def estadisticas():
+        info = funcion.cache_info()
+        return {'aciertos': info.hits, 'fallos': info.misses, 'tamanho': info.currsize}
+    return estadisticas
+
+
+class ProveedorJSONMedido(DefaultJSONProvider):
+    """Proveedor JSON de Flask que mide la serialización de las respuestas como la etapa 'serializacion'."""
+
+    def dumps(self, obj, **kwargs):
+        with tramo('serializacion'):
+            return super().dumps(obj, **kwargs)
+
+
+class Metricas:
+    """Registro de métricas del proceso y hooks de Flask que las alimentan."""
+
+    def __init__(self):
+        self.pedidos = Histograma('precipita_pedido_segundos', 'Duración de los pedidos HTTP por ruta.',
+                                  ('ruta', 'metodo'))
+        self.etapas = Histograma('precipita_etapa_segundos', 'Duración de las etapas internas instrumentadas.',
+                                 ('etapa',))
+        self._estados = {}
+        self._caches = {}
+        self._importacion = {'filas': 0, 'segundos': 0.0, 'ultima_filas_por_segundo': 0.0}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.json = ProveedorJSONMedido(app)
+        app.before_request(self._antes_del_pedido)
+        app.after_request(self._despues_del_pedido)
+        app.teardown_request(self._fin_del_pedido)
+        app.extensions['metricas'] = self
+
+    def registrar_cache(self, nombre, estadisticas):
+        """Expone una caché: `estadisticas()` devuelve un dict con `aciertos`, `fallos` y `tamanho`."""
+        self._caches[nombre] = estadisticas
+
+    def registrar_importacion(self, filas, segundos):
+        with self._lock:
+            self._importacion['filas'] += filas
+            self._importacion['segundos'] += segundos
+            self._importacion['ultima_filas_por_segundo'] = filas / segundos if segundos > 0 else 0.0
+
+    # --- Hooks de Flask ---
+
+    def _antes_del_pedido(self):
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_contexto = _tramos_pedido.set({})
+        if _perfil_pedido():
+            g.perfil = cProfile.Profile()
+            g.perfil.enable()
+
+    def _despues_del_pedido(self, respuesta):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return respuesta
+        perfil = g.pop('perfil', None)
+        if perfil is not None:
+            perfil.disable()
+            respuesta.headers['X-Perfil'] = _guardar_perfil(perfil)
+
+        total = time.perf_counter() - inicio
+        ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        self.pedidos.observar((ruta, request.method), total)
+        with self._lock:
+            clave = (ruta, request.method, str(respuesta.status_code))
+            self._estados[clave] = self._estados.get(clave, 0) + 1
+
+        tramos = _tramos_pedido.get() or {}
+        # Una entrada por etapa (sumando sus repeticiones; desc indica cuántas hubo) y el total del pedido
+        respuesta.headers['Server-Timing'] = ', '.join(
+            [f'{nombre};dur={segundos * 1000:.2f}' + (f';desc="x{veces}"' if veces > 1 else '')
+             for nombre, (segundos, veces) in tramos.items()]
+            + [f'total;dur={total * 1000:.2f}']
+        )
+        return respuesta
+
+    def _fin_del_pedido(self, _exc):
+        contexto = g.pop('metricas_contexto', None)
+        if contexto is not None:
+            _tramos_pedido.reset(contexto)
+        perfil = g.pop('perfil', None)
+        if perfil is not None:
+            perfil.disable()
+
+    # --- Exposición ---
+
+    def exponer(self):
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        lineas = self.pedidos.exponer() + self.etapas.exponer()
+
+        lineas += ['# HELP precipita_pedidos_total Pedidos HTTP atendidos por ruta, método y estado.',
+                   '# TYPE precipita_pedidos_total counter']
+        with self._lock:
+            estados = sorted(self._estados.items())
+            importacion = dict(self._importacion)
+        for clave, n in estados:
+            lineas.append(f'precipita_pedidos_total{{{_etiquetas(zip(("ruta", "metodo", "estado"), clave))}}} {n}')
+
+        caches = [(nombre, estadisticas()) for nombre, estadisticas in sorted(self._caches.items())]
+        for sufijo, clave, tipo, ayuda in (
+            ('aciertos_total', 'aciertos', 'counter', 'Aciertos de la caché.'),
+            ('fallos_total', 'fallos', 'counter', 'Fallos de la caché.'),
+            ('tamanho', 'tamanho', 'gauge', 'Entradas guardadas en la caché.'),
+        ):
+            lineas += [f'# HELP precipita_cache_{sufijo} {ayuda}', f'# TYPE precipita_cache_{sufijo} {tipo}']
+            lineas += [f'precipita_cache_{sufijo}{{cache="{nombre}"}} {datos[clave]}' for nombre, datos in caches]
+        lineas += ['# HELP precipita_cache_tasa_aciertos Aciertos / (aciertos + fallos) desde el arranque.',
+                   '# TYPE precipita_cache_tasa_aciertos gauge']
+        for nombre, datos in caches:
+            total = datos['aciertos'] + datos['fallos']
+            lineas.append(f'precipita_cache_tasa_aciertos{{cache="{nombre}"}} '
+                          f'{datos["aciertos"] / total if total else 0.0:.4f}')
+
+        lineas += [
+            '# HELP precipita_importacion_filas_total Filas procesadas por importar_csv.',
+            '# TYPE precipita_importacion_filas_total counter',
+            f'precipita_importacion_filas_total {importacion["filas"]}',
+            '# HELP precipita_importacion_segundos_total Tiempo total de importar_csv.',
+            '# TYPE precipita_importacion_segundos_total counter',
+            f'precipita_importacion_segundos_total {importacion["segundos"]:.6f}',
+            '# HELP precipita_importacion_filas_por_segundo Velocidad de la última importación.',
+            '# TYPE precipita_importacion_filas_por_segundo gauge',
+            f'precipita_importacion_filas_por_segundo {importacion["ultima_filas_por_segundo"]:.1f}',
+        ]
+        return '\n'.join(lineas) + '\n'
+
+
+def _perfil_pedido():
+    if not current_app.config.get('PERFILADO'):
+        return False
+    return request.headers.get('X-Perfil') == '1' or request.args.get('perfil') == '1'
+
+
+def _guardar_perfil(perfil):
+    """Vuelca el perfil en instance/perfiles/ (legible con pstats o snakeviz) y devuelve el nombre del archivo."""
+    directorio = os.path.join(current_app.instance_path, 'perfiles')
+    os.makedirs(directorio, exist_ok=True)
+    nombre = f"{int(time.time() * 1000)}-{os.getpid()}-{request.endpoint or 'sin_ruta'}.prof"
+    perfil.dump_stats(os.path.join(directorio, nombre))
+    return nombre
+
+
+metricas = Metricas()
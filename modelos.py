@@ -0,0 +1,143 @@
+"""Registro de modelos de pronóstico mensual seleccionables por pedido (parámetro `modelo`).
+
+Cada modelo se ajusta sobre la matriz (años × 12) de una estación con los años anteriores al de
+corte y predice los 12 promedios mensuales (mm) de un año. El modelo por defecto (`fft_robusto`,
+promedio robusto + FFT) es el de `data_processor`; los registrados aquí son alternativas más baratas
+cuyo ajuste es una sola pasada (o un solo sistema lineal) sobre la matriz y se guarda en caché.
+"""
+import numpy as np
+
+from puntuacion import CV_ALTO, clasificar, coeficiente_variacion
+
+MODELO_POR_DEFECTO = 'fft_robusto'
+
+# Nombre -> instancia de cada modelo registrado con @registrar_modelo
+MODELOS = {}
+
+
+class Modelo:
+    """Interfaz de un modelo: `ajustar` calcula los parámetros una vez y `predecir` los evalúa.
+
+    - `ajustar(valores, anhos)`: `valores` es la matriz (años × 12) en float64 con NaN en los datos
+      faltantes o negativos y `anhos` el año de cada fila. Devuelve los parámetros ajustados.
+    - `predecir(parametros, anho)`: 12 promedios (mm) para el año `anho`, NaN en los meses sin estimación.
+    """
+
+    nombre = None
+    descripcion = ''
+
+    def ajustar(self, valores, anhos):
+        raise NotImplementedError
+
+    def predecir(self, parametros, anho):
+        raise NotImplementedError
+
+
+def registrar_modelo(clase):
+    """Decorador: instancia la clase y la registra en MODELOS con su `nombre`."""
+    MODELOS[clase.nombre] = clase()
+    return clase
+
+
+def nombres_modelos():
+    """Nombres aceptados en el parámetro `modelo`, empezando por el modelo por defecto."""
+    return (MODELO_POR_DEFECTO, *MODELOS)
+
+
+@registrar_modelo
+class ModeloEstacionalIngenuo(Modelo):
+    nombre = 'estacional_ingenuo'
+    descripcion = 'Repite el último valor observado de cada mes.'
+
+    def ajustar(self, valores, anhos):
+        validos = ~np.isnan(valores)
+        # Última fila válida de cada columna (argmax sobre la matriz invertida)
+        ultima = valores.shape[0] - 1 - np.argmax(validos[::-1], axis=0)
+        return np.where(validos.any(axis=0), valores[ultima, np.arange(12)], np.nan)
+
+    def predecir(self, parametros, anho):
+        return parametros
+
+
+@registrar_modelo
+class ModeloClimatologiaExponencial(Modelo):
+    nombre = 'climatologia_exponencial'
+    descripcion = 'Media mensual con pesos que decaen exponencialmente con la antigüedad del año.'
+
+    # Peso del último año; cada año anterior pesa (1 - SUAVIZADO) veces el siguiente
+    SUAVIZADO = 0.3
+
+    def ajustar(self, valores, anhos):
+        validos = ~np.isnan(valores)
+        pesos = ((1 - self.SUAVIZADO) ** (anhos.max() - anhos))[:, np.newaxis] * validos
+        sumas = np.where(validos, valores, 0.0) * pesos
+        totales = pesos.sum(axis=0)
+        return np.divide(sumas.sum(axis=0), totales, out=np.full(12, np.nan), where=totales > 0)
+
+    def predecir(self, parametros, anho):
+        return parametros
+
+
+@registrar_modelo
+class ModeloArmonico(Modelo):
+    nombre = 'armonico'
+    descripcion = 'Regresión armónica (3 armónicos anuales + tendencia lineal) ajustada por mínimos cuadrados.'
+
+    ARMONICOS = 3
+
+    def _diseno(self, anhos, meses, centro):
+        """Matriz de diseño: constante, tendencia (por década) y seno/coseno de cada armónico."""
+        angulos = 2 * np.pi * np.outer(meses, np.arange(1, self.ARMONICOS + 1)) / 12
+        return np.column_stack([np.ones(len(meses)), (anhos - centro) / 10, np.cos(angulos), np.sin(angulos)])
+
+    def ajustar(self, valores, anhos):
+        filas, meses = np.nonzero(~np.isnan(valores))
+        if filas.size == 0:
+            return None
+        anhos_obs = anhos[filas]
+        centro = float(anhos_obs.mean())
+        coeficientes = np.linalg.lstsq(self._diseno(anhos_obs, meses, centro), valores[filas, meses], rcond=None)[0]
+        return coeficientes, centro, int(anhos_obs.max())
+
+    def predecir(self, parametros, anho):
+        if parametros is None:
+            return np.full(12, np.nan)
+        coeficientes, centro, ultimo = parametros
+        # La tendencia no se extrapola más allá del año siguiente al último observado
+        anho = min(anho, ultimo + 1)
+        meses = np.arange(12)
+        return np.maximum(self._diseno(np.full(12, anho), meses, centro) @ coeficientes, 0.0)
+
+
+def ajustar_serie(modelo, serie_est):
+    """Ajusta el modelo `modelo` (nombre registrado) a una SerieEstacion ya restringida a los años de ajuste.
+
+    Devuelve `(parametros, muy_variable)`, donde `muy_variable` marca los meses con coeficiente de
+    variación alto (como en el modelo por defecto), o None si la serie no tiene valores válidos.
+    """
+    if serie_est is None:
+        return None
+    valores = serie_est.valores.astype(np.float64)
+    valores = np.where(valores >= 0, valores, np.nan)
+    n_validos = np.count_nonzero(~np.isnan(valores), axis=0)
+    if not n_validos.any():
+        return None
+    muy_variable = (n_validos > 1) & (coeficiente_variacion(valores.T, n_validos) > CV_ALTO)
+    return MODELOS[modelo].ajustar(valores, serie_est.anhos), muy_variable
+
+
+def predecir_ajuste(modelo, ajuste, anho, meses_num, frecuencia=None):
+    """Evalúa un ajuste de `ajustar_serie` para los meses (1-12) de un año.
+
+    `frecuencia` es, opcionalmente, la fracción de días de lluvia observada de cada mes pedido (ver
+    `puntuacion.clasificar`). Devuelve `(promedio, probabilidad, clase)` como `puntuacion.puntuar`,
+    con clase -1 en los meses sin estimación.
+    """
+    meses_idx = np.asarray(meses_num, dtype=int) - 1
+    if ajuste is None:
+        return np.full(meses_idx.size, np.nan), np.zeros(meses_idx.size), np.full(meses_idx.size, -1)
+    parametros, muy_variable = ajuste
+    promedio = np.asarray(MODELOS[modelo].predecir(parametros, anho), dtype=np.float64)[meses_idx]
+    con_datos = ~np.isnan(promedio)
+    probabilidad, clase = clasificar(np.where(con_datos, promedio, 0.0), muy_variable[meses_idx], frecuencia)
+    return promedio, np.where(con_datos, probabilidad, 0.0), np.where(con_datos, clase, -1)
@@ -1,7 +1,29 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 db = SQLAlchemy()
 
+
+def configurar_sqlite(engine, busy_timeout_ms=10000, wal=True):
+    """Aplica los PRAGMA de concurrencia a cada conexión nueva del motor (solo SQLite).
+
+    En modo WAL los lectores no se bloquean mientras otra conexión escribe (p. ej. una importación)
+    y `busy_timeout` hace que los escritores concurrentes esperen en lugar de fallar con "database is locked".
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _pragmas(conexion_dbapi, _registro):
+        cursor = conexion_dbapi.cursor()
+        if wal:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            # Con WAL, NORMAL solo sincroniza en los checkpoints: seguro ante caídas del proceso
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+
+
 class Precipitacion(db.Model):
     __tablename__ = 'precipitaciones'
     id = db.Column(db.Integer, primary_key=True)
@@ -9,6 +31,30 @@ class Precipitacion(db.Model):
     anho = db.Column(db.Integer, nullable=False)
     valor = db.Column(db.Float, nullable=True)
     ubicacion = db.Column(db.String(100), nullable=False)
+    # Columnas derivadas para filtrar en SQL: nombre normalizado (normalizar_nombre) y mes 1-12
+    ubicacion_norm = db.Column(db.String(100), nullable=True)
+    mes_num = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_precipitaciones_norm_mes_anho', 'ubicacion_norm', 'mes_num', 'anho'),
+        db.Index('ix_precipitaciones_norm_anho_mes', 'ubicacion_norm', 'anho', 'mes_num'),
+        # Clave de upsert de importar_csv (INSERT ... ON CONFLICT)
+        db.Index('ux_precipitaciones_mes_anho_norm', 'mes', 'anho', 'ubicacion_norm', unique=True),
+    )
+
+class PrecipitacionDiaria(db.Model):
+    """Precipitación diaria (opcional) de una estación, con la fecha como entero AAAAMMDD.
+
+    La clave primaria (ubicacion_norm, fecha) es la única estructura de la tabla (sin rowid): las filas
+    quedan ordenadas por estación y fecha, y un mes es el rango `fecha / 100 = AAAAMM`. Los totales
+    mensuales de los meses con datos diarios se derivan de aquí (ver `data_processor.importar_diarias`).
+    """
+    __tablename__ = 'precipitaciones_diarias'
+    ubicacion_norm = db.Column(db.String(100), primary_key=True)
+    fecha = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    valor = db.Column(db.Float, nullable=True)
+
+    __table_args__ = {'sqlite_with_rowid': False}
 
 class Estacion(db.Model):
     __tablename__ = 'estaciones'
@@ -17,3 +63,82 @@ class Estacion(db.Model):
     latitud = db.Column(db.Float, nullable=True)
     longitud = db.Column(db.Float, nullable=True)
     departamento = db.Column(db.String(100), nullable=False)
+
+class Climatologia(db.Model):
+    """Resumen mensual materializado por estación; importar_csv lo recalcula para las estaciones que modifica."""
+    __tablename__ = 'climatologia'
+    id = db.Column(db.Integer, primary_key=True)
+    ubicacion_norm = db.Column(db.String(100), nullable=False)
+    mes_num = db.Column(db.Integer, nullable=False)
+    n = db.Column(db.Integer, nullable=False, default=0)
+    suma = db.Column(db.Float, nullable=False, default=0.0)
+    suma_cuadrados = db.Column(db.Float, nullable=False, default=0.0)
+    p5 = db.Column(db.Float, nullable=True)
+    p95 = db.Column(db.Float, nullable=True)
+    p99 = db.Column(db.Float, nullable=True)
+    # Eventos extremos: valores por encima de UMBRAL_EXTREMO (data_processor)
+    n_extremos = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ux_climatologia_norm_mes', 'ubicacion_norm', 'mes_num', unique=True),
+    )
+
+    @property
+    def media(self):
+        return self.suma / self.n if self.n else None
+
+class PrediccionCache(db.Model):
+    """Predicciones precalculadas (modelo por defecto) por estación, mes y año."""
+    __tablename__ = 'predicciones_cache'
+    id = db.Column(db.Integer, primary_key=True)
+    ubicacion_norm = db.Column(db.String(100), nullable=False)
+    mes_num = db.Column(db.Integer, nullable=False)
+    anho = db.Column(db.Integer, nullable=False)
+    promedio = db.Column(db.Float, nullable=True)
+    probabilidad = db.Column(db.Float, nullable=False)
+    intensidad = db.Column(db.String(20), nullable=False)
+    emoji = db.Column(db.String(10), nullable=False)
+    creado = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ux_predicciones_cache_norm_mes_anho', 'ubicacion_norm', 'mes_num', 'anho', unique=True),
+    )
+
+class EstadoDatos(db.Model):
+    """Fila única con la versión de los datos, compartida por todos los procesos del servidor."""
+    __tablename__ = 'estado_datos'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # Versión del esquema con la que se ejecutó inicializar_datos por última vez (VERSION_ESQUEMA)
+    esquema = db.Column(db.Integer, nullable=False, default=0)
+    # Identificador de la última instantánea exportada desde (o importada en) esta BD (instantanea.py)
+    instantanea = db.Column(db.String(32), nullable=True)
+    # Secuencia de observaciones: se incrementa en cada `agregar_observaciones` (ver VersionEstacion)
+    secuencia = db.Column(db.Integer, nullable=False, default=0)
+
+class VersionEstacion(db.Model):
+    """Valor de la secuencia de observaciones (EstadoDatos.secuencia) con el que cambió por última vez
+    cada estación; los demás procesos invalidan solo las estaciones con una secuencia mayor a la suya."""
+    __tablename__ = 'versiones_estaciones'
+    ubicacion_norm = db.Column(db.String(100), primary_key=True)
+    secuencia = db.Column(db.Integer, nullable=False, index=True)
+
+class Trabajo(db.Model):
+    """Trabajo en segundo plano (importación, validación). Vive en su propia BD (bind 'trabajos') para
+    poder registrar el progreso mientras la importación mantiene abierta su transacción en la principal."""
+    __bind_key__ = 'trabajos'
+    __tablename__ = 'trabajos'
+    id = db.Column(db.String(32), primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False)
+    # pendiente, en_curso, completado o error
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')
+    progreso = db.Column(db.Text, nullable=True)  # JSON
+    resultado = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    # Marcas de tiempo en segundos desde epoch (time.time())
+    creado = db.Column(db.Float, nullable=False)
+    iniciado = db.Column(db.Float, nullable=True)
+    terminado = db.Column(db.Float, nullable=True)
+    # Proceso que lo ejecuta y último latido de ese proceso (ver trabajos.INTERVALO_LATIDO)
+    pid = db.Column(db.Integer, nullable=True)
+    latido = db.Column(db.Float, nullable=True)
@@ -0,0 +1,138 @@
+"""Normalización de meses y nombres de estación con tablas precalculadas.
+
+Todo lo que depende solo de las constantes (nombres de meses normalizados, prefijos, claves de
+COORDENADAS_MAP) se calcula una vez al importar el módulo; los nombres de estación se memorizan
+con un límite de tamaño porque se repiten en cada fila de un CSV y en cada pedido.
+"""
+import functools
+import re
+import unicodedata
+
+MESES_MAP = {
+    'Enero': 1, 'Febrero': 2, 'Marzo': 3, 'Abril': 4, 'Mayo': 5, 'Junio': 6,
+    'Julio': 7, 'Agosto': 8, 'Setiembre': 9, 'Octubre': 10, 'Noviembre': 11, 'Diciembre': 12
+}
+
+# Constante global con la lista de meses (usar un único punto de definición)
+MESES_LISTA = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Setiembre', 'Octubre', 'Noviembre', 'Diciembre']
+
+COORDENADAS_MAP = {
+    'Aeropuerto Internacional Guarani': (-25.4542, -54.8431, 'Alto Paraná'),
+    'Aeropuerto Internacional Silvio Pettirossi': (-25.2403, -57.5192, 'Central'),
+    'Caazapa': (-26.1833, -56.3667, 'Caazapá'),
+    'Capitan Meza': (-26.9167, -55.4, 'Itapúa'),
+    'Cnel. Oviedo': (-25.45, -56.45, 'Caaguazú'),
+    'Concepcion': (-23.4167, -57.4333, 'Concepción'),
+    'Encarnacio': (-27.3333, -55.8667, 'Itapúa'),
+    'General Bruguez': (-24.75, -58.8333, 'Presidente Hayes'),
+    'Mcal. Estigarribia': (-22.0167, -60.6167, 'Boquerón'),
+    'Paraguari': (-25.6167, -57.15, 'Paraguarí'),
+    'Pedro Juan Caballero': (-22.55, -55.7333, 'Amambay'),
+    'Pilar': (-26.8667, -58.3, 'Ñeembucú'),
+    'Pozo Colorado': (-23.4833, -58.8, 'Presidente Hayes'),
+    'Puerto Casado': (-22.2833, -57.9333, 'Alto Paraguay'),
+    'Quyquyho': (-25.9333, -56.9333, 'Paraguarí'),
+    'Salto del Guaira': (-24.0667, -54.3, 'Canindeyú'),
+    'San Estanislao': (-24.65, -56.4333, 'San Pedro'),
+    'San Juan Bautista': (-26.6667, -57.15, 'Misiones'),
+    'San Pedro': (-24.0833, -57.0833, 'San Pedro'),
+    'Villarrica': (-25.75, -56.4333, 'Guairá')
+}
+
+# Límite de nombres distintos memorizados por normalizar_nombre y buscar_coordenadas
+MAX_NOMBRES_MEMORIZADOS = 4096
+
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]')
+
+
+def _sin_acentos(texto):
+    """Quita diacríticos (descomposición NFD sin marcas combinantes) y pasa a minúsculas."""
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn').lower()
+
+
+@functools.lru_cache(maxsize=MAX_NOMBRES_MEMORIZADOS)
+def normalizar_nombre(nombre):
+    """Normaliza un nombre: quita acentos, mayúsculas y caracteres no visibles."""
+    if not nombre:
+        return ""
+    # Quitar acentos, convertir a minúsculas y quitar caracteres no alfanuméricos y espacios extra
+    return _NO_ALFANUMERICO.sub('', _sin_acentos(nombre))
+
+
+# Mes normalizado (sin acentos, minúsculas) -> nombre canónico
+_MES_POR_NOMBRE = {_sin_acentos(k): k for k in MESES_MAP}
+
+# Prefijos de hasta 3 letras -> primer mes (en el orden de MESES_MAP) que empieza así; incluye '' -> Enero
+_MES_POR_PREFIJO = {}
+for _norm, _canon in _MES_POR_NOMBRE.items():
+    for _n in range(4):
+        _MES_POR_PREFIJO.setdefault(_norm[:_n], _canon)
+
+
+def _grafias_mes(numero, canon):
+    norm = _sin_acentos(canon)
+    for base in (canon, norm, canon[:3], norm[:3]):
+        yield from (base, base.lower(), base.upper(), base.capitalize())
+    yield from (str(numero), f'{numero:02d}')
+
+
+def _resolver_mes(mes_s):
+    """Algoritmo general de canonicalizar_mes para textos ya recortados que no están en la tabla."""
+    if mes_s == '':
+        return None
+
+    # Si es numérico, mapear a mes
+    try:
+        n = int(mes_s)
+        if 1 <= n <= 12:
+            return MESES_LISTA[n-1]
+    except Exception:
+        pass
+
+    # Normalizar (sin acentos, minúsculas): coincidencia exacta y, si no, por prefijo (3 letras)
+    mes_norm = _sin_acentos(mes_s)
+    return _MES_POR_NOMBRE.get(mes_norm) or _MES_POR_PREFIJO.get(mes_norm[:3])
+
+
+# Grafías habituales (números, nombres y abreviaturas en distintas capitalizaciones, con y sin acentos)
+_MES_POR_GRAFIA = {
+    grafia: _resolver_mes(grafia)
+    for numero, canon in enumerate(MESES_LISTA, start=1)
+    for grafia in _grafias_mes(numero, canon)
+}
+
+
+def canonicalizar_mes(mes):
+    """Devuelve el nombre canónico del mes (como aparece en MESES_LISTA) o None si no puede resolverse.
+
+    Acepta entradas numéricas ('1','01'), nombres en cualquier capitalización, abreviaturas de 3 letras,
+    y elimina acentos/diacríticos. Las grafías habituales se resuelven con una sola búsqueda en tabla.
+    """
+    if mes is None:
+        return None
+    mes_s = str(mes).strip()
+    canon = _MES_POR_GRAFIA.get(mes_s)
+    if canon is not None:
+        return canon
+    return _resolver_mes(mes_s)
+
+
+# Índice de coordenadas: claves de COORDENADAS_MAP ya normalizadas, en el orden del mapa
+INDICE_COORDENADAS = tuple((normalizar_nombre(k), coords) for k, coords in COORDENADAS_MAP.items())
+
+
+@functools.lru_cache(maxsize=MAX_NOMBRES_MEMORIZADOS)
+def _coordenadas_de(norm_buscado):
+    for norm_key, coords in INDICE_COORDENADAS:
+        if norm_key in norm_buscado or norm_buscado in norm_key:
+            return coords
+    return None
+
+
+def buscar_coordenadas(nombre_buscado, depto_default='Desconocido'):
+    """Busca coordenadas en COORDENADAS_MAP usando coincidencia parcial de nombres normalizados."""
+    norm_buscado = normalizar_nombre(nombre_buscado)
+    if not norm_buscado:
+        return None, None, depto_default
+    coords = _coordenadas_de(norm_buscado)
+    return coords if coords is not None else (None, None, depto_default)
@@ -0,0 +1,115 @@
+"""Comandos de mantenimiento: python -m precipita <comando> [opciones]."""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from almacen import SerieEstacion, almacen
+from data_processor import (MESES_LISTA, dias_lluvia, exportar_instantanea, guardar_predicciones_cache,
+                            importar_diarias, nombres_estaciones, predecir_desde_serie, resumir_en_flujo)
+from models import db
+
+logger = logging.getLogger('precipita')
+
+
+def _precalcular_estacion(norm, ubicacion, anho_inicio, valores, presentes, anho, dias=None):
+    """Trabajo de un proceso: predice los 12 meses de `anho` para una estación a partir de su matriz
+    (y de sus días de lluvia, si tiene datos diarios)."""
+    inicio = time.perf_counter()
+    serie_est = SerieEstacion(anho_inicio, valores, presentes)
+    resultados = predecir_desde_serie(serie_est, anho, MESES_LISTA, ubicacion, dias)
+    return norm, resultados, time.perf_counter() - inicio
+
+
+def precalcular(anho, workers=None):
+    """Calcula la grilla estación × mes de `anho` en paralelo y la guarda en PrediccionCache.
+
+    Debe ejecutarse dentro de un app context. Cada proceso recibe solo la matriz de su estación.
+    Devuelve {ubicacion_norm: segundos} con el tiempo de cálculo de cada estación.
+    """
+    nombres = nombres_estaciones()
+    series = almacen.cargar_todas()
+    tiempos = {}
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = [
+            pool.submit(_precalcular_estacion, norm, nombres.get(norm, norm),
+                        serie.anho_inicio, serie.valores, serie.presentes, anho, dias_lluvia(norm))
+            for norm, serie in series.items() if serie is not None
+        ]
+        for futuro in futuros:
+            norm, resultados, segundos = futuro.result()
+            guardar_predicciones_cache(norm, anho, resultados)
+            tiempos[norm] = segundos
+            logger.info(f"Estación {nombres.get(norm, norm)}: {segundos * 1000:.1f} ms")
+    db.session.commit()
+    logger.info(f"Precalculadas {len(tiempos)} estaciones × 12 meses de {anho} en {time.perf_counter() - inicio:.2f} s")
+    return tiempos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m precipita')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    comandos.add_parser('bootstrap', help='Crea/migra el esquema, importa el CSV inicial y completa las estaciones')
+
+    p_pre = comandos.add_parser('precompute', help='Precalcula las predicciones de todas las estaciones para un año')
+    p_pre.add_argument('--anho', type=int, required=True, help='Año a predecir (los 12 meses)')
+    p_pre.add_argument('--workers', type=int, default=os.cpu_count(), help='Procesos de trabajo (por defecto, uno por CPU)')
+
+    p_snap = comandos.add_parser('snapshot', help='Exporta los datos a una instantánea binaria mapeable en memoria')
+    p_snap.add_argument('--salida', help='Archivo de salida (por defecto PRECIPITA_INSTANTANEA o instance/precipitaciones.snap)')
+
+    p_res = comandos.add_parser('resumen', help='Estadísticos por estación y mes leyendo en streaming la BD o un CSV')
+    p_res.add_argument('--csv', help='CSV a resumir sin importarlo (por defecto, los datos de la BD)')
+    p_res.add_argument('--ventana', type=int, default=12, help='Meses de la media y el desvío móviles')
+    p_res.add_argument('--salida', help='Archivo JSON de salida (por defecto, la salida estándar)')
+
+    p_dia = comandos.add_parser('diarias', help='Importa precipitaciones diarias por estación y fecha')
+    p_dia.add_argument('archivo', help='CSV con columnas Fecha, Precipitacion y, opcionalmente, Ubicacion')
+    p_dia.add_argument('--ubicacion', help='Estación de las filas sin columna Ubicacion')
+
+    args = parser.parse_args(argv)
+    # INFO solo para los mensajes del comando; el resto (p. ej. logs de winsorización) queda en WARNING
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logger.setLevel(logging.INFO)
+
+    from app import asegurar_inicializacion, create_app
+    app = create_app()
+    if args.comando == 'bootstrap':
+        inicio = time.perf_counter()
+        asegurar_inicializacion(app, forzar=True)
+        logger.info(f"Base de datos lista en {time.perf_counter() - inicio:.2f} s")
+        return
+    if app.config['PRECIPITA_BOOTSTRAP']:
+        asegurar_inicializacion(app)
+    with app.app_context():
+        if args.comando == 'precompute':
+            precalcular(args.anho, args.workers)
+        elif args.comando == 'snapshot':
+            ruta = args.salida or app.config['INSTANTANEA']
+            resumen = exportar_instantanea(ruta)
+            logger.info(f"Instantánea escrita en {ruta}: {resumen['estaciones']} estaciones, "
+                        f"{resumen['bytes'] / 2 ** 20:.1f} MB en {resumen['segundos']:.2f} s")
+        elif args.comando == 'resumen':
+            inicio = time.perf_counter()
+            resumen = resumir_en_flujo(args.csv, args.ventana)
+            texto = json.dumps(resumen, ensure_ascii=False, indent=2)
+            if args.salida:
+                with open(args.salida, 'w', encoding='utf-8') as f:
+                    f.write(texto)
+            else:
+                print(texto)
+            logger.info(f"Resumidas {resumen['filas']} filas de {len(resumen['estaciones'])} estaciones "
+                        f"en {time.perf_counter() - inicio:.2f} s")
+        elif args.comando == 'diarias':
+            reporte = importar_diarias(args.archivo, args.ubicacion)
+            logger.info(f"Importadas {reporte['escritas']} filas diarias ({reporte['rechazadas']} rechazadas) de "
+                        f"{reporte['estaciones']} estaciones; {reporte['meses']} meses, "
+                        f"{len(reporte['meses_incompletos'])} incompletos, en {reporte['segundos']:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Núcleo vectorizado de puntuación: promedio robusto, mezcla con la FFT, probabilidad e intensidad.
+
+Trabaja sobre una matriz (casos × años) con los valores del mes pedido de cada caso, de modo que
+muchas estaciones, meses y años de corte se evalúan con unas pocas operaciones de NumPy.
+"""
+import logging
+import warnings
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Límites (mm) de las clases de intensidad: < 20 Escasa, < 70 Moderada, < 150 Abundante, < 300 Muy Abundante
+UMBRALES_INTENSIDAD = np.array([20.0, 70.0, 150.0, 300.0])
+INTENSIDADES = ("Escasa", "Moderada", "Abundante", "Muy Abundante", "Torrencial")
+EMOJIS = ("☀️", "☁️", "🌦️", "🌧️", "⛈️")
+SIN_DATOS = (None, 0.0, "N/A", "❓")
+
+# Años anteriores al de la predicción que forman la ventana del promedio (se amplía si no hay datos)
+VENTANA_ANHOS = 5
+
+# Coeficiente de variación a partir del cual el mes se considera muy variable (probabilidad × 0.8)
+CV_ALTO = 0.8
+
+
+def _percentiles_filas(x, n_validos, percentiles):
+    """Percentiles por fila ignorando NaN, idénticos a `np.nanpercentile(..., axis=1)` (método 'linear').
+
+    nanpercentile con axis recorre las filas en Python; aquí se ordena la matriz una sola vez (los NaN
+    quedan al final) y se interpola entre las posiciones de cada fila según su cantidad de valores válidos.
+    Devuelve una matriz (percentiles × filas), NaN en las filas sin valores.
+    """
+    ordenados = np.sort(x, axis=1)
+    n = n_validos.astype(np.float64)
+    ultimo = np.maximum(n_validos - 1, 0)
+    filas = []
+    for q in np.true_divide(percentiles, 100.0):
+        virtual = (n - 1) * q
+        anterior = np.floor(virtual).astype(np.intp)
+        fuera = virtual >= n - 1
+        anterior = np.where(fuera, ultimo, np.maximum(anterior, 0))
+        siguiente = np.where(fuera, ultimo, anterior + 1)
+        t = virtual - anterior
+        a = np.take_along_axis(ordenados, anterior[:, np.newaxis], axis=1)[:, 0]
+        b = np.take_along_axis(ordenados, siguiente[:, np.newaxis], axis=1)[:, 0]
+        # Misma interpolación que numpy (_lerp): desde el extremo más cercano
+        diferencia = b - a
+        resultado = np.where(t >= 0.5, b - diferencia * (1 - t), a + diferencia * t)
+        filas.append(np.where(n_validos > 0, resultado, np.nan))
+    return np.array(filas)
+
+
+def puntuar(valores, presentes, anhos, anho_objetivo, con_fft=None, fft_media=None, fft_conteo=None, fft_cv=None,
+            etiquetas=None, frecuencia=None):
+    """Predice todos los casos de una vez.
+
+    - `valores`, `presentes`: matrices (casos × años) con el valor del mes pedido (NaN si nulo) y si la
+      fila existe en la BD; `anhos` es el año de cada columna y `anho_objetivo` el año a predecir de cada caso.
+    - `con_fft`, `fft_media`, `fft_conteo`, `fft_cv`: por caso, si hay componente FFT, su media reconstruida
+      para el mes, cuántos valores la forman y el coeficiente de variación de la serie.
+    - `etiquetas`: textos por caso para los logs de winsorización (opcional).
+    - `frecuencia`: por caso, fracción observada de días de lluvia del mes (`frecuencia_lluvia`; NaN
+      sin datos diarios), que reemplaza a la heurística de probabilidad (ver `clasificar`).
+
+    Devuelve `(promedio, probabilidad, clase)`; `clase` indexa INTENSIDADES/EMOJIS y vale -1 (con
+    promedio NaN) en los casos sin datos históricos.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    presentes = np.asarray(presentes, dtype=bool)
+    anhos = np.asarray(anhos)
+    objetivo = np.asarray(anho_objetivo)[:, np.newaxis]
+
+    # Filas de los últimos VENTANA_ANHOS años; si no hay ninguna, todo lo anterior al año pedido
+    previos = presentes & (anhos < objetivo)
+    ventana = previos & (anhos >= objetivo - VENTANA_ANHOS)
+    seleccion = np.where(ventana.any(axis=1)[:, np.newaxis], ventana, previos)
+    con_datos = seleccion.any(axis=1)
+
+    # Más peso (2) a los años a 5 o menos del último año con fila
+    max_anho = np.where(seleccion, anhos, anhos.min() - 1).max(axis=1)[:, np.newaxis]
+    validos = seleccion & ~np.isnan(valores) & (valores >= 0)
+    pesos = np.where(validos, np.where(max_anho - anhos <= 5, 2.0, 1.0), 0.0)
+    n_validos = validos.sum(axis=1)
+    hay_validos = n_validos > 0
+    x = np.where(validos, valores, np.nan)
+
+    with warnings.catch_warnings():
+        # Filas sin valores válidos: percentiles/medias NaN que luego se descartan
+        warnings.simplefilter('ignore', RuntimeWarning)
+        inferior, superior = _percentiles_filas(x, n_validos, [5, 95])
+
+        # Promedio ponderado robusto: winsorización 5-95 y sin negativos
+        acotados = np.maximum(np.clip(x, inferior[:, np.newaxis], superior[:, np.newaxis]), 0.0)
+        promedio_est = np.where(
+            hay_validos,
+            np.nansum(acotados * pesos, axis=1) / np.where(hay_validos, pesos.sum(axis=1), 1.0),
+            0.0
+        )
+
+        # Variabilidad del mes (valores sin winsorizar) para el ajuste de probabilidad
+        cv_mes = coeficiente_variacion(x, n_validos)
+
+    if etiquetas is not None and logger.isEnabledFor(logging.INFO):
+        fuera = (validos & ((x < inferior[:, np.newaxis]) | (x > superior[:, np.newaxis]))).any(axis=1)
+        for i in np.flatnonzero(fuera):
+            logger.info(f"Winsorizado valores_est para {etiquetas[i]} a rangos [{inferior[i]:.2f}, {superior[i]:.2f}]")
+
+    promedio = promedio_est
+    if con_fft is not None:
+        con_fft = np.asarray(con_fft, dtype=bool)
+        fft_media = np.asarray(fft_media, dtype=np.float64)
+        fft_conteo = np.asarray(fft_conteo)
+        # Peso del FFT según cuántos valores reconstruidos haya, a la mitad si la serie es muy variable
+        w_fft = np.where(fft_conteo >= 3, 0.6, np.where(fft_conteo >= 1, 0.3, 0.0))
+        w_fft = np.where(np.asarray(fft_cv, dtype=np.float64) > 1.0, w_fft * 0.5, w_fft)
+        with np.errstate(invalid='ignore'):
+            mezcla = fft_media * w_fft + promedio_est * (1.0 - w_fft)
+            # Asegurar resultado válido
+            mezcla = np.where(np.isnan(mezcla) | (mezcla < 0), promedio_est, mezcla)
+        promedio = np.where(con_fft, mezcla, promedio_est)
+
+    probabilidad, clase = clasificar(promedio, (n_validos > 1) & (cv_mes > CV_ALTO), frecuencia)
+
+    promedio = np.where(con_datos, promedio, np.nan)
+    clase = np.where(con_datos, clase, -1)
+    probabilidad = np.where(con_datos, probabilidad, 0.0)
+    return promedio, probabilidad, clase
+
+
+def coeficiente_variacion(x, n_validos):
+    """Coeficiente de variación por fila (desvío poblacional / media) de una matriz con NaN en los valores
+    no válidos; 0 en las filas con media no positiva."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        media_val = np.nansum(x, axis=1) / np.maximum(n_validos, 1)
+        desv = np.sqrt(np.nansum((x - media_val[:, np.newaxis]) ** 2, axis=1) / np.maximum(n_validos, 1))
+    return np.where(media_val > 0, desv / np.where(media_val > 0, media_val, 1.0), 0.0)
+
+
+def clasificar(promedio, muy_variable, frecuencia=None):
+    """Probabilidad (%) e índice de intensidad a partir de promedios mensuales (mm) ya estimados.
+
+    `muy_variable` marca los casos cuyo mes tiene un coeficiente de variación alto (> CV_ALTO),
+    a los que se les reduce la probabilidad. Donde `frecuencia` (fracción de días de lluvia observada,
+    opcional) no es NaN, la probabilidad es esa frecuencia y no la heurística. Devuelve
+    `(probabilidad, clase)`.
+    """
+    # Probabilidad de lluvia: heurística de días de lluvia según el volumen mensual (100 mm -> 8 días)
+    dias_estimados = promedio * 0.05 + 3
+    probabilidad = np.clip(dias_estimados / 30 * 100, 0.0, 100.0)
+    probabilidad = np.where(muy_variable, probabilidad * 0.8, probabilidad)
+
+    clase = np.digitize(promedio, UMBRALES_INTENSIDAD)
+    probabilidad = np.where(clase == len(UMBRALES_INTENSIDAD), np.minimum(100.0, probabilidad + 15), probabilidad)
+    if frecuencia is not None:
+        frecuencia = np.asarray(frecuencia, dtype=np.float64)
+        probabilidad = np.where(np.isnan(frecuencia), probabilidad, frecuencia * 100)
+    return probabilidad, clase
+
+
+def frecuencia_lluvia(lluviosos, dias, anhos, anho_objetivo):
+    """Fracción de días de lluvia de cada caso en los años anteriores al pedido, con la ventana de `puntuar`.
+
+    `lluviosos` y `dias` son matrices (casos × años) con los días de lluvia y los días con dato del mes
+    pedido (0 sin datos diarios); `anhos` es el año de cada columna. Se usan los VENTANA_ANHOS años
+    previos con datos diarios o, si no hay ninguno, todos los anteriores. NaN en los casos sin datos.
+    """
+    lluviosos = np.asarray(lluviosos)
+    dias = np.asarray(dias)
+    anhos = np.asarray(anhos)
+    objetivo = np.asarray(anho_objetivo)[:, np.newaxis]
+    previos = (dias > 0) & (anhos < objetivo)
+    ventana = previos & (anhos >= objetivo - VENTANA_ANHOS)
+    seleccion = np.where(ventana.any(axis=1)[:, np.newaxis], ventana, previos)
+    total = np.where(seleccion, dias, 0).sum(axis=1)
+    return np.divide(np.where(seleccion, lluviosos, 0).sum(axis=1), total,
+                     out=np.full(total.shape, np.nan), where=total > 0)
+
+
+def a_tuplas(promedio, probabilidad, clase):
+    """Convierte la salida de `puntuar` en tuplas `(promedio, probabilidad, intensidad, emoji)`."""
+    return [
+        SIN_DATOS if c < 0 else (float(p), float(prob), INTENSIDADES[c], EMOJIS[c])
+        for p, prob, c in zip(promedio.tolist(), probabilidad.tolist(), clase.tolist())
+    ]
@@ -264,6 +264,32 @@ document.addEventListener('DOMContentLoaded', () => {
         }, 4000);
     }
 
+    // Consulta GET /api/jobs/<id> cada `intervaloMs` hasta que el trabajo termine (completado o error);
+    // rechaza si la consulta falla (p. ej. 404 si el trabajo ya no existe)
+    function esperarTrabajo(url, onProgreso, intervaloMs = 1000) {
+        return new Promise((resolve, reject) => {
+            const consultar = () => {
+                fetch(url)
+                    .then(res => res.json().catch(() => ({})).then(trabajo => {
+                        if (!res.ok) {
+                            throw new Error(trabajo.error || `Error del servidor (${res.status})`);
+                        }
+                        return trabajo;
+                    }))
+                    .then(trabajo => {
+                        if (trabajo.estado === 'completado' || trabajo.estado === 'error') {
+                            resolve(trabajo);
+                            return;
+                        }
+                        if (onProgreso) onProgreso(trabajo);
+                        setTimeout(consultar, intervaloMs);
+                    })
+                    .catch(reject);
+            };
+            consultar();
+        });
+    }
+
     // Manejo de clic derecho para coordenadas de nueva estación
     map.on('contextmenu', (e) => {
         selectedLatLng = e.latlng;
@@ -318,7 +344,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const mes = mesEl ? mesEl.value : '';
             const anho = anhoEl ? anhoEl.value : '';
 
-        if (!ubicacion) {
+        // Sin estación elegida pero con un punto marcado (clic derecho): interpolar desde las estaciones cercanas
+        const enPunto = !ubicacion && selectedLatLng;
+        if (!ubicacion && !enPunto) {
             showNotification('Por favor seleccione una ubicación en el mapa.', 'is-warning');
             return;
         }
@@ -329,10 +357,12 @@ document.addEventListener('DOMContentLoaded', () => {
         resDiv.classList.add('is-hidden');
         resSkeleton.classList.remove('is-hidden');
 
-        fetch('/api/predecir', {
+        fetch(enPunto ? '/api/predecir/punto' : '/api/predecir', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ mes, anho, ubicacion })
+            body: JSON.stringify(enPunto
+                ? { mes, anho, lat: selectedLatLng.lat, lon: selectedLatLng.lng }
+                : { mes, anho, ubicacion })
         })
             .then(res => res.json())
             .then(data => {
@@ -350,7 +380,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 document.getElementById('res-emoji').innerText = data.emoji;
 
                 const contrasteDiv = document.getElementById('res-contraste');
-                if (data.real !== null) {
+                if (data.real !== undefined && data.real !== null) {
                     contrasteDiv.classList.remove('is-hidden');
                     document.getElementById('res-real').innerText = data.real;
                     document.getElementById('res-error').innerText = data.error;
@@ -364,6 +394,28 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Gráfico Histórico
     let historicoChart = null;
+
+    // Series largas en formato columnar binario (ver formatos.py): un uint32 con el largo de la
+    // cabecera JSON, la cabecera y cada columna como float32; NaN se convierte en null para Chart.js.
+    // Los errores (o cualquier respuesta en otro formato) se leen como JSON y llegan con `error`
+    const FORMATO_COLUMNAS = 'application/vnd.precipita.columnas';
+    const leerColumnas = res => {
+        const tipo = (res.headers.get('Content-Type') || '').split(';')[0].trim();
+        if (!res.ok || tipo !== FORMATO_COLUMNAS) {
+            return res.json()
+                .catch(() => ({}))
+                .then(data => (res.ok || data.error ? data : { error: `Error del servidor (${res.status})` }));
+        }
+        return res.arrayBuffer().then(buffer => {
+            const largo = new DataView(buffer).getUint32(0, true);
+            const datos = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, largo)));
+            datos.columnas.forEach((nombre, i) => {
+                const columna = new Float32Array(buffer, 4 + largo + i * datos.n * 4, datos.n);
+                datos[nombre] = Array.from(columna, v => Number.isNaN(v) ? null : v);
+            });
+            return datos;
+        });
+    };
     const modal = document.getElementById('modal-historico');
 
     // Diagrama de Dispersión (Validación)
@@ -511,13 +563,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
         fetch('/api/historico', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Accept': FORMATO_COLUMNAS },
             body: JSON.stringify({ mes, ubicacion, anho })
         })
-            .then(res => res.json())
+            .then(leerColumnas)
             .then(data => {
                 // Ocultar loader y mostrar canvas
                 document.getElementById('hist-loader').classList.add('is-hidden');
+                if (typeof data.error === 'string') {
+                    showNotification(data.error, 'is-danger');
+                    return;
+                }
                 document.getElementById('chart-historico').classList.remove('is-hidden');
 
                 const ctx = document.getElementById('chart-historico').getContext('2d');
@@ -526,9 +582,19 @@ document.addEventListener('DOMContentLoaded', () => {
                     historicoChart.destroy();
                 }
 
-                const labels = data.map(d => d.label);
-                const values = data.map(d => d.valor);
-                const normalizedValues = data.map(d => d.valor_normalizado);
+                // Los puntos recorren data.anhos × data.meses
+                const puntos = data.valor.map((_, i) => {
+                    const anhoPunto = data.anhos[Math.floor(i / 12)];
+                    const mesPunto = data.meses[i % 12];
+                    return {
+                        label: `${mesPunto.slice(0, 3)} ${String(anhoPunto).slice(2)}`,
+                        mes: mesPunto,
+                        es_prediccion: data.es_prediccion[i] === 1
+                    };
+                });
+                const labels = puntos.map(d => d.label);
+                const values = data.valor;
+                const normalizedValues = data.valor_normalizado;
 
                 // Función para calcular regresión lineal
                 const calculateRegression = (yValues) => {
@@ -548,13 +614,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 const regressionValues = calculateRegression(values);
 
                 // Estilos condicionales para datos reales vs proyectados
-                const pointBackgroundColors = data.map(d =>
+                const pointBackgroundColors = puntos.map(d =>
                     d.es_prediccion ? 'rgba(150, 150, 150, 0.5)' : (d.mes === mes ? 'rgba(255, 99, 132, 1)' : 'rgba(54, 162, 235, 1)')
                 );
-                const pointRadius = data.map(d =>
+                const pointRadius = puntos.map(d =>
                     d.es_prediccion ? 2 : (d.mes === mes ? 6 : 3)
                 );
-                const pointStyle = data.map(d => d.es_prediccion ? 'rectRot' : 'circle');
+                const pointStyle = puntos.map(d => d.es_prediccion ? 'rectRot' : 'circle');
 
                 historicoChart = new Chart(ctx, {
                     type: 'line',
@@ -575,13 +641,13 @@ document.addEventListener('DOMContentLoaded', () => {
                                 pointHoverRadius: 8,
                                 segment: {
                                     borderDash: ctx => {
-                                        const p0 = data[ctx.p0DataIndex];
-                                        const p1 = data[ctx.p1DataIndex];
+                                        const p0 = puntos[ctx.p0DataIndex];
+                                        const p1 = puntos[ctx.p1DataIndex];
                                         return (p0.es_prediccion || p1.es_prediccion) ? [5, 5] : undefined;
                                     },
                                     borderColor: ctx => {
-                                        const p0 = data[ctx.p0DataIndex];
-                                        const p1 = data[ctx.p1DataIndex];
+                                        const p0 = puntos[ctx.p0DataIndex];
+                                        const p1 = puntos[ctx.p1DataIndex];
                                         return (p0.es_prediccion || p1.es_prediccion) ? 'rgba(150, 150, 150, 0.8)' : undefined;
                                     }
                                 }
@@ -636,7 +702,7 @@ document.addEventListener('DOMContentLoaded', () => {
                                     label: (context) => {
                                         const val = context.parsed.y;
                                         const label = context.dataset.label;
-                                        const isPred = data[context.dataIndex].es_prediccion;
+                                        const isPred = puntos[context.dataIndex].es_prediccion;
                                         return ` ${label}: ${val.toFixed(1)} mm ${isPred ? '(Proyectado)' : ''}`;
                                     }
                                 }
@@ -775,13 +841,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
         fetch('/api/estacionariedad', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Accept': FORMATO_COLUMNAS },
             body: JSON.stringify({ ubicacion })
         })
-            .then(res => res.json())
+            .then(leerColumnas)
             .then(data => {
                 // Ocultar loader y mostrar canvas
                 document.getElementById('esta-loader').classList.add('is-hidden');
+                if (typeof data.error === 'string') {
+                    showNotification(data.error, 'is-danger');
+                    return;
+                }
                 document.getElementById('chart-estacionariedad').classList.remove('is-hidden');
 
                 const ctx = document.getElementById('chart-estacionariedad').getContext('2d');
@@ -789,10 +859,13 @@ document.addEventListener('DOMContentLoaded', () => {
                     estacionariedadChart.destroy();
                 }
 
-                const labels = data.map(d => d.label);
-                const original = data.map(d => d.original);
-                const mean = data.map(d => d.mean);
-                const std = data.map(d => d.std);
+                // indice: meses desde enero de data.anho_inicio
+                const labels = data.indice.map(i =>
+                    `${data.meses[i % 12].slice(0, 3)} ${String(data.anho_inicio + Math.floor(i / 12)).slice(2)}`
+                );
+                const original = data.original;
+                const mean = data.mean;
+                const std = data.std;
 
                 estacionariedadChart = new Chart(ctx, {
                     type: 'line',
@@ -941,13 +1014,31 @@ document.addEventListener('DOMContentLoaded', () => {
             .then(data => {
                 if (data.error) {
                     showNotification(data.error, 'is-danger');
-                } else {
-                    showNotification('Datos cargados correctamente.', 'is-success');
-                    setTimeout(() => location.reload(), 1500);
+                    return;
                 }
+                // La importación corre en segundo plano: consultar su progreso hasta que termine
+                showNotification('Archivo recibido, importando...', 'is-info');
+                let ultimoAviso = 0;
+                return esperarTrabajo(data.url, trabajo => {
+                    const p = trabajo.progreso || {};
+                    const ahora = Date.now();
+                    if (p.filas_leidas && ahora - ultimoAviso > 4000) {
+                        ultimoAviso = ahora;
+                        const eta = (typeof trabajo.eta_segundos === 'number') ? ` — faltan ~${Math.ceil(trabajo.eta_segundos)} s` : '';
+                        showNotification(`Importando: ${p.filas_leidas} filas leídas, ${p.filas_escritas || 0} escritas${eta}`, 'is-info');
+                    }
+                }).then(trabajo => {
+                    if (trabajo.estado === 'error') {
+                        showNotification(`Error al importar: ${trabajo.error}`, 'is-danger');
+                        return;
+                    }
+                    const r = trabajo.resultado || {};
+                    showNotification(`Datos cargados correctamente (${r.insertadas || 0} nuevas, ${r.actualizadas || 0} actualizadas).`, 'is-success');
+                    setTimeout(() => location.reload(), 1500);
+                });
             })
             .catch(err => {
-                showNotification('Error al subir el archivo.', 'is-danger');
+                showNotification(err && err.message ? `Error al subir el archivo: ${err.message}` : 'Error al subir el archivo.', 'is-danger');
             });
         });
     }
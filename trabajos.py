@@ -0,0 +1,203 @@
+"""Cola de trabajos en segundo plano: un pool de hilos por proceso con el estado en SQLite (tabla trabajos)."""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models import db, Trabajo
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializa dentro del proceso
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Cada proceso renueva cada INTERVALO_LATIDO segundos el latido de sus trabajos pendientes o en curso;
+# sin latido durante LATIDO_VENCIDO segundos, el proceso se da por terminado (timeout o reinicio del
+# worker de gunicorn) y el trabajo se informa como error
+INTERVALO_LATIDO = 10.0
+LATIDO_VENCIDO = 6 * INTERVALO_LATIDO
+
+
+class BloqueoArchivo:
+    """Bloqueo exclusivo entre procesos sobre un archivo (flock); sin fcntl no bloquea."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._archivo = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        self._archivo = open(self.ruta, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._archivo, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._archivo, fcntl.LOCK_UN)
+        self._archivo.close()
+
+
+def _motor():
+    return db.engines['trabajos']
+
+
+def _actualizar(id_trabajo, **campos):
+    """Escribe en la fila del trabajo con una conexión propia, sin tocar db.session ni su transacción."""
+    with _motor().begin() as conn:
+        conn.execute(db.update(Trabajo.__table__).where(Trabajo.__table__.c.id == id_trabajo).values(**campos))
+
+
+class Progreso:
+    """Callback de progreso: acumula los campos recibidos y los persiste como mucho cada `intervalo` segundos."""
+
+    def __init__(self, id_trabajo, intervalo=0.5):
+        self.id_trabajo = id_trabajo
+        self.intervalo = intervalo
+        self.datos = {}
+        self._ultimo = 0.0
+
+    def __call__(self, **campos):
+        self.datos.update(campos)
+        ahora = time.monotonic()
+        if ahora - self._ultimo >= self.intervalo:
+            self._ultimo = ahora
+            _actualizar(self.id_trabajo, progreso=json.dumps(self.datos))
+
+
+class ColaTrabajos:
+    """Ejecuta funciones largas fuera del pedido HTTP.
+
+    Cada trabajo se registra en la tabla `trabajos` (BD aparte, bind 'trabajos'), así que cualquier
+    proceso del servidor puede informar su estado aunque lo ejecute otro. Un hilo por proceso renueva
+    el latido de los trabajos que tiene pendientes o en curso (ver `obtener_trabajo`).
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._pool = None
+        self._latidos = None
+        self._activos = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('TRABAJOS_WORKERS', self.max_workers)
+        app.extensions['trabajos'] = self
+
+    def enviar(self, app, tipo, funcion, *args, **kwargs):
+        """Registra un trabajo y lo ejecuta en el pool como `funcion(*args, progreso=..., **kwargs)`.
+
+        La función corre dentro de un app context de `app` y su valor de retorno (serializable a JSON)
+        queda como resultado del trabajo. Devuelve el id del trabajo.
+        """
+        id_trabajo = uuid.uuid4().hex
+        ahora = time.time()
+        with _motor().begin() as conn:
+            conn.execute(db.insert(Trabajo.__table__).values(
+                id=id_trabajo, tipo=tipo, estado='pendiente', creado=ahora, pid=os.getpid(), latido=ahora
+            ))
+        with self._lock:
+            self._activos.add(id_trabajo)
+            if self._pool is None:
+                # Se crean al primer uso: con preload_app no debe haber hilos en el maestro antes del fork
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='trabajo')
+                self._latidos = threading.Thread(target=self._latir, args=(app,), name='trabajo-latido', daemon=True)
+                self._latidos.start()
+        self._pool.submit(self._ejecutar, app, id_trabajo, funcion, args, kwargs)
+        return id_trabajo
+
+    def _ejecutar(self, app, id_trabajo, funcion, args, kwargs):
+        with app.app_context():
+            _actualizar(id_trabajo, estado='en_curso', iniciado=time.time())
+            progreso = Progreso(id_trabajo)
+            try:
+                resultado = funcion(*args, progreso=progreso, **kwargs)
+            except Exception as exc:
+                db.session.rollback()
+                logger.exception(f"Trabajo {id_trabajo} ({funcion.__name__}) falló")
+                _actualizar(id_trabajo, estado='error', error=str(exc),
+                            progreso=json.dumps(progreso.datos), terminado=time.time())
+            else:
+                _actualizar(id_trabajo, estado='completado', resultado=json.dumps(resultado),
+                            progreso=json.dumps(progreso.datos), terminado=time.time())
+            finally:
+                with self._lock:
+                    self._activos.discard(id_trabajo)
+
+    def _latir(self, app):
+        """Hilo de fondo: renueva el latido de los trabajos pendientes o en curso de este proceso."""
+        tabla = Trabajo.__table__
+        while True:
+            time.sleep(INTERVALO_LATIDO)
+            with self._lock:
+                activos = list(self._activos)
+            if not activos:
+                continue
+            try:
+                with app.app_context(), _motor().begin() as conn:
+                    conn.execute(db.update(tabla).where(tabla.c.id.in_(activos)).values(latido=time.time()))
+            except Exception:
+                logger.exception("No se pudo renovar el latido de los trabajos")
+
+
+def obtener_trabajo(id_trabajo):
+    """Estado de un trabajo como dict, con el tiempo restante estimado a partir de la fracción completada, o None.
+
+    Un trabajo pendiente o en curso cuyo proceso dejó de renovar el latido (LATIDO_VENCIDO) quedó
+    abandonado: se marca como error en la tabla y se informa así.
+    """
+    tabla = Trabajo.__table__
+    with _motor().connect() as conn:
+        fila = conn.execute(db.select(tabla).where(tabla.c.id == id_trabajo)).mappings().first()
+    if fila is None:
+        return None
+    if (fila['estado'] in ('pendiente', 'en_curso') and fila['latido'] is not None
+            and time.time() - fila['latido'] > LATIDO_VENCIDO):
+        _marcar_abandonado(fila)
+        with _motor().connect() as conn:
+            fila = conn.execute(db.select(tabla).where(tabla.c.id == id_trabajo)).mappings().first()
+
+    progreso = json.loads(fila['progreso']) if fila['progreso'] else {}
+    fraccion = progreso.get('fraccion')
+    ahora = time.time()
+    eta = None
+    if fila['estado'] == 'en_curso' and fila['iniciado'] and fraccion:
+        eta = round((ahora - fila['iniciado']) * (1 - fraccion) / fraccion, 1)
+    elif fila['estado'] in ('completado', 'error'):
+        eta = 0.0
+
+    fin = fila['terminado'] or ahora
+    return {
+        'id': fila['id'],
+        'tipo': fila['tipo'],
+        'estado': fila['estado'],
+        'progreso': progreso,
+        'eta_segundos': eta,
+        'segundos': round(fin - fila['iniciado'], 3) if fila['iniciado'] else None,
+        'resultado': json.loads(fila['resultado']) if fila['resultado'] else None,
+        'error': fila['error'],
+        'creado': fila['creado'],
+        'iniciado': fila['iniciado'],
+        'terminado': fila['terminado'],
+    }
+
+
+def _marcar_abandonado(fila):
+    """Pasa a error un trabajo abandonado, salvo que entre medio haya cambiado de estado o latido."""
+    tabla = Trabajo.__table__
+    with _motor().begin() as conn:
+        conn.execute(db.update(tabla).where(
+            tabla.c.id == fila['id'], tabla.c.estado == fila['estado'], tabla.c.latido == fila['latido']
+        ).values(
+            estado='error', terminado=time.time(),
+            error=f"El proceso {fila['pid']} que ejecutaba el trabajo terminó sin completarlo"
+        ))
+    logger.warning(f"Trabajo {fila['id']} abandonado por el proceso {fila['pid']}: marcado como error")
+
+
+cola_trabajos = ColaTrabajos()
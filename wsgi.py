@@ -0,0 +1,10 @@
+"""Punto de entrada WSGI para servidores multi-proceso: gunicorn -c gunicorn.conf.py wsgi:app
+
+Crear la aplicación no abre la BD, así que gunicorn puede cargarla en el proceso maestro
+(`preload_app`) y los workers heredan los módulos ya importados. La BD se inicializa una sola vez
+con `python -m precipita bootstrap` o, si PRECIPITA_BOOTSTRAP está activo, con el primer pedido.
+"""
+from app import create_app
+
+app = create_app()
+application = app